@@ -1,6 +1,6 @@
 import string
 
-from langtools.lexer.nfa import Atom, Concat, KleeneStar, Union
+from langtools.lexer.nfa import Atom, CharClass, CharRange, Concat, KleeneStar, Union
 
 from langtools.lexer.dfa import DFA
 
@@ -24,3 +24,11 @@ UPPERCASE_ALPHABET = [Atom(letter) for letter in string.ascii_uppercase]
 ASCII = dict()
 for i in range(128):
     ASCII[chr(i)] = Atom(chr(i))
+
+# interval based equivalents, these compile to a single edge each
+DIGIT = CharRange("0", "9")
+NON_ZERO_DIGIT = CharRange("1", "9")
+LETTER = CharRange("a", "z")
+UPPERCASE_LETTER = CharRange("A", "Z")
+ANY_ASCII = CharRange(chr(0), chr(127))
+ANY_CHAR = CharClass(negated=True)
@@ -1,7 +1,29 @@
+import io
+import mmap
+import os
+import random
+import tempfile
 import unittest
+from importlib.util import find_spec
 
 from langtools.lexer.nfa import *
+from langtools.lexer.codegen import generate_lexer
+from langtools.lexer.compiled import DEAD_STATE, FILE_HEADER
 from langtools.lexer.dfa import DFA
+from langtools.lexer.exceptions import (
+    CompiledDFAFormatError,
+    LexicalError,
+    StaleDFAError,
+    TokenResolutionError,
+    UnsupportedSpecError,
+)
+from langtools.lexer.incremental import IncrementalLexer
+from langtools.lexer.lazy_dfa import LazyDFA
+from langtools.lexer.lexer import iter_tokens, tokenize, tokenize_bytes, tokenize_str
+from langtools.lexer.parallel import tokenize_parallel
+from langtools.lexer.re_backend import RegexLexer, differential_check
+from langtools.lexer.token import Token
+from langtools.lexer.utils import BufferedLexerReader
 
 
 class AtomTests(unittest.TestCase):
@@ -139,6 +161,1240 @@ class RegexIntegrationTests(unittest.TestCase):
         self.assertFalse(self.ab_star.match("ba"))
         self.assertFalse(self.a_or_b_star.match("abc"))
 
+    def test__match__NullableConcat__StartStateAccepts(self):
+
+        a_star_b_star = DFA(Concat(KleeneStar(self.a), KleeneStar(self.b)))
+
+        self.assertTrue(a_star_b_star.match(""))
+        self.assertTrue(a_star_b_star.match("aabbb"))
+        self.assertFalse(a_star_b_star.match("aba"))
+
+    def test__match__DeeplyNestedConcat__NoRecursionError(self):
+
+        nested = self.a
+        for _ in range(2000):
+            nested = Concat(nested, self.b)
+
+        self.assertTrue(DFA(nested).match("a" + "b" * 2000))
+
+
+class ExpressionSharingTests(unittest.TestCase):
+    def test__expr__IdenticalSubexpressions__NodesShared(self):
+
+        first = Union(Atom("a"), KleeneStar(Atom("b")))
+        second = Union(Atom("a"), KleeneStar(Atom("b")))
+
+        self.assertIs(first.expr, second.expr)
+        self.assertIsNot(first.expr, Union(Atom("a"), KleeneStar(Atom("c"))).expr)
+
+    def test__match__SharedOperand__OccurrencesCompiledSeparately(self):
+
+        a = Atom("a")
+        a_then_a = DFA(Concat(a, a, KleeneStar(a)))
+
+        self.assertTrue(a_then_a.match("aa"))
+        self.assertTrue(a_then_a.match("aaaa"))
+        self.assertFalse(a_then_a.match("a"))
+
+    def test__add_token__AfterComposition__CompositeUnaffected(self):
+
+        a = Atom("a")
+        a_star = KleeneStar(a)
+        a.add_token(Token("A"))
+
+        self.assertEqual(
+            set().union(*[state.tokens for state in DFA(a_star).states]), set()
+        )
+        self.assertEqual(
+            [token.name for state in DFA(a).states for token in state.tokens],
+            ["A"],
+        )
+
+
+class CharClassTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+
+        cls.lowercase = DFA(CharRange("a", "z"))
+        cls.identifier = DFA(
+            Concat(
+                CharRange("a", "z"), KleeneStar(CharClass(("a", "z"), "_0123456789"))
+            )
+        )
+        cls.string = DFA(
+            Concat(Atom('"'), KleeneStar(CharClass('"', negated=True)), Atom('"'))
+        )
+
+    def test__match__HappyPath__SuccessfulMatch(self):
+
+        self.assertTrue(self.__class__.lowercase.match("a"))
+        self.assertTrue(self.__class__.lowercase.match("q"))
+        self.assertTrue(self.__class__.lowercase.match("z"))
+        self.assertTrue(self.__class__.identifier.match("snake_case_2"))
+        self.assertTrue(self.__class__.string.match('""'))
+        self.assertTrue(self.__class__.string.match('"h\u00e9llo, \u4e16\u754c"'))
+
+    def test__match__Mismatch__UnsuccesfulMatch(self):
+
+        self.assertFalse(self.__class__.lowercase.match("A"))
+        self.assertFalse(self.__class__.lowercase.match("{"))
+        self.assertFalse(self.__class__.lowercase.match("ab"))
+        self.assertFalse(self.__class__.identifier.match("2fast"))
+        self.assertFalse(self.__class__.string.match('"a"b"'))
+
+    def test__compile__WideRanges__FewStatesAndClasses(self):
+
+        self.assertEqual(len(self.__class__.string.states), 3)
+        self.assertEqual(self.__class__.string.compile().num_classes, 3)
+
+
+class MinimizationTests(unittest.TestCase):
+    def setUp(self):
+
+        self.a = Atom("a")
+        self.b = Atom("b")
+
+    def test__minimize__RedundantStates__StatesMerged(self):
+
+        unminimized = DFA(KleeneStar(Union(self.a, self.b)), minimize=False)
+        minimized = DFA(KleeneStar(Union(self.a, self.b)))
+
+        self.assertGreater(len(unminimized.states), 1)
+        self.assertEqual(len(minimized.states), 1)
+        self.assertTrue(minimized.match("abba"))
+        self.assertTrue(minimized.match(""))
+        self.assertFalse(minimized.match("abc"))
+
+    def test__minimize__DistinctTokens__StatesKeptApart(self):
+
+        self.a.add_token(Token("A"))
+        self.b.add_token(Token("B"))
+        minimized = DFA(Union(self.a, self.b, close=False))
+
+        accepting_token_names = [
+            {token.name for token in state.tokens}
+            for state in minimized.states
+            if state.accepting
+        ]
+        self.assertCountEqual(accepting_token_names, [{"A"}, {"B"}])
+
+
+class CompiledDFATests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+
+        digits = [Atom(str(i)) for i in range(10)]
+        cls.N = DFA(Concat(Union(*digits[1:]), KleeneStar(Union(*digits))))
+        cls.compiled = cls.N.compile()
+
+    def test__compile__EquivalentCharacters__ClassesShared(self):
+
+        compiled = self.__class__.compiled
+        self.assertEqual(compiled.num_classes, 3)
+        self.assertEqual(compiled.char_class("1"), compiled.char_class("9"))
+        self.assertNotEqual(compiled.char_class("0"), compiled.char_class("1"))
+        self.assertEqual(compiled.char_class("a"), 0)
+        self.assertEqual(compiled.char_class("\u00e9"), 0)
+
+    def test__match__HappyPath__SuccessfulMatch(self):
+
+        self.assertTrue(self.__class__.compiled.match("1"))
+        self.assertTrue(self.__class__.compiled.match("1024"))
+        self.assertTrue(self.__class__.N.match("9000000001"))
+
+    def test__match__Mismatch__UnsuccesfulMatch(self):
+
+        self.assertFalse(self.__class__.compiled.match(""))
+        self.assertFalse(self.__class__.compiled.match("0"))
+        self.assertFalse(self.__class__.compiled.match("10a"))
+
+
+class TokenResolutionTests(unittest.TestCase):
+    def setUp(self):
+
+        self.keyword_token = Token("IF", priority=1)
+        self.keyword = Concat(Atom("i"), Atom("f"))
+        self.keyword.add_token(self.keyword_token)
+        self.identifier = Concat(CharRange("a", "z"), KleeneStar(CharRange("a", "z")))
+        self.identifier.add_token(Token("ID", priority=2))
+
+    def test__tokenize__PriorityConflict__LowestPriorityWins(self):
+
+        dfa = DFA(Union(self.keyword, self.identifier, close=False))
+        tokens = tokenize_str("if iffy", dfa)
+
+        self.assertEqual([(t.name, t.lexme) for t in tokens], [("ID", "ififfy")])
+        self.assertEqual(
+            [(t.name, t.lexme) for t in tokenize_str("if", dfa)], [("IF", "if")]
+        )
+        self.assertIsNone(self.keyword_token.lexme)
+
+    def test__DFA__PriorityTie__TokenResolutionError(self):
+
+        tied = Concat(Atom("i"), Atom("f"))
+        tied.add_token(Token("OTHER_IF", priority=1))
+
+        with self.assertRaises(TokenResolutionError):
+            DFA(Union(self.keyword, tied, close=False))
+
+    def test__tokenize__LazyDFAPriorityTie__TokenResolutionError(self):
+
+        tied = Concat(Atom("i"), Atom("f"))
+        tied.add_token(Token("OTHER_IF", priority=1))
+        lazy = LazyDFA(Union(self.keyword, tied, close=False))
+
+        self.assertFalse(lazy.match("i"))
+        with self.assertRaises(TokenResolutionError):
+            tokenize_str("if", lazy)
+
+    def test__DFA__TiedTokensOnlyInsideExpression__OuterTokenUsed(self):
+
+        def build():
+            first = Atom("a")
+            first.add_token(Token("X"))
+            second = Atom("a")
+            second.add_token(Token("Y"))
+            word = Concat(Union(first, second), Atom("c"))
+            word.add_token(Token("W"))
+            return word
+
+        for dfa in [DFA(build()), LazyDFA(build())]:
+            self.assertTrue(dfa.match("ac"))
+            self.assertEqual(
+                [(t.name, t.lexme) for t in tokenize_str("ac", dfa)], [("W", "ac")]
+            )
+
+
+@unittest.skipIf(find_spec("numpy") is None, "match_many needs numpy")
+class MatchManyTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+
+        letter = Union(CharRange("a", "z"), Atom("_"), Atom("\u00e9"))
+        identifier = Concat(letter, KleeneStar(Union(letter, CharRange("0", "9"))))
+        identifier.add_token(Token("IDENTIFIER"))
+        number = Concat(CharRange("0", "9"), KleeneStar(CharRange("0", "9")))
+        number.add_token(Token("NUMBER"))
+        cls.spec = Union(identifier, number, close=False)
+        cls.dfa = DFA(cls.spec)
+
+        generator = random.Random(18)
+        cls.strings = [
+            "".join(generator.choice("ab_09 \u00e9\u4e00") for _ in range(length))
+            for length in [generator.randrange(12) for _ in range(500)]
+        ]
+
+    def test__match_many__RandomStrings__AgreesWithMatch(self):
+
+        matched = self.__class__.dfa.match_many(self.__class__.strings)
+
+        self.assertEqual(
+            matched.tolist(),
+            [self.__class__.dfa.match(string) for string in self.__class__.strings],
+        )
+
+    def test__match_many__Bytes__AgreesWithMatch(self):
+
+        dfa = DFA(self.__class__.spec, utf8=True)
+
+        matched = dfa.match_many(
+            string.encode("utf-8") for string in self.__class__.strings
+        )
+
+        self.assertEqual(
+            matched.tolist(),
+            [self.__class__.dfa.match(string) for string in self.__class__.strings],
+        )
+
+    def test__match_many__EmptyInputs__CorrectResult(self):
+
+        self.assertEqual(self.__class__.dfa.match_many([]).tolist(), [])
+        self.assertEqual(
+            self.__class__.dfa.match_many(["", "a1", ""]).tolist(), [False, True, False]
+        )
+
+
+class CodegenTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+
+        word = Concat(CharRange("a", "z"), KleeneStar(CharRange("a", "z")))
+        word.add_token(Token("WORD"))
+        string = Concat(Atom('"'), KleeneStar(CharClass('"', negated=True)), Atom('"'))
+        string.add_token(Token("STRING"))
+        comma = Atom(",")
+        comma.add_token(Token("COMMA"))
+        accented = Atom("\u00e9")
+        accented.add_token(Token("ACCENTED"))
+        cls.dfa = DFA(Union(word, string, comma, accented, close=False))
+
+        spaces = Concat(CharClass(" \n"), KleeneStar(CharClass(" \n")))
+        spaces.add_token(Token("SPACE", skip=True))
+        cls.skip_dfa = DFA(Union(word, string, comma, spaces, close=False))
+
+        generator = random.Random(19)
+        cls.texts = [
+            "".join(generator.choice('ab ,"\n\u00e9') for _ in range(30))
+            for _ in range(200)
+        ]
+
+    def load(self, dfa):
+        module = {}
+        exec(compile(generate_lexer(dfa), "<generated>", "exec"), module)
+        return module
+
+    def outcome(self, tokenize_text, text):
+        try:
+            return [
+                (token.name, token.lexme, token.start, token.end)
+                for token in tokenize_text(text)
+            ]
+        except Exception as error:
+            return str(error)
+
+    def test__generate_lexer__RandomTexts__SameAsTokenizeStr(self):
+
+        for dfa in [self.__class__.dfa, self.__class__.skip_dfa]:
+            tokenize_generated = self.load(dfa)["tokenize"]
+            for text in self.__class__.texts:
+                self.assertEqual(
+                    self.outcome(tokenize_generated, text),
+                    self.outcome(lambda text, dfa=dfa: tokenize_str(text, dfa), text),
+                )
+
+    def test__generate_lexer__WhiteSpaceDelimit__SameAsTokenize(self):
+
+        tokenize_generated = self.load(self.__class__.dfa)["tokenize"]
+
+        for text in self.__class__.texts:
+            self.assertEqual(
+                self.outcome(lambda text: tokenize_generated(text, True), text),
+                self.outcome(
+                    lambda text: tokenize(io.StringIO(text), self.__class__.dfa, True),
+                    text,
+                ),
+            )
+
+    def test__generate_lexer__UnexpectedCharacter__LexicalError(self):
+
+        module = self.load(self.__class__.dfa)
+
+        with self.assertRaises(module["LexicalError"]) as context:
+            module["tokenize"]("ab,\ncd 7")
+
+        self.assertEqual(context.exception.error_line, 1)
+        self.assertEqual(context.exception.error_col, 3)
+        self.assertEqual(context.exception.error_char, "7")
+
+    def test__generate_lexer__Source__OnlyStandardLibrary(self):
+
+        source = generate_lexer(self.__class__.dfa)
+
+        self.assertNotIn("langtools", source.replace("generated by langtools", ""))
+        self.assertEqual(
+            self.load(self.__class__.dfa)["FINGERPRINT"],
+            self.__class__.dfa.fingerprint,
+        )
+
+
+class RegexBackendTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+
+        word = Concat(CharRange("a", "z"), KleeneStar(CharRange("a", "z")))
+        word.add_token(Token("WORD", priority=2))
+        keyword = Concat(Atom("i"), Atom("f"))
+        keyword.add_token(Token("IF"))
+        digits = Concat(CharRange("0", "9"), KleeneStar(CharRange("0", "9")))
+        number = Concat(digits, Union(Concat(Atom("."), digits), Epsilon()))
+        number.add_token(Token("NUMBER"))
+        dot = Atom(".")
+        dot.add_token(Token("DOT"))
+        cls.spec = Union(word, keyword, number, dot, close=False)
+
+        generator = random.Random(20)
+        cls.texts = [
+            "".join(generator.choice("if 1.2\n") for _ in range(length))
+            for length in [generator.randrange(20) for _ in range(300)]
+        ]
+
+    def test__tokenize__KeywordsAndIdentifiers__SameAsDFA(self):
+
+        lexer = RegexLexer(self.__class__.spec)
+
+        self.assertFalse(lexer.combined)
+        self.assertEqual(differential_check(lexer, self.__class__.texts), [])
+        self.assertEqual(differential_check(lexer, self.__class__.texts, True), [])
+
+    def test__tokenize__DisjointTokens__CombinedPattern(self):
+
+        word = Concat(CharRange("a", "z"), KleeneStar(CharRange("a", "z")))
+        word.add_token(Token("WORD"))
+        string = Concat(Atom('"'), KleeneStar(CharClass('"', negated=True)), Atom('"'))
+        string.add_token(Token("STRING"))
+        comma = Atom(",")
+        comma.add_token(Token("COMMA"))
+        lexer = RegexLexer(Union(word, string, comma, close=False))
+        texts = [
+            text.translate(str.maketrans("i.12", '",ab'))
+            for text in self.__class__.texts
+        ]
+
+        self.assertTrue(lexer.combined)
+        self.assertEqual(differential_check(lexer, texts), [])
+        self.assertEqual(differential_check(lexer, texts, True), [])
+
+    def test__tokenize__SkipTokens__SameAsDFA(self):
+
+        word = Concat(CharRange("a", "z"), KleeneStar(CharRange("a", "z")))
+        word.add_token(Token("WORD"))
+        spaces = Concat(CharClass(" \n"), KleeneStar(CharClass(" \n")))
+        spaces.add_token(Token("SPACE", skip=True))
+        lexer = RegexLexer(Union(word, spaces, close=False))
+
+        self.assertEqual(differential_check(lexer, self.__class__.texts), [])
+        self.assertEqual(
+            [token.lexme for token in lexer.tokenize("if f \n ab")], ["if", "f", "ab"]
+        )
+
+    def test__tokenize__NoToken__SameLexicalError(self):
+
+        lexer = RegexLexer(self.__class__.spec)
+
+        with self.assertRaises(LexicalError) as context:
+            lexer.tokenize("if 1.2\n  f 3$")
+
+        self.assertEqual(context.exception.error_line, 1)
+        self.assertEqual(context.exception.error_col, 5)
+
+    def test__RegexLexer__FirstMatchNotLongest__UnsupportedSpecError(self):
+
+        number = Union(
+            Concat(CharRange("0", "9"), Atom(".")),
+            Concat(CharRange("0", "9"), Atom("."), Atom("5")),
+        )
+        number.add_token(Token("NUMBER"))
+
+        with self.assertRaises(UnsupportedSpecError) as context:
+            RegexLexer(number)
+
+        self.assertIn("'0.5'", str(context.exception))
+
+    def test__RegexLexer__EmptyMatch__UnsupportedSpecError(self):
+
+        letters = KleeneStar(CharRange("a", "z"))
+        letters.add_token(Token("LETTERS"))
+
+        with self.assertRaises(UnsupportedSpecError):
+            RegexLexer(letters)
+
+
+class SearchTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+
+        a_then_b = Concat(Atom("a"), KleeneStar(Atom("a")), Atom("b"))
+        a_then_b.add_token(Token("AB"))
+        bac = Concat(Atom("b"), Atom("a"), Atom("c"))
+        bac.add_token(Token("BAC"))
+        number = Concat(CharRange("0", "9"), KleeneStar(CharRange("0", "9")))
+        number.add_token(Token("NUMBER"))
+        accented = Concat(Atom("\u00e9"), Atom("x"))
+        accented.add_token(Token("ACCENTED"))
+        cls.spec = Union(a_then_b, bac, number, accented, close=False)
+        cls.dfa = DFA(cls.spec)
+
+    def naive_matches(self, text):
+        compiled = self.__class__.dfa.compile()
+        matches = []
+        position = 0
+        while position < len(text):
+            for start in range(position, len(text)):
+                state, longest = compiled.start_state, None
+                for end in range(start, len(text)):
+                    state = compiled.next_state(state, text[end])
+                    if state == DEAD_STATE:
+                        break
+                    if compiled.accepting[state]:
+                        longest = (start, end + 1, compiled.token_name(state))
+                if longest is not None:
+                    break
+            if longest is None:
+                break
+            matches.append(longest)
+            position = longest[1]
+        return matches
+
+    def test__finditer__RandomText__LeftmostLongestMatches(self):
+
+        generator = random.Random(17)
+        for _ in range(100):
+            text = "".join(generator.choice("aabc01 \u00e9x") for _ in range(30))
+
+            matches = self.__class__.dfa.finditer(text)
+
+            self.assertEqual(
+                [(match.start, match.end, match.name) for match in matches],
+                self.naive_matches(text),
+            )
+
+    def test__finditer__Bytes__ByteOffsets(self):
+
+        dfa = DFA(self.__class__.spec, utf8=True)
+
+        matches = dfa.finditer("\u00e9x bac".encode("utf-8"))
+
+        self.assertEqual(
+            [(match.start, match.end, match.name, match.lexme) for match in matches],
+            [(0, 3, "ACCENTED", "\u00e9x"), (4, 7, "BAC", "bac")],
+        )
+
+    def test__finditer__PathologicalInput__LinearScan(self):
+
+        a = Atom("a")
+        a.add_token(Token("A"))
+        a_star_b = Concat(KleeneStar(Atom("a")), Atom("b"))
+        a_star_b.add_token(Token("AB"))
+        dfa = DFA(Union(a, a_star_b, close=False))
+
+        # every match's scan would otherwise look ahead to the end of the input
+        matches = list(dfa.finditer("a" * 20000 + "c" + "aab"))
+
+        self.assertEqual(len(matches), 20001)
+        self.assertEqual({match.name for match in matches[:-1]}, {"A"})
+        self.assertEqual((matches[-1].start, matches[-1].name), (20001, "AB"))
+
+    def test__search__HappyPath__FirstMatchFromStart(self):
+
+        self.assertEqual(self.__class__.dfa.search("xaab 12", 2).lexme, "ab")
+        self.assertEqual(self.__class__.dfa.search("xaab 12", 4).lexme, "12")
+        self.assertIsNone(self.__class__.dfa.search("xaab 12", 0, 3))
+
+    def test__finditer__NullableSpec__OnlyNonEmptyMatches(self):
+
+        a_star = KleeneStar(Atom("a"))
+        a_star.add_token(Token("AS"))
+        dfa = DFA(a_star)
+
+        matches = dfa.finditer("baabxa")
+
+        self.assertEqual(
+            [(match.start, match.end, match.name) for match in matches],
+            [(1, 3, "AS"), (5, 6, "AS")],
+        )
+        self.assertEqual(dfa.search("bba", 0).start, 2)
+        self.assertIsNone(dfa.search("bbb"))
+        self.assertEqual(list(DFA(KleeneStar(Atom("a"))).finditer("")), [])
+
+    def test__finditer__LoadedDFA__SameMatches(self):
+
+        text = "1 aab\nbac 22"
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "search.dfa")
+            self.__class__.dfa.save(path)
+            loaded = DFA.load(path)
+
+            self.assertEqual(
+                [
+                    (match.start, match.end, match.line)
+                    for match in loaded.finditer(text)
+                ],
+                [(0, 1, 0), (2, 5, 0), (6, 9, 1), (10, 12, 1)],
+            )
+
+
+class SkipTokenTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+
+        word = Concat(CharRange("a", "z"), KleeneStar(CharRange("a", "z")))
+        word.add_token(Token("WORD"))
+        string = Concat(Atom('"'), KleeneStar(CharClass('"', negated=True)), Atom('"'))
+        string.add_token(Token("STRING"))
+        spaces = Concat(CharClass(" \n"), KleeneStar(CharClass(" \n")))
+        spaces.add_token(Token("SPACE", skip=True))
+        comment = Concat(Atom("#"), KleeneStar(CharClass("\n", negated=True)))
+        comment.add_token(Token("COMMENT", skip=True))
+        cls.spec = Union(word, string, spaces, comment, close=False)
+        cls.dfa = DFA(cls.spec)
+        cls.text = 'ab "c d" # e "f\nghi #\n"j"\n' * 30
+
+    def spans(self, tokens):
+        return [(token.name, token.start, token.end, token.lexme) for token in tokens]
+
+    def test__tokenize_str__SkipTokens__Dropped(self):
+
+        tokens = tokenize_str('ab "c d" # e "f\nghi', self.__class__.dfa)
+
+        self.assertEqual(
+            self.spans(tokens),
+            [
+                ("WORD", 0, 2, "ab"),
+                ("STRING", 3, 8, '"c d"'),
+                ("WORD", 16, 19, "ghi"),
+            ],
+        )
+
+    def test__tokenize_str__WhiteSpaceNotInSpec__LexicalError(self):
+
+        with self.assertRaises(LexicalError):
+            tokenize_str("ab\tcd", self.__class__.dfa)
+
+    def test__iter_tokens__SkipTokens__SameAsTokenizeStr(self):
+
+        expected = self.spans(tokenize_str(self.__class__.text, self.__class__.dfa))
+
+        for dfa in [self.__class__.dfa, LazyDFA(self.__class__.spec, cache_size=4)]:
+            tokens = iter_tokens(io.StringIO(self.__class__.text), dfa, chunk_size=5)
+            self.assertEqual(self.spans(tokens), expected)
+
+    def test__tokenize_parallel__SkipTokens__SameAsSequential(self):
+
+        actual = tokenize_parallel(
+            self.__class__.text, self.__class__.dfa, max_workers=2, chunk_size=17
+        )
+
+        self.assertEqual(
+            self.spans(actual),
+            self.spans(tokenize_str(self.__class__.text, self.__class__.dfa)),
+        )
+
+    def test__edit__IntoSkipToken__SameAsTokenizeStr(self):
+
+        lexer = IncrementalLexer("ab # cd\nef", self.__class__.dfa)
+
+        lexer.edit(4, 0, "\n")
+
+        self.assertEqual(
+            self.spans(lexer),
+            self.spans(tokenize_str("ab #\n cd\nef", self.__class__.dfa)),
+        )
+        self.assertEqual([token.name for token in lexer], ["WORD"] * 3)
+
+    def test__load__SkipTokens__StillSkipped(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "lexer.dfa")
+            self.__class__.dfa.save(path)
+            loaded = DFA.load(path)
+
+            self.assertEqual(
+                self.spans(tokenize_str(self.__class__.text, loaded)),
+                self.spans(tokenize_str(self.__class__.text, self.__class__.dfa)),
+            )
+
+
+class TokenMatchTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+
+        word = Concat(CharRange("a", "z"), KleeneStar(CharRange("a", "z")))
+        word.add_token(Token("WORD"))
+        comma = Atom(",")
+        comma.add_token(Token("COMMA"))
+        cls.dfa = DFA(Union(word, comma, close=False))
+        cls.text = "ab, cd\n  efg,\nh"
+
+    def test__tokenize_str__HappyPath__SpansIntoSource(self):
+
+        tokens = tokenize_str(self.__class__.text, self.__class__.dfa)
+
+        self.assertEqual(
+            [(t.name, t.start, t.end) for t in tokens],
+            [
+                ("WORD", 0, 2),
+                ("COMMA", 2, 3),
+                ("WORD", 4, 12),
+                ("COMMA", 12, 13),
+                ("WORD", 14, 15),
+            ],
+        )
+        self.assertEqual(tokens[2].lexme, "cdefg")
+        self.assertEqual(tokens[0].kind, tokens[2].kind)
+        self.assertNotEqual(tokens[0].kind, tokens[1].kind)
+
+    def test__tokenize_str__HappyPath__LineAndColumn(self):
+
+        tokens = tokenize_str(self.__class__.text, self.__class__.dfa)
+
+        self.assertEqual(
+            [(t.line, t.column) for t in tokens],
+            [(0, 0), (0, 2), (0, 4), (1, 5), (2, 0)],
+        )
+
+    def test__iter_tokens__TinyChunks__PositionsMatchString(self):
+
+        expected = tokenize_str(self.__class__.text, self.__class__.dfa)
+        actual = list(
+            iter_tokens(
+                io.StringIO(self.__class__.text), self.__class__.dfa, chunk_size=2
+            )
+        )
+
+        self.assertEqual(
+            [(t.name, t.lexme, t.start, t.end, t.line, t.column) for t in actual],
+            [(t.name, t.lexme, t.start, t.end, t.line, t.column) for t in expected],
+        )
+
+
+class ByteModeTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+
+        letter = CharClass(("a", "z"), ("\u00e0", "\u00ff"), ("\u4e00", "\u9fff"))
+        word = Concat(letter, KleeneStar(letter))
+        word.add_token(Token("WORD"))
+        other = CharClass(("a", "z"), " ", "\n", negated=True)
+        other.add_token(Token("OTHER", priority=5))
+        cls.spec = Union(word, other, close=False)
+        cls.text = "h\u00e9llo \u4e16\u754c, \U0001f600x\n na\u00efve"
+
+    def names_and_lexmes(self, tokens):
+        return [(token.name, token.lexme) for token in tokens]
+
+    def test__tokenize_bytes__MultiByteCharacters__AgreesWithText(self):
+
+        expected = self.names_and_lexmes(
+            tokenize(
+                io.StringIO(self.__class__.text),
+                DFA(self.__class__.spec),
+                white_space_delimit=True,
+            )
+        )
+        encoded = self.__class__.text.encode("utf-8")
+        for dfa in [
+            DFA(self.__class__.spec, utf8=True),
+            LazyDFA(self.__class__.spec, utf8=True),
+        ]:
+            for data in [encoded, memoryview(encoded)]:
+                actual = tokenize_bytes(data, dfa, white_space_delimit=True)
+                self.assertEqual(self.names_and_lexmes(actual), expected)
+
+    def test__tokenize_bytes__HappyPath__ByteOffsets(self):
+
+        tokens = tokenize_bytes(
+            self.__class__.text.encode("utf-8"),
+            DFA(self.__class__.spec, utf8=True),
+            white_space_delimit=True,
+        )
+
+        self.assertEqual((tokens[1].start, tokens[1].end), (7, 13))
+        self.assertEqual((tokens[4].line, tokens[4].column), (0, 19))
+        self.assertEqual((tokens[5].line, tokens[5].column), (1, 1))
+
+    def test__tokenize_bytes__MemoryMappedFile__SameTokens(self):
+
+        dfa = DFA(self.__class__.spec, utf8=True)
+        encoded = self.__class__.text.encode("utf-8")
+        with tempfile.TemporaryFile() as f:
+            f.write(encoded)
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                actual = self.names_and_lexmes(tokenize_bytes(mapped, dfa))
+
+        self.assertEqual(actual, self.names_and_lexmes(tokenize_bytes(encoded, dfa)))
+
+    def test__tokenize_bytes__InvalidUTF8__LexicalError(self):
+
+        with self.assertRaises(LexicalError) as context:
+            tokenize_bytes(
+                b"ab\n\xe4\xb8\x96 x\xff", DFA(self.__class__.spec, utf8=True)
+            )
+
+        self.assertEqual(context.exception.error_line, 1)
+        self.assertEqual(context.exception.error_col, 3)
+
+
+class ParallelTokenizeTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+
+        word = Concat(CharRange("a", "z"), KleeneStar(CharRange("a", "z")))
+        word.add_token(Token("WORD"))
+        # long tokens with spaces inside make speculative runs start out of sync
+        string = Concat(Atom('"'), KleeneStar(CharClass('"', negated=True)), Atom('"'))
+        string.add_token(Token("STRING"))
+        comma = Atom(",")
+        comma.add_token(Token("COMMA"))
+        cls.spec = Union(word, string, comma, close=False)
+        cls.dfa = DFA(cls.spec)
+        cls.text = 'ab, "c d, e" fgh,\n"ij, kl mn" o' * 40
+
+    def spans(self, tokens):
+        return [(token.name, token.start, token.end, token.lexme) for token in tokens]
+
+    def test__tokenize_parallel__SmallChunks__SameAsSequential(self):
+
+        expected = self.spans(tokenize_str(self.__class__.text, self.__class__.dfa))
+        for chunk_size, lookahead in [(7, None), (50, 3), (333, 1)]:
+            actual = tokenize_parallel(
+                self.__class__.text,
+                self.__class__.dfa,
+                max_workers=2,
+                chunk_size=chunk_size,
+                lookahead=lookahead,
+            )
+            self.assertEqual(self.spans(actual), expected)
+
+    def test__tokenize_parallel__Bytes__SameAsSequential(self):
+
+        dfa = DFA(self.__class__.spec, utf8=True)
+        encoded = self.__class__.text.replace("c d", "c \u00e9").encode("utf-8")
+
+        self.assertEqual(
+            self.spans(tokenize_parallel(encoded, dfa, max_workers=2, chunk_size=64)),
+            self.spans(tokenize_bytes(encoded, dfa)),
+        )
+
+    def test__tokenize_parallel__LoadedDFA__TablesSentToWorkers(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "lexer.dfa")
+            self.__class__.dfa.save(path)
+            loaded = DFA.load(path)
+
+            actual = tokenize_parallel(
+                self.__class__.text, loaded, max_workers=2, chunk_size=100
+            )
+
+        self.assertEqual(
+            self.spans(actual),
+            self.spans(tokenize_str(self.__class__.text, self.__class__.dfa)),
+        )
+
+    def test__tokenize_parallel__UnexpectedCharacter__LexicalError(self):
+
+        text = self.__class__.text + "\nab ?"
+
+        with self.assertRaises(LexicalError) as context:
+            tokenize_parallel(text, self.__class__.dfa, max_workers=2, chunk_size=64)
+
+        self.assertEqual(context.exception.error_line, 41)
+        self.assertEqual(context.exception.error_col, 3)
+
+
+class IncrementalLexerTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+
+        word = Concat(CharRange("a", "z"), KleeneStar(CharRange("a", "z")))
+        word.add_token(Token("WORD"))
+        string = Concat(Atom('"'), KleeneStar(CharClass('"', negated=True)), Atom('"'))
+        string.add_token(Token("STRING"))
+        comma = Atom(",")
+        comma.add_token(Token("COMMA"))
+        # ONES_TWO makes the dfa look arbitrarily far past a run of ONE tokens
+        ones_two = Concat(Atom("1"), KleeneStar(Atom("1")), Atom("2"))
+        ones_two.add_token(Token("ONES_TWO"))
+        one = Atom("1")
+        one.add_token(Token("ONE"))
+        two = Atom("2")
+        two.add_token(Token("TWO"))
+        cls.dfa = DFA(Union(word, string, comma, ones_two, one, two, close=False))
+
+    def spans(self, tokens):
+        return [(token.name, token.start, token.end, token.lexme) for token in tokens]
+
+    def test__edit__RandomEdits__SameAsTokenizeStr(self):
+
+        generator = random.Random(15)
+        # no quotes, deleting one would leave a string unterminated
+        text = "ab, cd\n1112 ef, 11"
+        lexer = IncrementalLexer(text, self.__class__.dfa)
+
+        for _ in range(500):
+            offset = generator.randrange(len(text) + 1)
+            deleted = generator.randrange(min(3, len(text) - offset) + 1)
+            inserted = "".join(generator.choice("ab ,\n12") for _ in range(3))
+            text = text[:offset] + inserted + text[offset + deleted :]
+
+            lexer.edit(offset, deleted, inserted)
+
+            self.assertEqual(
+                self.spans(lexer), self.spans(tokenize_str(text, self.__class__.dfa))
+            )
+
+    def test__edit__RandomEditsAcrossLines__SamePositionsAsTokenizeStr(self):
+
+        generator = random.Random(16)
+        text = "ab\ncd, ef\n\n12 gh"
+        lexer = IncrementalLexer(text, self.__class__.dfa)
+
+        for _ in range(300):
+            offset = generator.randrange(len(text) + 1)
+            deleted = generator.randrange(min(6, len(text) - offset) + 1)
+            inserted = "".join(generator.choice("ab,\n\n12;") for _ in range(4))
+            try:
+                lexer.edit(offset, deleted, inserted)
+            except LexicalError:
+                pass
+            else:
+                text = text[:offset] + inserted + text[offset + deleted :]
+
+            self.assertEqual(lexer.text, text)
+            self.assertEqual(
+                [(token.line, token.column, token.lexme) for token in lexer],
+                [
+                    (token.line, token.column, token.lexme)
+                    for token in tokenize_str(text, self.__class__.dfa)
+                ],
+            )
+
+    def test__edit__LongLookahead__EarlierTokensRelexed(self):
+
+        lexer = IncrementalLexer("11111", self.__class__.dfa)
+
+        index, removed, new_tokens = lexer.edit(5, 0, "2")
+
+        self.assertEqual((index, removed), (0, 5))
+        self.assertEqual(self.spans(new_tokens), [("ONES_TWO", 0, 6, "111112")])
+
+    def test__edit__LargeText__OnlyNearbyTokensRelexed(self):
+
+        text = 'abc, "x y", de,\n' * 2000
+        lexer = IncrementalLexer(text, self.__class__.dfa)
+        offset = text.index("de", len(text) // 2)
+
+        index, removed, new_tokens = lexer.edit(offset + 1, 0, "q")
+
+        self.assertEqual(removed, 1)
+        self.assertEqual(self.spans(new_tokens), [("WORD", offset, offset + 3, "dqe")])
+        self.assertEqual(lexer[index].line, 1000)
+        # one character longer, and the text ends in a newline
+        self.assertEqual(lexer[-1].end, len(text))
+
+    def test__edit__UnexpectedCharacter__EditNotApplied(self):
+
+        lexer = IncrementalLexer("ab, cd", self.__class__.dfa)
+
+        with self.assertRaises(LexicalError):
+            lexer.edit(2, 0, ";")
+
+        self.assertEqual(lexer.text, "ab, cd")
+        self.assertEqual(
+            self.spans(lexer), self.spans(tokenize_str("ab, cd", self.__class__.dfa))
+        )
+
+
+class LazyDFATests(unittest.TestCase):
+    def setUp(self):
+
+        digits = [Atom(str(i)) for i in range(10)]
+        self.number = Concat(Union(*digits[1:]), KleeneStar(Union(*digits)))
+        self.number.add_token(Token("NUM"))
+        self.word = Concat(CharRange("a", "z"), KleeneStar(CharRange("a", "z")))
+        self.word.add_token(Token("WORD"))
+        self.spec = Union(self.number, self.word, close=False)
+
+    def test__match__HappyPath__AgreesWithDFA(self):
+
+        eager = DFA(self.spec)
+        lazy = LazyDFA(self.spec)
+        for string in ["", "0", "10", "907", "abc", "ab1", "a", "01"]:
+            self.assertEqual(lazy.match(string), eager.match(string), string)
+
+    def test__match__NegatedAndNulClasses__AgreesWithDFA(self):
+
+        specs = [
+            CharClass("a", negated=True),
+            CharClass(chr(0), "b"),
+            Concat(CharClass("xy", negated=True), KleeneStar(CharClass(chr(0)))),
+        ]
+        for spec in specs:
+            eager = DFA(spec)
+            lazy = LazyDFA(spec)
+            for string in ["a", "b", "z", "x", chr(0), "b\x00", "c\x00\x00", "cz"]:
+                self.assertEqual(lazy.match(string), eager.match(string), string)
+
+    def test__match__RepeatedInput__CacheHits(self):
+
+        lazy = LazyDFA(self.spec)
+        lazy.match("abc")
+        misses = lazy.cache_misses
+        lazy.match("cba")
+
+        self.assertEqual(lazy.cache_misses, misses)
+        self.assertGreater(lazy.cache_hits, 0)
+
+    def test__tokenize__TinyCache__SameTokensAsDFA(self):
+
+        text = "12 abc 3 de 450 f"
+        expected = [(t.name, t.lexme) for t in tokenize_str(text, DFA(self.spec))]
+        lazy = LazyDFA(self.spec, cache_size=3)
+        actual = [(t.name, t.lexme) for t in tokenize_str(text, lazy)]
+
+        self.assertEqual(actual, expected)
+        self.assertGreater(lazy.cache_flushes, 0)
+
+    def test__tokenize__FullCacheWellUsed__KeepsCaching(self):
+
+        # words then numbers need more states than fit, but each cache is
+        # used for thousands of characters before it's flushed
+        text = "abc de f " * 2000 + "12 450 3 " * 2000
+        expected = [(t.name, t.lexme) for t in tokenize_str(text, DFA(self.spec))]
+        lazy = LazyDFA(self.spec, cache_size=7)
+        actual = [(t.name, t.lexme) for t in tokenize_str(text, lazy)]
+
+        self.assertEqual(actual, expected)
+        self.assertEqual(lazy.cache_flushes, 1)
+        self.assertFalse(lazy.simulating)
+
+    def test__tokenize__CacheThrashing__SimulatesThenCachesAgain(self):
+
+        lazy = LazyDFA(self.spec, cache_size=5)
+
+        tokens = tokenize(
+            io.StringIO("123456789 " * 100), lazy, white_space_delimit=True
+        )
+        self.assertEqual({t.lexme for t in tokens}, {"123456789"})
+        self.assertTrue(lazy.simulating)
+
+        text = "abc de f " * 200
+        expected = [(t.name, t.lexme) for t in tokenize_str(text, DFA(self.spec))]
+        self.assertEqual(
+            [(t.name, t.lexme) for t in tokenize_str(text, lazy)], expected
+        )
+        self.assertFalse(lazy.simulating)
+        flushes = lazy.cache_flushes
+        tokenize_str(text, lazy)
+        self.assertEqual(lazy.cache_flushes, flushes)
+
+
+class StreamingTokenizerTests(unittest.TestCase):
+    class PipeStream:
+        """Text stream that can only be read, like a pipe or socket"""
+
+        def __init__(self, text):
+            self.chunks = io.StringIO(text)
+
+        def read(self, size=-1):
+            return self.chunks.read(size)
+
+    def setUp(self):
+
+        a = Atom("a")
+        a.add_token(Token("A"))
+        abc = Concat(Atom("a"), Atom("b"), Atom("c"))
+        abc.add_token(Token("ABC"))
+        b = Atom("b")
+        b.add_token(Token("B"))
+        d = Atom("d")
+        d.add_token(Token("D"))
+        self.spec = Union(a, abc, b, d, close=False)
+        self.dfa = DFA(self.spec)
+
+    def names_and_lexmes(self, tokens):
+        return [(token.name, token.lexme) for token in tokens]
+
+    def test__iter_tokens__Backtracking__LexmeTrimmed(self):
+
+        self.assertEqual(
+            self.names_and_lexmes(tokenize_str("abd abc", self.dfa)),
+            [("A", "a"), ("B", "b"), ("D", "d"), ("ABC", "abc")],
+        )
+
+    def test__iter_tokens__TinyChunks__SameTokens(self):
+
+        text = "abc abd\nab  abcabc d\n" * 20
+        expected = self.names_and_lexmes(
+            tokenize(io.StringIO(text), self.dfa, white_space_delimit=True)
+        )
+        for chunk_size in [1, 2, 3, 7]:
+            actual = self.names_and_lexmes(
+                iter_tokens(
+                    io.StringIO(text),
+                    self.dfa,
+                    white_space_delimit=True,
+                    chunk_size=chunk_size,
+                )
+            )
+            self.assertEqual(actual, expected)
+
+    def test__iter_tokens__NonSeekableStream__TokensYielded(self):
+
+        tokens = iter_tokens(self.PipeStream("abc d"), self.dfa, chunk_size=2)
+
+        self.assertEqual(next(tokens).name, "ABC")
+        self.assertEqual(next(tokens).name, "D")
+        self.assertRaises(StopIteration, next, tokens)
+
+    def test__iter_tokens__UnexpectedCharacter__LexicalError(self):
+
+        with self.assertRaises(LexicalError) as context:
+            list(iter_tokens(io.StringIO("abc\nd dx"), self.dfa, chunk_size=2))
+
+        self.assertEqual(context.exception.error_line, 1)
+        self.assertEqual(context.exception.error_col, 3)
+        self.assertEqual(context.exception.error_char, "x")
+
+    def test__iter_tokens__ManyLines__PositionsWithBoundedLineIndex(self):
+
+        text = "abc d\n  ab\n\nb\n" * 500
+        expected = [
+            (token.name, token.line, token.column)
+            for token in tokenize_str(text, self.dfa)
+        ]
+
+        for chunk_size in [1, 5, 4096]:
+            tokens = iter_tokens(io.StringIO(text), self.dfa, chunk_size=chunk_size)
+            self.assertEqual(
+                [(token.name, token.line, token.column) for token in tokens], expected
+            )
+
+        with self.assertRaises(LexicalError) as context:
+            list(iter_tokens(io.StringIO(text + " dx"), self.dfa, chunk_size=3))
+        self.assertEqual(context.exception.error_line, 2000)
+        self.assertEqual(context.exception.error_col, 2)
+
+        reader = BufferedLexerReader(io.StringIO(text), chunk_size=8)
+        while reader.fill(reader.buffer_start + len(reader.buffer)):
+            self.assertLess(len(reader.line_starts), 8)
+        self.assertEqual(reader.first_line + len(reader.line_starts) - 1, 2000)
+
+    def test__iter_tokens__MemoizeFailures__SameTokens(self):
+
+        text = "abc abd\nab  abcabc d\naaaab\n" * 20
+        expected = self.names_and_lexmes(tokenize(io.StringIO(text), self.dfa))
+        for chunk_size in [1, 3, 4096]:
+            for dfa in [self.dfa, LazyDFA(self.spec, cache_size=3)]:
+                actual = self.names_and_lexmes(
+                    iter_tokens(
+                        io.StringIO(text),
+                        dfa,
+                        chunk_size=chunk_size,
+                        memoize_failures=True,
+                    )
+                )
+                self.assertEqual(actual, expected)
+
+    def test__iter_tokens__MemoizeFailuresLexicalError__SamePosition(self):
+
+        x = Atom("x")
+        x.add_token(Token("X"))
+        # the rest of "xa*b" and of "aa*b" share a state
+        ab = Union(
+            Concat(Atom("x"), KleeneStar(Atom("a")), Atom("b")),
+            Concat(Atom("a"), KleeneStar(Atom("a")), Atom("b")),
+        )
+        ab.add_token(Token("AB"))
+        spec = Union(x, ab, close=False)
+
+        for text in ["xaaaac", "xaa\naac", "b xaaa\n\naa c"]:
+            positions = []
+            for memoize_failures in [False, True]:
+                for dfa in [DFA(spec), LazyDFA(spec)]:
+                    with self.assertRaises(LexicalError) as context:
+                        list(
+                            iter_tokens(
+                                io.StringIO(text),
+                                dfa,
+                                memoize_failures=memoize_failures,
+                            )
+                        )
+                    positions.append(
+                        (context.exception.error_line, context.exception.error_col)
+                    )
+            self.assertEqual(len(set(positions)), 1, text)
+
+    def test__iter_tokens__MemoizeFailuresPathologicalInput__LinearScan(self):
+
+        a = Atom("a")
+        a.add_token(Token("A"))
+        a_star_b = Concat(KleeneStar(Atom("a")), Atom("b"))
+        a_star_b.add_token(Token("AB"))
+        dfa = DFA(Union(a, a_star_b, close=False))
+
+        # without memoization every token rescans the rest of the input
+        tokens = list(iter_tokens(io.StringIO("a" * 20000), dfa, memoize_failures=True))
+
+        self.assertEqual(len(tokens), 20000)
+        self.assertEqual({token.name for token in tokens}, {"A"})
+
+
+class SaveLoadTests(unittest.TestCase):
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "lexer.dfa")
+        self.word = Concat(CharRange("a", "z"), KleeneStar(CharRange("a", "z")))
+        self.word.add_token(Token("WORD"))
+        self.comma = Atom(",")
+        self.comma.add_token(Token("COMMA"))
+        self.spec = Union(self.word, self.comma, close=False)
+
+    def tearDown(self):
+
+        self.directory.cleanup()
+
+    def test__load__HappyPath__SameTokens(self):
+
+        dfa = DFA(self.spec)
+        dfa.save(self.path)
+        loaded = DFA.load(self.path, fingerprint=dfa.fingerprint)
+
+        self.assertEqual(
+            [(t.name, t.lexme) for t in tokenize_str("ab,c", loaded)],
+            [("WORD", "ab"), ("COMMA", ","), ("WORD", "c")],
+        )
+        self.assertEqual(len(loaded.states), len(dfa.states))
+        self.assertTrue(loaded.match("abc"))
+        self.assertFalse(loaded.match("a,"))
+
+    def test__load__DifferentSpec__StaleDFAError(self):
+
+        DFA(self.spec).save(self.path)
+        other_spec = Union(self.word, self.comma, Atom(";"), close=False)
+
+        with self.assertRaises(StaleDFAError):
+            DFA.load(self.path, fingerprint=other_spec.expr.fingerprint())
+
+    def test__cached__StaleFile__Rebuilt(self):
+
+        DFA(Atom("x")).save(self.path)
+        dfa = DFA.cached(self.spec, self.path)
+
+        self.assertTrue(dfa.match("abc"))
+        self.assertEqual(DFA.load(self.path).fingerprint, dfa.fingerprint)
+
+    def test__load__CorruptTables__CompiledDFAFormatError(self):
+
+        DFA(self.spec).save(self.path)
+        with open(self.path, "rb") as saved:
+            data = saved.read()
+        header = FILE_HEADER.unpack_from(data)
+        num_states, num_intervals = header[4], header[6]
+        boundaries = FILE_HEADER.size
+        interval_classes = boundaries + 4 * num_intervals
+        transitions = interval_classes + 4 * num_intervals
+        byteorder = "little" if header[2] else "big"
+        corruptions = [
+            (boundaries, 5),
+            (interval_classes + 4, 1000),
+            (transitions, num_states),
+            (transitions + 4, -7),
+        ]
+        for offset, value in corruptions:
+            with open(self.path, "wb") as corrupted:
+                corrupted.write(data[:offset])
+                corrupted.write(value.to_bytes(4, byteorder, signed=True))
+                corrupted.write(data[offset + 4 :])
+
+            with self.assertRaises(CompiledDFAFormatError):
+                DFA.load(self.path)
+
+    def test__load__MalformedTokenTable__CompiledDFAFormatError(self):
+
+        DFA(self.spec).save(self.path)
+        with open(self.path, "rb") as saved:
+            data = saved.read()
+        for key, broken in ((b'"states"', b'"stateX"'), (b'"tokens"', b'"tokenX"')):
+            with open(self.path, "wb") as corrupted:
+                corrupted.write(data.replace(key, broken))
+
+            with self.assertRaises(CompiledDFAFormatError):
+                DFA.load(self.path)
+            self.assertTrue(DFA.cached(self.spec, self.path).match("abc"))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,175 @@
+from string import Template
+from typing import Iterable, List
+
+from langtools.lexer.compiled import CompiledDFA
+from langtools.lexer.dfa import DFA
+
+# lines starting with a tag are only kept when the spec needs them, "?implicit"
+# for specs without skip tokens and "?skip" for specs with them
+MODULE_TEMPLATE = '''"""
+Lexer generated by langtools from a DFA, do not edit. FINGERPRINT identifies
+the token spec it was generated from
+"""
+from bisect import bisect_right
+from collections import namedtuple
+
+FINGERPRINT = $fingerprint
+
+Token = namedtuple("Token", ["name", "lexme", "start", "end"])
+
+TOKEN_KINDS = $token_kinds
+?skip SKIP_KINDS = $skip_kinds
+# interval i covers code points [BOUNDARIES[i], BOUNDARIES[i + 1])
+BOUNDARIES = $boundaries
+INTERVAL_CLASSES = $interval_classes
+TRANSITIONS = $transitions
+ACCEPTING = $accepting
+STATE_KINDS = $state_kinds
+# class of every latin-1 character, others are added by _char_class on first use
+LATIN1_CLASSES = $latin1_classes
+CHAR_CLASSES = {chr(code_point): cls for code_point, cls in enumerate(LATIN1_CLASSES)}
+
+
+class LexicalError(Exception):
+    def __init__(self, text, position, message=None):
+        line_start = text.rfind("\\n", 0, position) + 1
+        line_end = text.find("\\n", position)
+        if line_end == -1:
+            line_end = len(text)
+        self.error_line = text.count("\\n", 0, line_start)
+        self.error_col = position - line_start
+        self.error_char = text[position] if position < line_end else "EOF"
+        message = message or f'Unexpected Character: "{self.error_char}"'
+        super().__init__(
+            f"\\nLexicalError: Line {self.error_line}, Column {self.error_col}"
+            f"\\n{text[line_start:line_end]}\\n{' ' * self.error_col}^\\n{message}"
+        )
+
+
+def _char_class(char):
+    char_class = INTERVAL_CLASSES[bisect_right(BOUNDARIES, ord(char)) - 1]
+    CHAR_CLASSES[char] = char_class
+    return char_class
+
+
+def tokenize(text, white_space_delimit=False):
+    """
+?implicit     Maximal munch over text, returns a list of Token. White space between
+?implicit     tokens is skipped, and inside them too unless white_space_delimit is set
+?skip     Maximal munch over text, returns a list of Token. Skip tokens are
+?skip     dropped, white_space_delimit has no effect
+    """
+    transitions = TRANSITIONS
+    accepting = ACCEPTING
+    state_kinds = STATE_KINDS
+?skip     skip_kinds = SKIP_KINDS
+    char_classes = CHAR_CLASSES
+    tokens = []
+    append = tokens.append
+    text_length = len(text)
+    position = 0
+
+    while True:
+?implicit         while position < text_length and text[position].isspace():
+?implicit             position += 1
+        if position == text_length:
+            return tokens
+
+        token_start = position
+        state = $start_state
+        kind = -1
+        accepted = False
+        token_end = position
+?implicit         skipped_white_space = False
+
+        while position < text_length:
+            char = text[position]
+?implicit             if char.isspace():
+?implicit                 if white_space_delimit:
+?implicit                     break
+?implicit                 skipped_white_space = True
+?implicit                 position += 1
+?implicit                 continue
+            char_class = char_classes.get(char)
+            if char_class is None:
+                char_class = _char_class(char)
+            state = transitions[state * $num_classes + char_class]
+            if state == -1:
+                break
+            position += 1
+            if accepting[state]:
+                accepted = True
+                kind = state_kinds[state]
+                token_end = position
+
+        if not accepted:
+            raise LexicalError(text, position)
+        if kind == -1:
+            raise LexicalError(text, token_start, "TokenResolutionError")
+
+        position = token_end
+?skip         if skip_kinds[kind]:
+?skip             continue
+        lexme = text[token_start:token_end]
+?implicit         if skipped_white_space:
+?implicit             lexme = "".join(lexme.split())
+        append(Token(TOKEN_KINDS[kind], lexme, token_start, token_end))
+'''
+
+
+def _tuple_literal(values: Iterable, per_line: int = 16) -> str:
+    values = [repr(value) for value in values]
+    if len(values) <= per_line:
+        return f"({', '.join(values)}{',' if len(values) == 1 else ''})"
+    lines = [
+        "    " + ", ".join(values[i : i + per_line]) + ","
+        for i in range(0, len(values), per_line)
+    ]
+    return "(\n" + "\n".join(lines) + "\n)"
+
+
+def generate_lexer(tokenizing_dfa: DFA) -> str:
+    """
+    Source of a standalone module with the DFA's tables as literals and a
+    tokenize(text, white_space_delimit=False) function that gives the same
+    tokens as tokenize_str. The module only needs the standard library, so
+    importing it is all the startup a lexer needs
+    """
+    compiled = tokenizing_dfa.compile()
+    if not isinstance(compiled, CompiledDFA):
+        raise Exception("generate_lexer needs a DFA, not a LazyDFA")
+
+    kept_tag = "?skip " if compiled.has_skip_tokens else "?implicit "
+    lines: List[str] = []
+    for line in MODULE_TEMPLATE.splitlines():
+        if line.startswith(kept_tag):
+            lines.append(line[len(kept_tag) :])
+        elif not line.startswith("?"):
+            lines.append(line)
+
+    if compiled.num_classes < 256:
+        latin1_classes = repr(bytes(compiled.byte_classes))
+    else:
+        latin1_classes = _tuple_literal(compiled.byte_classes)
+
+    return Template("\n".join(lines) + "\n").substitute(
+        fingerprint=repr(tokenizing_dfa.fingerprint),
+        token_kinds=_tuple_literal(compiled.token_kinds, per_line=4),
+        skip_kinds=repr(bytes(compiled.skip_kinds)),
+        boundaries=_tuple_literal(compiled.boundaries),
+        interval_classes=_tuple_literal(compiled.interval_classes),
+        transitions=_tuple_literal(compiled.transitions, per_line=compiled.num_classes),
+        accepting=repr(bytes(compiled.accepting)),
+        state_kinds=_tuple_literal(compiled.state_kinds),
+        latin1_classes=latin1_classes,
+        start_state=compiled.start_state,
+        num_classes=compiled.num_classes,
+    )
+
+
+def write_lexer(tokenizing_dfa: DFA, path: str) -> None:
+    """
+    Writes generate_lexer's module to path, e.g. to vendor it into a service
+    """
+    with open(path, "w", encoding="utf-8") as out:
+        out.write(generate_lexer(tokenizing_dfa))
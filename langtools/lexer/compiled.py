@@ -0,0 +1,392 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, FrozenSet, List, Literal, Optional, Sequence, Tuple
+
+from langtools.lexer.exceptions import CompiledDFAFormatError
+from langtools.lexer.intervals import MAX_CODE_POINT, boundary_points
+from langtools.lexer.state import DFAState, select_token
+from langtools.lexer.token import Token
+
+DEAD_STATE = -1
+# state_kinds entry of a state without a token
+NO_KIND = -1
+
+FILE_MAGIC = b"LTDFA"
+FILE_VERSION = 1
+# magic, version, little endian, fingerprint, num_states, num_classes,
+# num_intervals, token table size. Every section after it is 4 byte aligned
+FILE_HEADER = struct.Struct("<5sB?x32sIIII")
+
+
+def _tables_valid(
+    num_states: int,
+    num_classes: int,
+    boundaries: Sequence[int],
+    interval_classes: Sequence[int],
+    transitions: Sequence[int],
+) -> bool:
+    """
+    Whether loaded tables are ones save could have written: intervals start at
+    code point 0 and increase, and every class and target state exists
+    """
+    if num_states == 0 or num_classes == 0 or not boundaries or boundaries[0] != 0:
+        return False
+    if any(low >= high for low, high in zip(boundaries, boundaries[1:])):
+        return False
+    if min(interval_classes) < 0 or max(interval_classes) >= num_classes:
+        return False
+    return min(transitions) >= DEAD_STATE and max(transitions) < num_states
+
+
+def _read_token_table(data: bytes, num_states: int) -> Optional[List[FrozenSet[Token]]]:
+    """
+    The tokens of every state from a saved token table, None if it isn't
+    one save could have written for num_states states
+    """
+    try:
+        token_table = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(token_table, dict):
+        return None
+    entries = token_table.get("tokens")
+    states = token_table.get("states")
+    if not isinstance(entries, list) or not isinstance(states, list):
+        return None
+    if len(states) != num_states:
+        return None
+
+    tokens: List[Token] = []
+    for entry in entries:
+        if (
+            not isinstance(entry, list)
+            or len(entry) not in (2, 3)
+            or not isinstance(entry[0], str)
+            or not isinstance(entry[1], (int, float))
+        ):
+            return None
+        tokens.append(Token(entry[0], priority=entry[1], skip=len(entry) == 3))
+
+    state_tokens: List[FrozenSet[Token]] = []
+    for token_ids in states:
+        if not isinstance(token_ids, list) or not all(
+            isinstance(i, int) and 0 <= i < len(tokens) for i in token_ids
+        ):
+            return None
+        state_tokens.append(frozenset(tokens[i] for i in token_ids))
+    return state_tokens
+
+
+class CompiledDFA:
+    """
+    Flat, integer indexed form of a DFA. States are numbered from 0 (the start
+    state), characters are collapsed into equivalence classes and transitions
+    live in one row major table of num_states * num_classes entries
+    """
+
+    def __init__(
+        self,
+        num_classes: int,
+        boundaries: Sequence[int],
+        interval_classes: Sequence[int],
+        transitions: Sequence[int],
+        accepting: Sequence[int],
+        tokens: List[FrozenSet[Token]],
+    ):
+        self.start_state = 0
+        self.num_states = len(accepting)
+        self.num_classes = num_classes
+        # interval i covers code points [boundaries[i], boundaries[i + 1])
+        self.boundaries = boundaries
+        self.interval_classes = interval_classes
+        self.transitions = transitions
+        self.accepting = accepting
+        self.tokens = tokens
+        # each accepting state's token, resolved up front so priority ties raise
+        # here. Non-accepting states can keep tokens of the expressions they were
+        # built from, those are never emitted. Token names are interned,
+        # state_kinds holds indices into token_kinds or NO_KIND
+        self.token_kinds: List[str] = []
+        # 1 for kinds of skip tokens, which the lexer drops
+        self.skip_kinds = bytearray()
+        self.state_kinds = array("i")
+        kind_ids: Dict[str, int] = dict()
+        for state_accepting, state_tokens in zip(accepting, tokens):
+            if not state_accepting:
+                self.state_kinds.append(NO_KIND)
+                continue
+            selected_token = select_token(state_tokens)
+            if selected_token is None:
+                self.state_kinds.append(NO_KIND)
+                continue
+            if selected_token.name not in kind_ids:
+                kind_ids[selected_token.name] = len(self.token_kinds)
+                self.token_kinds.append(selected_token.name)
+                self.skip_kinds.append(selected_token.skip)
+            self.state_kinds.append(kind_ids[selected_token.name])
+        # a spec with skip tokens says what white space is, the lexer doesn't skip any
+        self.has_skip_tokens = any(
+            token.skip for state_tokens in tokens for token in state_tokens
+        )
+
+        # class of every byte, for DFAs built with utf8
+        self.byte_classes: List[int] = [self._lookup_class(byte) for byte in range(256)]
+        self.char_classes: Dict[str, int] = {
+            chr(byte): char_class for byte, char_class in enumerate(self.byte_classes)
+        }
+
+    def __reduce__(self):
+        # loaded tables are views of a memory mapping, pickle copies of them
+        return (
+            self.__class__,
+            (
+                self.num_classes,
+                array("I", bytes(self.boundaries)),
+                array("i", bytes(self.interval_classes)),
+                array("i", bytes(self.transitions)),
+                bytes(self.accepting),
+                self.tokens,
+            ),
+        )
+
+    @classmethod
+    def from_states(cls, start_state: DFAState) -> "CompiledDFA":
+
+        # number states breadth first so the start state is 0
+        states: List[DFAState] = [start_state]
+        state_ids: Dict[DFAState, int] = {start_state: 0}
+        for state in states:
+            for _, _, target in state.edges():
+                if target not in state_ids:
+                    state_ids[target] = len(states)
+                    states.append(target)
+
+        # elementary intervals that lead to the same state everywhere share a class
+        points = boundary_points(edge for state in states for edge in state.edges())
+        signatures: List[List[int]] = [[DEAD_STATE] * len(states) for _ in points]
+        for state_id, state in enumerate(states):
+            for low, high, target in state.edges():
+                for point_index in range(
+                    bisect_left(points, low), bisect_right(points, high)
+                ):
+                    signatures[point_index][state_id] = state_ids[target]
+
+        # class 0 is reserved for characters that never lead anywhere
+        class_ids: Dict[Tuple[int, ...], int] = {tuple(DEAD_STATE for _ in states): 0}
+        boundaries = array("I")
+        interval_classes = array("i")
+        for point, signature in zip(points, signatures):
+            char_class = class_ids.setdefault(tuple(signature), len(class_ids))
+            if not interval_classes or interval_classes[-1] != char_class:
+                boundaries.append(point)
+                interval_classes.append(char_class)
+
+        num_classes = len(class_ids)
+        transitions = array("i", [DEAD_STATE]) * (len(states) * num_classes)
+        for targets, char_class in class_ids.items():
+            for state_id, target_id in enumerate(targets):
+                transitions[state_id * num_classes + char_class] = target_id
+
+        return cls(
+            num_classes=num_classes,
+            boundaries=boundaries,
+            interval_classes=interval_classes,
+            transitions=transitions,
+            accepting=bytes(state.accepting for state in states),
+            tokens=[frozenset(state.tokens) for state in states],
+        )
+
+    def to_states(self) -> Tuple[DFAState, List[DFAState]]:
+        """
+        Rebuilds the DFAState graph, returns (start_state, states)
+        """
+        states = [
+            DFAState(accepting=bool(self.accepting[state_id]))
+            for state_id in range(self.num_states)
+        ]
+        for state, tokens in zip(states, self.tokens):
+            state.tokens = set(tokens)
+
+        intervals = list(zip(self.boundaries, self.interval_classes))
+        for state_id, state in enumerate(states):
+            row = state_id * self.num_classes
+            edges: List[List] = []
+            for i, (low, char_class) in enumerate(intervals):
+                target_id = self.transitions[row + char_class]
+                if target_id == DEAD_STATE:
+                    continue
+                high = (
+                    intervals[i + 1][0] - 1
+                    if i + 1 < len(intervals)
+                    else MAX_CODE_POINT
+                )
+                if edges and edges[-1][1] == low - 1 and edges[-1][2] == target_id:
+                    edges[-1][1] = high
+                else:
+                    edges.append([low, high, target_id])
+
+            for low, high, target_id in edges:
+                if low == high:
+                    state.set_transition(chr(low), states[target_id])
+                else:
+                    state.add_range_transition(low, high, states[target_id])
+
+        return states[self.start_state], states
+
+    def save(self, path: str, fingerprint: str) -> None:
+        """
+        Writes the tables to path in a flat binary format that load can map
+        straight into memory. The file is replaced atomically
+        """
+        distinct_tokens: Dict[Token, int] = dict()
+        for tokens in self.tokens:
+            for token in tokens:
+                distinct_tokens.setdefault(token, len(distinct_tokens))
+        token_table = json.dumps(
+            {
+                "tokens": [
+                    (
+                        [token.name, token.priority, True]
+                        if token.skip
+                        else [token.name, token.priority]
+                    )
+                    for token in distinct_tokens
+                ],
+                "states": [
+                    sorted(distinct_tokens[token] for token in tokens)
+                    for tokens in self.tokens
+                ],
+            }
+        ).encode()
+
+        accepting = bytes(self.accepting)
+        sections = [
+            FILE_HEADER.pack(
+                FILE_MAGIC,
+                FILE_VERSION,
+                sys.byteorder == "little",
+                bytes.fromhex(fingerprint),
+                self.num_states,
+                self.num_classes,
+                len(self.boundaries),
+                len(token_table),
+            ),
+            array("I", self.boundaries).tobytes(),
+            array("i", self.interval_classes).tobytes(),
+            array("i", self.transitions).tobytes(),
+            accepting + bytes(-len(accepting) % 4),
+            token_table,
+        ]
+
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as out:
+            for section in sections:
+                out.write(section)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Tuple["CompiledDFA", str]:
+        """
+        Maps a file written by save into memory, returns (compiled_dfa, fingerprint).
+        The tables are read only views of the mapping, so processes loading the
+        same file share its pages
+        """
+        with open(path, "rb") as source:
+            mapping = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapping)
+
+        if len(view) < FILE_HEADER.size:
+            raise CompiledDFAFormatError(f"{path} is truncated")
+        (
+            magic,
+            version,
+            little_endian,
+            fingerprint,
+            num_states,
+            num_classes,
+            num_intervals,
+            token_table_size,
+        ) = FILE_HEADER.unpack_from(view)
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            raise CompiledDFAFormatError(f"{path} is not a version {FILE_VERSION} DFA")
+
+        offset = FILE_HEADER.size
+
+        def section(length: int, typecode: Literal["B", "I", "i"]) -> Sequence[int]:
+            nonlocal offset
+            if offset + length > len(view):
+                raise CompiledDFAFormatError(f"{path} is truncated")
+            data = view[offset : offset + length]
+            offset += length + (-length % 4)
+            if typecode == "B":
+                return data
+            if little_endian != (sys.byteorder == "little"):
+                swapped = array(typecode, data.tobytes())
+                swapped.byteswap()
+                return swapped
+            return data.cast(typecode)
+
+        boundaries = section(4 * num_intervals, "I")
+        interval_classes = section(4 * num_intervals, "i")
+        transitions = section(4 * num_states * num_classes, "i")
+        accepting = section(num_states, "B")
+        if not _tables_valid(
+            num_states, num_classes, boundaries, interval_classes, transitions
+        ):
+            raise CompiledDFAFormatError(f"{path} has corrupt transition tables")
+        state_tokens = _read_token_table(
+            bytes(section(token_table_size, "B")), num_states
+        )
+        if state_tokens is None:
+            raise CompiledDFAFormatError(f"{path} has a malformed token table")
+
+        compiled = cls(
+            num_classes=num_classes,
+            boundaries=boundaries,
+            interval_classes=interval_classes,
+            transitions=transitions,
+            accepting=accepting,
+            tokens=state_tokens,
+        )
+        return compiled, fingerprint.hex()
+
+    def compile(self) -> "CompiledDFA":
+        """
+        Lets a CompiledDFA be passed anywhere a DFA is, e.g. in a worker process
+        """
+        return self
+
+    def _lookup_class(self, code_point: int) -> int:
+        return self.interval_classes[bisect_right(self.boundaries, code_point) - 1]
+
+    def char_class(self, char: str) -> int:
+        char_class = self.char_classes.get(char)
+        if char_class is None:
+            char_class = self._lookup_class(ord(char))
+            self.char_classes[char] = char_class
+        return char_class
+
+    def next_state(self, state: int, char: str) -> int:
+        return self.transitions[state * self.num_classes + self.char_class(char)]
+
+    def token_name(self, state: int) -> Optional[str]:
+        kind = self.state_kinds[state]
+        return None if kind == NO_KIND else self.token_kinds[kind]
+
+    def match(self, string_to_match: str) -> bool:
+        transitions = self.transitions
+        num_classes = self.num_classes
+        char_class = self.char_class
+
+        curr_state = self.start_state
+        for curr_char in string_to_match:
+            curr_state = transitions[curr_state * num_classes + char_class(curr_char)]
+            if curr_state == DEAD_STATE:
+                return False
+
+        return bool(self.accepting[curr_state])
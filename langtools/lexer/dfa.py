@@ -1,62 +1,107 @@
-from typing import Dict, FrozenSet, Set
-from collections import deque
+from bisect import bisect_left, bisect_right
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+from collections import defaultdict
 
-from langtools.lexer.state import DFAState, NFAState
+from langtools.lexer.compiled import CompiledDFA
+from langtools.lexer.exceptions import CompiledDFAFormatError, StaleDFAError
+from langtools.lexer.intervals import boundary_points
+from langtools.lexer.state import DFAState
+from langtools.lexer.search import finditer, reverse_dfa
+from langtools.lexer.subset import IndexedNFA, subset_construction
+from langtools.lexer.token import TokenMatch
+from langtools.lexer.utf8 import utf8_nfa
+from langtools.lexer.vectorized import match_many
 
 
 class DFA:
-    def __init__(self, nfa_to_convert):
+    def __init__(self, nfa_to_convert, minimize: bool = True, utf8: bool = False):
 
-        # will map from a collection of nfa_states to a dfa_state
-        dfa_states: Dict[FrozenSet[NFAState], DFAState] = dict()
+        if utf8:
+            # runs over UTF-8 bytes instead of characters, see tokenize_bytes
+            nfa_to_convert = utf8_nfa(nfa_to_convert)
 
-        # find initial epsilon closure to start building from
-        start_state: NFAState = DFA.find_epsilon_closure({nfa_to_convert.start_state})
+        self._compiled: Optional[CompiledDFA] = None
+        # for search / finditer, built the first time they are used
+        self._reverse: Optional[CompiledDFA] = None
+        self._start_state: Optional[DFAState] = None
+        self._states: Optional[List[DFAState]] = None
+        # identifies the spec this DFA was built from, see save / load
+        self.fingerprint: str = nfa_to_convert.expr.fingerprint()
 
-        self.start_state: DFAState = DFAState(
-            accepting=nfa_to_convert.start_state.accepting
-        )
-        dfa_states[frozenset(start_state)] = self.start_state
+        self.start_state, self.states = subset_construction(IndexedNFA(nfa_to_convert))
 
-        q = deque([start_state])
-        while q:
-            curr_dfa_state: FrozenSet[NFAState] = frozenset(q.pop())
-            epsilon_closure: Set[NFAState] = DFA.find_epsilon_closure(curr_dfa_state)
+        if minimize:
+            self.minimize()
 
-            for transition_char in nfa_to_convert.alphabet:
-                transition_char_closure: Set[NFAState] = set()
+        # resolves each accepting state's token up front, priority ties raise here
+        self.compile()
 
-                for nfa_state in epsilon_closure:
-                    for target_state in nfa_state.transitions[transition_char]:
-                        transition_char_closure.add(target_state)
+    @property
+    def start_state(self) -> DFAState:
+        if self._start_state is None:
+            self._start_state, self._states = self._table_states()
+        return self._start_state
 
-                transition_char_closure = DFA.find_epsilon_closure(
-                    transition_char_closure
-                )
-                transition_char_closure = frozenset(transition_char_closure)
+    @start_state.setter
+    def start_state(self, start_state: DFAState) -> None:
+        self._start_state = start_state
 
-                if len(transition_char_closure) > 0:
+    @property
+    def states(self) -> List[DFAState]:
+        if self._states is None:
+            self._start_state, self._states = self._table_states()
+        return self._states
 
-                    if transition_char_closure not in dfa_states:
-                        q.appendleft(transition_char_closure)
+    @states.setter
+    def states(self, states: List[DFAState]) -> None:
+        self._states = states
 
-                        is_accepting = False
-                        tokens = set()
+    def _table_states(self) -> Tuple[DFAState, List[DFAState]]:
+        # loaded DFAs only have their table until the states are needed
+        if self._compiled is None:
+            raise Exception("DFA has neither states nor a table to build them from")
+        return self._compiled.to_states()
 
-                        for state in transition_char_closure:
-                            is_accepting = is_accepting or state.accepting
-                            tokens = tokens.union(state.tokens)
+    @classmethod
+    def from_compiled(cls, compiled: CompiledDFA, fingerprint: str) -> "DFA":
+        dfa = cls.__new__(cls)
+        dfa._compiled = compiled
+        dfa._reverse = None
+        dfa._start_state = None
+        dfa._states = None
+        dfa.fingerprint = fingerprint
+        return dfa
 
-                        dfa_states[transition_char_closure] = DFAState(
-                            accepting=is_accepting
-                        )
-                        dfa_states[transition_char_closure].tokens = tokens
+    def save(self, path: str) -> None:
+        self.compile().save(path, self.fingerprint)
 
-                    dfa_states[curr_dfa_state].set_transition(
-                        transition_char, dfa_states[transition_char_closure]
-                    )
+    @classmethod
+    def load(cls, path: str, fingerprint: Optional[str] = None) -> "DFA":
+        """
+        Loads a DFA written by save, memory mapping its tables. If fingerprint is
+        given and the file was built from a different spec, raises StaleDFAError
+        """
+        compiled, file_fingerprint = CompiledDFA.load(path)
+        if fingerprint is not None and fingerprint != file_fingerprint:
+            raise StaleDFAError(path)
+        return cls.from_compiled(compiled, file_fingerprint)
 
-        self.states = dfa_states.values()
+    @classmethod
+    def cached(
+        cls, nfa_to_convert, path: str, minimize: bool = True, utf8: bool = False
+    ) -> "DFA":
+        """
+        Loads the DFA for nfa_to_convert from path, building and saving it first
+        if the file is missing, unreadable or was built from a different spec
+        """
+        if utf8:
+            nfa_to_convert = utf8_nfa(nfa_to_convert)
+        try:
+            return cls.load(path, fingerprint=nfa_to_convert.expr.fingerprint())
+        except (OSError, ValueError, CompiledDFAFormatError, StaleDFAError):
+            dfa = cls(nfa_to_convert, minimize=minimize)
+            dfa.save(path)
+            return dfa
 
     def __repr__(self) -> str:
         state_strings = []
@@ -65,29 +110,140 @@ class DFA:
 
         return "\n".join(state_strings)
 
-    @staticmethod
-    def find_epsilon_closure(states: Set[NFAState]) -> Set[NFAState]:
-        states_reached: Set[NFAState] = set(states)
+    def minimize(self) -> None:
+        """
+        Merges equivalent states using Hopcroft's partition refinement.
+        States are only ever merged if they agree on accepting and tokens,
+        so token resolution is unaffected
+        """
+        states: List[DFAState] = list(self.states)
+        state_ids: Dict[DFAState, int] = {state: i for i, state in enumerate(states)}
+
+        # transitions are partial, missing ones lead to an implicit dead state.
+        # The symbols are the elementary intervals induced by every edge
+        dead = len(states)
+        points = boundary_points(edge for state in states for edge in state.edges())
+
+        inverse: List[Dict[int, List[int]]] = [
+            defaultdict(list) for _ in range(len(points))
+        ]
+        for symbol in range(len(points)):
+            inverse[symbol][dead].append(dead)
+        for i, state in enumerate(states):
+            covered: Set[int] = set()
+            for low, high, target in state.edges():
+                for symbol in range(
+                    bisect_left(points, low), bisect_right(points, high)
+                ):
+                    inverse[symbol][state_ids[target]].append(i)
+                    covered.add(symbol)
+            for symbol in range(len(points)):
+                if symbol not in covered:
+                    inverse[symbol][dead].append(i)
+
+        initial_groups: Dict[Tuple[bool, FrozenSet], Set[int]] = defaultdict(set)
+        initial_groups[(False, frozenset())].add(dead)
+        for i, state in enumerate(states):
+            initial_groups[(state.accepting, frozenset(state.tokens))].add(i)
+
+        blocks: List[Set[int]] = list(initial_groups.values())
+        block_of: List[int] = [0] * (len(states) + 1)
+        for block_id, block in enumerate(blocks):
+            for i in block:
+                block_of[i] = block_id
+
+        worklist: Set[int] = set(range(len(blocks)))
+        while worklist:
+            splitter = list(blocks[worklist.pop()])
+            for symbol_inverse in inverse:
+                touched: Dict[int, Set[int]] = defaultdict(set)
+                for target_id in splitter:
+                    for source_id in symbol_inverse.get(target_id, ()):
+                        touched[block_of[source_id]].add(source_id)
+
+                for block_id, intersection in touched.items():
+                    if len(intersection) == len(blocks[block_id]):
+                        continue
+                    remainder = blocks[block_id] - intersection
+                    blocks[block_id] = intersection
+                    new_block_id = len(blocks)
+                    blocks.append(remainder)
+                    for i in remainder:
+                        block_of[i] = new_block_id
 
-        def helper(start_states: Set[NFAState], states_reached: Set[NFAState]):
-            for state in start_states:
-                states_reached.add(state)
-                for epsilon_neighbour in state.transitions[""]:
-                    if epsilon_neighbour not in states_reached:
-                        helper({epsilon_neighbour}, states_reached)
+                    if block_id in worklist or len(remainder) <= len(intersection):
+                        worklist.add(new_block_id)
+                    else:
+                        worklist.add(block_id)
 
-        helper(states, states_reached)
-        return states_reached
+        # rebuild one state per block, dropping the dead block unless it holds the start
+        start_block = block_of[state_ids[self.start_state]]
+        dead_block = block_of[dead]
+        merged_states: Dict[int, DFAState] = dict()
+        representatives: Dict[int, DFAState] = dict()
+        for block_id, block in enumerate(blocks):
+            if block_id == dead_block and block_id != start_block:
+                continue
+            representative = states[min(i for i in block if i != dead)]
+            merged_state = DFAState(accepting=representative.accepting)
+            merged_state.tokens = set(representative.tokens)
+            merged_states[block_id] = merged_state
+            representatives[block_id] = representative
+
+        for block_id, merged_state in merged_states.items():
+            representative = representatives[block_id]
+            for char, target in representative.transitions.items():
+                target_block = block_of[state_ids[target]]
+                if target_block in merged_states and target_block != dead_block:
+                    merged_state.set_transition(char, merged_states[target_block])
+            for low, high, target in representative.range_transitions:
+                target_block = block_of[state_ids[target]]
+                if target_block in merged_states and target_block != dead_block:
+                    merged_state.add_range_transition(
+                        low, high, merged_states[target_block]
+                    )
+
+        self.start_state = merged_states[start_block]
+        self.states = list(merged_states.values())
+        self._compiled = None
+
+    def compile(self) -> CompiledDFA:
+        """
+        Returns the table driven form of this DFA, built once and cached
+        """
+        if self._compiled is None:
+            self._compiled = CompiledDFA.from_states(self.start_state)
+        return self._compiled
 
     def match(self, string_to_match: str) -> bool:
-        curr_state = self.start_state
-        for curr_char in string_to_match:
-            if curr_char in curr_state.transitions:
-                curr_state = curr_state.transitions[curr_char]
-            else:
-                return False
+        return self.compile().match(string_to_match)
 
-        return curr_state.accepting
+    def match_many(self, strings):
+        """
+        Whole string membership of many strings at once, returns a numpy bool
+        array. Needs numpy, see vectorized.match_many
+        """
+        return match_many(self.compile(), strings)
+
+    def finditer(self, text, start: int = 0, end: Optional[int] = None):
+        """
+        Yields a TokenMatch for every leftmost longest match in text[start:end],
+        matches don't overlap and are never empty. text is a str, or UTF-8
+        bytes if the DFA was built with utf8=True. Runs in two passes over the
+        text: a DFA for the reversed spec marks every offset a match starts at,
+        then each match is run forwards from its start only to find its end
+        """
+        if self._reverse is None:
+            self._reverse = reverse_dfa(self.start_state, self.states)
+        return finditer(self.compile(), self._reverse, text, start, end)
+
+    def search(
+        self, text, start: int = 0, end: Optional[int] = None
+    ) -> Optional[TokenMatch]:
+        """
+        The leftmost longest match in text[start:end], None if there is none
+        """
+        return next(self.finditer(text, start, end), None)
 
     def visualize(self):
         state_ids = dict()
@@ -110,9 +266,11 @@ class DFA:
 
         for state in self.states:
             state_id = state_ids[id(state)]
-            for transition_char in state.transitions.keys():
-                neighbour = state.transitions[transition_char]
+            for low, high, neighbour in state.edges():
+                transition_label = (
+                    chr(low) if low == high else f"[{chr(low)}-{chr(high)}]"
+                )
                 neighbour_id = state_ids[id(neighbour)]
                 print(
-                    f"{state_id}{state_tag(state)}-{transition_char}->{neighbour_id}{state_tag(neighbour)}"
+                    f"{state_id}{state_tag(state)}-{transition_label}->{neighbour_id}{state_tag(neighbour)}"
                 )
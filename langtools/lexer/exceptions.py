@@ -1,12 +1,18 @@
 from typing import Optional
 
+from langtools.lexer.utils import EOF
+
 
 class LexicalError(Exception):
     def __init__(self, reader, message: Optional[str] = None):
         error_line, error_col, error_line_content = reader.get_curr_line()
         error_header: str = f"LexicalError: Line {error_line}, Column {error_col}"
         error_pointer: str = " " * (error_col) + "^"
-        error_char = error_line_content[error_col]
+        error_char = (
+            error_line_content[error_col]
+            if error_col < len(error_line_content)
+            else EOF
+        )
         error_message: str = message or f'Unexpected Character: "{error_char}"'
 
         self.error_line = error_line
@@ -17,7 +23,40 @@ class LexicalError(Exception):
             f"\n{error_header}\n{error_line_content}\n{error_pointer}\n{error_message}"
         )
 
+    def __reduce__(self):
+        # the reader is gone, so rebuild from the formatted message, e.g. when
+        # the error is sent back from a worker process
+        return (
+            _restore_lexical_error,
+            (self.args, self.error_line, self.error_col, self.error_char),
+        )
+
+
+def _restore_lexical_error(args, error_line, error_col, error_char) -> LexicalError:
+    error = Exception.__new__(LexicalError)
+    error.args = args
+    error.error_line = error_line
+    error.error_col = error_col
+    error.error_char = error_char
+    return error
+
 
 class TokenResolutionError(Exception):
     def __init__(self, message):
         super().__init__(f"TokenResolutionError: {message}")
+
+
+class UnsupportedSpecError(Exception):
+    def __init__(self, message):
+        super().__init__(f"UnsupportedSpecError: {message}")
+
+
+class CompiledDFAFormatError(Exception):
+    pass
+
+
+class StaleDFAError(Exception):
+    def __init__(self, path: str):
+        super().__init__(
+            f"StaleDFAError: {path} was built from a different token specification"
+        )
@@ -0,0 +1,324 @@
+import io
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+from langtools.lexer.dfa import DFA
+from langtools.lexer.exceptions import LexicalError
+from langtools.lexer.lazy_dfa import LazyDFA
+from langtools.lexer.lexer import _iter_tokens
+from langtools.lexer.token import TokenMatch, TokenSource
+from langtools.lexer.utils import BufferedLexerReader
+
+# re-lexing usually stops a token or two after the edit, so read little ahead
+EDIT_CHUNK_SIZE = 1 << 12
+
+
+class _GapText:
+    """
+    Text kept in a gap buffer: a list of its characters with unused slots at
+    the last edit, so an edit only moves the characters between it and the
+    previous one. Slicing gives a str. Line starts before a gap index are
+    stored as offsets from the start of the text and after it as offsets from
+    the end, like the token starts of IncrementalLexer
+    """
+
+    def __init__(self) -> None:
+        self.chars: List[str] = []
+        # chars[gap_start:gap_end] aren't part of the text
+        self.gap_start = 0
+        self.gap_end = 0
+        self.starts = array("q", [0])
+        # starts[line_gap:] are stored relative to the end of the text
+        self.line_gap = 1
+        self.line_starts = _GapLineStarts(self)
+
+    def __len__(self) -> int:
+        return len(self.chars) - (self.gap_end - self.gap_start)
+
+    def __str__(self) -> str:
+        return self[0 : len(self)]
+
+    def __getitem__(self, index: slice) -> str:
+        start, stop, _ = index.indices(len(self))
+        stop = max(start, stop)
+        gap_start, gap_end = self.gap_start, self.gap_end
+        if stop <= gap_start:
+            return "".join(self.chars[start:stop])
+        gap_length = gap_end - gap_start
+        if start >= gap_start:
+            return "".join(self.chars[start + gap_length : stop + gap_length])
+        return "".join(self.chars[start:gap_start]) + "".join(
+            self.chars[gap_end : stop + gap_length]
+        )
+
+    def replace(self, offset: int, deleted: int, inserted: str) -> str:
+        """
+        Replaces deleted characters at offset with inserted, returns the
+        characters deleted
+        """
+        text_length = len(self)
+        self._move_line_gap(bisect_right(self.line_starts, offset), text_length)
+        line_end = bisect_right(
+            self.starts, offset + deleted - text_length, self.line_gap
+        )
+        new_lines = array("q")
+        newline = inserted.find("\n")
+        while newline != -1:
+            new_lines.append(offset + newline + 1)
+            newline = inserted.find("\n", newline + 1)
+        self.starts[self.line_gap : line_end] = new_lines
+        self.line_gap += len(new_lines)
+
+        self._move_gap(offset)
+        chars = self.chars
+        removed = "".join(chars[self.gap_end : self.gap_end + deleted])
+        self.gap_end += deleted
+        if len(inserted) > self.gap_end - self.gap_start:
+            # grow geometrically, so appending is amortized constant time
+            grow = max(len(inserted), len(chars))
+            chars[self.gap_end : self.gap_end] = [""] * grow
+            self.gap_end += grow
+        chars[self.gap_start : self.gap_start + len(inserted)] = inserted
+        self.gap_start += len(inserted)
+        return removed
+
+    def _move_gap(self, offset: int) -> None:
+        chars, gap_start, gap_end = self.chars, self.gap_start, self.gap_end
+        if offset < gap_start:
+            moved = gap_start - offset
+            chars[gap_end - moved : gap_end] = chars[offset:gap_start]
+            self.gap_end -= moved
+        else:
+            moved = offset - gap_start
+            chars[gap_start:offset] = chars[gap_end : gap_end + moved]
+            self.gap_end += moved
+        self.gap_start = offset
+
+    def _move_line_gap(self, index: int, text_length: int) -> None:
+        starts = self.starts
+        for moved in range(index, self.line_gap):
+            starts[moved] -= text_length
+        for moved in range(self.line_gap, index):
+            starts[moved] += text_length
+        self.line_gap = index
+
+    def read_from(self, offset: int) -> "_GapTextStream":
+        return _GapTextStream(self, offset)
+
+
+class _GapLineStarts(Sequence[int]):
+    """
+    Offsets at which the lines of a _GapText start
+    """
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: _GapText):
+        self.text = text
+
+    def __getitem__(self, index):
+        starts = self.text.starts
+        if index < 0:
+            index += len(starts)
+        if index < self.text.line_gap:
+            return starts[index]
+        return starts[index] + len(self.text)
+
+    def __len__(self) -> int:
+        return len(self.text.starts)
+
+
+class _GapTextStream(io.TextIOBase):
+    """
+    Reads a _GapText from an offset on, for BufferedLexerReader
+    """
+
+    def __init__(self, text: _GapText, offset: int):
+        super().__init__()
+        self.text = text
+        self.offset = offset
+
+    def read(self, size: Optional[int] = -1) -> str:
+        end = len(self.text) if size is None or size < 0 else self.offset + size
+        chunk = self.text[self.offset : end]
+        self.offset += len(chunk)
+        return chunk
+
+
+class IncrementalLexer:
+    """
+    Token stream of a text that is kept up to date as the text is edited.
+    Indexing and iterating give the same TokenMatch records tokenize_str
+    would for the current text.
+
+    Every token remembers how far past its end the DFA looked before settling
+    on it. An edit only invalidates the tokens whose scan reached the edited
+    offset, so re-lexing starts from the end of the last token before them
+    and stops as soon as a new token starts where an old one did (maximal
+    munch from an offset only depends on the text after it), usually a token
+    or two after the edit.
+
+    Token starts before a gap index are stored as offsets from the start of
+    the text and after it as offsets from the end, so tokens after an edit
+    never need shifting, the gap is just moved to the edit. The text itself
+    is kept in a gap buffer, and tokens read their lexemes and positions from
+    it, so a token an edit replaced shouldn't be used after the edit
+    """
+
+    def __init__(
+        self,
+        text: str,
+        tokenizing_dfa: Union[DFA, LazyDFA],
+        white_space_delimit=False,
+    ):
+        self.compiled = tokenizing_dfa.compile()
+        self.white_space_delimit = white_space_delimit
+        self.buffer = _GapText()
+        self.source = TokenSource(
+            self.compiled.token_kinds,
+            self.buffer.line_starts,
+            self.buffer,
+            not self.compiled.has_skip_tokens,
+        )
+
+        self.kinds = array("i")
+        self.starts = array("q")
+        self.lengths = array("q")
+        # scan end - token end, at least 1
+        self.lookaheads = array("q")
+        # starts[gap:] are stored relative to the end of the text
+        self.gap = 0
+        # bounds how far back an edit can invalidate tokens
+        self.max_lookahead = 1
+
+        self.edit(0, 0, text)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, index: int) -> TokenMatch:
+        if index < 0:
+            index += len(self.kinds)
+        start = self._start(index)
+        return TokenMatch(
+            self.kinds[index], start, start + self.lengths[index], self.source
+        )
+
+    def __iter__(self) -> Iterator[TokenMatch]:
+        for index in range(len(self.kinds)):
+            yield self[index]
+
+    @property
+    def text(self) -> str:
+        return str(self.buffer)
+
+    def _start(self, index: int) -> int:
+        if index < self.gap:
+            return self.starts[index]
+        return self.starts[index] + len(self.buffer)
+
+    def _first_starting_at(self, offset: int) -> int:
+        """
+        Returns the index of the first token starting at or after offset
+        """
+        gap = self.gap
+        if gap > 0 and offset <= self.starts[gap - 1]:
+            return bisect_left(self.starts, offset, 0, gap)
+        return bisect_left(self.starts, offset - len(self.buffer), gap)
+
+    def _move_gap(self, index: int) -> None:
+        starts, text_length = self.starts, len(self.buffer)
+        for moved in range(index, self.gap):
+            starts[moved] -= text_length
+        for moved in range(self.gap, index):
+            starts[moved] += text_length
+        self.gap = index
+
+    def edit(
+        self, offset: int, deleted: int, inserted: str
+    ) -> Tuple[int, int, List[TokenMatch]]:
+        """
+        Replaces deleted characters at offset with inserted and re-lexes what
+        the edit affects. Returns (index, removed, new_tokens): the tokens at
+        index onwards that were replaced by new_tokens. If the new text can't
+        be lexed, LexicalError is raised and the edit isn't applied
+        """
+        old_length = len(self.buffer)
+        if offset < 0 or deleted < 0 or offset + deleted > old_length:
+            raise Exception(
+                f"Edit of {deleted} characters at {offset} is outside the text"
+            )
+
+        # first token whose scan looked at offset or beyond. Token ends only
+        # grow, so earlier tokens ending within max_lookahead are all checked
+        index = self._first_starting_at(offset)
+        earlier = index
+        while earlier > 0:
+            end = self._start(earlier - 1) + self.lengths[earlier - 1]
+            if end + self.max_lookahead <= offset:
+                break
+            earlier -= 1
+            if end + self.lookaheads[earlier] > offset:
+                index = earlier
+        restart = self._start(index - 1) + self.lengths[index - 1] if index else 0
+
+        # old tokens from the end of the deleted text on are candidates to
+        # re-synchronize with, their starts don't change relative to the end
+        self._move_gap(index)
+        old_count = len(self.kinds)
+        candidate = self._first_starting_at(offset + deleted)
+
+        removed = self.buffer.replace(offset, deleted, inserted)
+        text_length = len(self.buffer)
+        reader = BufferedLexerReader(
+            self.buffer.read_from(restart),
+            EDIT_CHUNK_SIZE,
+            restart,
+            self.buffer.line_starts,
+        )
+        scan_ends = array("q")
+
+        new_kinds, new_starts = array("i"), array("q")
+        new_lengths, new_lookaheads = array("q"), array("q")
+        try:
+            for token in _iter_tokens(
+                reader,
+                self.compiled,
+                self.source,
+                self.compiled.char_class,
+                str.isspace,
+                self.white_space_delimit,
+                False,
+                restart,
+                scan_ends,
+            ):
+                from_end = token.start - text_length
+                starts = self.starts
+                while candidate < old_count and starts[candidate] < from_end:
+                    candidate += 1
+                if candidate < old_count and starts[candidate] == from_end:
+                    break
+                new_kinds.append(token.kind)
+                new_starts.append(token.start)
+                new_lengths.append(token.end - token.start)
+                new_lookaheads.append(scan_ends[-1] - token.end)
+            else:
+                candidate = old_count
+        except LexicalError:
+            self.buffer.replace(offset, len(inserted), removed)
+            raise
+
+        self.kinds[index:candidate] = new_kinds
+        self.starts[index:candidate] = new_starts
+        self.lengths[index:candidate] = new_lengths
+        self.lookaheads[index:candidate] = new_lookaheads
+        self.gap = index + len(new_kinds)
+        if new_lookaheads:
+            self.max_lookahead = max(self.max_lookahead, max(new_lookaheads))
+
+        return (
+            index,
+            candidate - index,
+            [self[new_index] for new_index in range(index, self.gap)],
+        )
@@ -0,0 +1,72 @@
+import sys
+from collections import defaultdict
+from typing import Dict, Hashable, Iterable, List, Set, Tuple
+
+MAX_CODE_POINT = sys.maxunicode
+
+
+def normalize_intervals(
+    intervals: Iterable[Tuple[int, int]],
+) -> Tuple[Tuple[int, int], ...]:
+    """
+    Sorts inclusive intervals and merges any that overlap or touch
+    """
+    merged: List[List[int]] = []
+    for low, high in sorted(intervals):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], high)
+        else:
+            merged.append([low, high])
+    return tuple((low, high) for low, high in merged)
+
+
+def negate_intervals(
+    intervals: Iterable[Tuple[int, int]],
+) -> Tuple[Tuple[int, int], ...]:
+    complement: List[Tuple[int, int]] = []
+    next_low = 0
+    for low, high in normalize_intervals(intervals):
+        if low > next_low:
+            complement.append((next_low, low - 1))
+        next_low = high + 1
+    if next_low <= MAX_CODE_POINT:
+        complement.append((next_low, MAX_CODE_POINT))
+    return tuple(complement)
+
+
+def split_intervals(
+    edges: Iterable[Tuple[int, int, Hashable]],
+) -> List[Tuple[int, int, Set[Hashable]]]:
+    """
+    Splits possibly overlapping (low, high, target) edges on their boundaries,
+    returning sorted disjoint (low, high, targets) segments that have targets
+    """
+    events: Dict[int, List[Tuple[Hashable, int]]] = defaultdict(list)
+    for low, high, target in edges:
+        events[low].append((target, 1))
+        events[high + 1].append((target, -1))
+
+    segments: List[Tuple[int, int, Set[Hashable]]] = []
+    active: Dict[Hashable, int] = defaultdict(int)
+    points = sorted(events)
+    for i, point in enumerate(points[:-1]):
+        for target, delta in events[point]:
+            active[target] += delta
+            if active[target] == 0:
+                del active[target]
+        if active:
+            segments.append((point, points[i + 1] - 1, set(active)))
+
+    return segments
+
+
+def boundary_points(edges: Iterable[Tuple[int, int, Hashable]]) -> List[int]:
+    """
+    Start points of the elementary intervals induced by edges, always including 0
+    """
+    points = {0}
+    for low, high, _ in edges:
+        points.add(low)
+        if high < MAX_CODE_POINT:
+            points.add(high + 1)
+    return sorted(points)
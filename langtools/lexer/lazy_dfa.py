@@ -0,0 +1,250 @@
+from array import array
+from bisect import bisect_right
+from typing import Dict, FrozenSet, List, Tuple
+
+from langtools.lexer.compiled import DEAD_STATE, NO_KIND
+from langtools.lexer.intervals import boundary_points
+from langtools.lexer.state import select_token
+from langtools.lexer.subset import IndexedNFA
+from langtools.lexer.token import Token
+from langtools.lexer.utf8 import utf8_nfa
+
+# transition table entry that hasn't been computed yet
+UNKNOWN_STATE = -2
+# a full cache that was used for fewer characters than this per state built
+# isn't worth keeping, like RE2's bail out rule
+SCANNED_PER_STATE = 10
+
+
+class LazyDFA:
+    """
+    DFA that is built on demand while it runs (in the style of RE2). States
+    are created the first time a transition reaches them and kept in a cache
+    of at most cache_size states, which is flushed when full. If a full
+    cache was used for fewer than SCANNED_PER_STATE characters per state it
+    built, caching isn't paying off and it falls back to plain NFA
+    simulation, then tries caching again once it has simulated as many
+    characters as a cache that pays off would have been used for.
+
+    It exposes the same table layout as CompiledDFA, except transitions may
+    hold UNKNOWN_STATE, in which case fill must be called with the number of
+    characters run through the table since the caller last called it
+    """
+
+    def __init__(self, nfa_to_convert, cache_size: int = 4096, utf8: bool = False):
+
+        if cache_size < 3:
+            raise Exception("LazyDFA cache_size must be at least 3")
+        if utf8:
+            nfa_to_convert = utf8_nfa(nfa_to_convert)
+
+        self.nfa = IndexedNFA(nfa_to_convert)
+        self.cache_size = cache_size
+
+        # character classes come straight from the nfa edges
+        edges = [
+            edge for state_edges in self.nfa.edges.values() for edge in state_edges
+        ]
+        points = boundary_points(edges)
+        signatures: List[List[int]] = [[] for _ in points]
+        for edge_id, (low, high, _) in enumerate(edges):
+            for point_index in range(
+                bisect_right(points, low) - 1, bisect_right(points, high)
+            ):
+                signatures[point_index].append(edge_id)
+
+        # class 0 holds the characters no edge covers, it always leads to the
+        # dead state and has no representative
+        class_ids: Dict[Tuple[int, ...], int] = {(): 0}
+        self.class_representatives: List[int] = [-1]
+        self.boundaries = array("I")
+        self.interval_classes = array("i")
+        for point, signature in zip(points, signatures):
+            signature_key = tuple(signature)
+            if signature_key not in class_ids:
+                class_ids[signature_key] = len(class_ids)
+                self.class_representatives.append(point)
+            char_class = class_ids[signature_key]
+            if not self.interval_classes or self.interval_classes[-1] != char_class:
+                self.boundaries.append(point)
+                self.interval_classes.append(char_class)
+
+        self.num_classes = len(class_ids)
+        # class of every byte, for DFAs built with utf8
+        self.byte_classes: List[int] = [self._lookup_class(byte) for byte in range(256)]
+        self.char_classes: Dict[str, int] = {
+            chr(byte): char_class for byte, char_class in enumerate(self.byte_classes)
+        }
+
+        self.start_state = 0
+        self.transitions = array("i")
+        self.accepting = bytearray()
+        self.tokens: List[FrozenSet[Token]] = []
+        # interned like CompiledDFA's, kinds are never dropped by a flush
+        self.token_kinds: List[str] = []
+        self.skip_kinds = bytearray()
+        self.state_kinds = array("i")
+        self._kind_ids: Dict[str, int] = dict()
+        self.has_skip_tokens = any(
+            token.skip for state_tokens in self.nfa.tokens for token in state_tokens
+        )
+        self.state_sets: List[int] = []
+        self.state_ids: Dict[int, int] = dict()
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_flushes = 0
+        self.simulating = False
+        # characters runners reported reading since the last flush
+        self._scanned_since_flush = 0
+
+        self._add_state(self.nfa.start)
+
+    def compile(self) -> "LazyDFA":
+        """
+        A LazyDFA is its own transition table, filled in as it is used
+        """
+        return self
+
+    def _lookup_class(self, code_point: int) -> int:
+        return self.interval_classes[bisect_right(self.boundaries, code_point) - 1]
+
+    def char_class(self, char: str) -> int:
+        char_class = self.char_classes.get(char)
+        if char_class is None:
+            char_class = self._lookup_class(ord(char))
+            self.char_classes[char] = char_class
+        return char_class
+
+    def _add_state(self, nfa_state_ids: int, cached: bool = True) -> int:
+        state = len(self.state_sets)
+        self.state_sets.append(nfa_state_ids)
+        if cached:
+            self.state_ids[nfa_state_ids] = state
+        self.transitions.extend(array("i", [UNKNOWN_STATE]) * self.num_classes)
+        self.accepting.append(self.nfa.is_accepting(nfa_state_ids))
+        self.tokens.append(frozenset(self.nfa.find_tokens(nfa_state_ids)))
+        self.state_kinds.append(
+            self._select_kind(self.accepting[state], self.tokens[state])
+        )
+        return state
+
+    def _select_kind(self, accepting: int, tokens: FrozenSet[Token]) -> int:
+        # states only exist once reached, so priority ties surface here. Only
+        # accepting states emit their token
+        if not accepting:
+            return NO_KIND
+        selected_token = select_token(tokens)
+        if selected_token is None:
+            return NO_KIND
+        if selected_token.name not in self._kind_ids:
+            self._kind_ids[selected_token.name] = len(self.token_kinds)
+            self.token_kinds.append(selected_token.name)
+            self.skip_kinds.append(selected_token.skip)
+        return self._kind_ids[selected_token.name]
+
+    def flush(self) -> None:
+        """
+        Drops every cached state except the start state. Any state ids held by
+        callers, other than the start state, are invalid afterwards
+        """
+        # tables are truncated in place, runners hold references to them
+        del self.transitions[self.num_classes :]
+        self.transitions[:] = array("i", [UNKNOWN_STATE]) * self.num_classes
+        del self.accepting[1:]
+        del self.tokens[1:]
+        del self.state_kinds[1:]
+        del self.state_sets[1:]
+        self.state_ids = {self.state_sets[0]: 0}
+
+        self.cache_flushes += 1
+        self._scanned_since_flush = 0
+
+    def fill(self, state: int, char_class: int, scanned: int = 0) -> int:
+        """
+        Computes the transition out of state on char_class and returns the target
+        state. scanned is how many characters the caller ran through the table
+        since it last called fill. May flush the cache, in which case only the
+        returned state and the start state remain valid
+        """
+        self._scanned_since_flush += scanned
+        target_ids = 0
+        if char_class != 0:
+            target_ids = self.nfa.step(
+                self.state_sets[state], self.class_representatives[char_class]
+            )
+        entry = state * self.num_classes + char_class
+
+        if target_ids == 0:
+            if not self.simulating:
+                self.transitions[entry] = DEAD_STATE
+            return DEAD_STATE
+
+        if self.simulating:
+            self.cache_misses += 1
+            if self._scanned_since_flush < SCANNED_PER_STATE * self.cache_size:
+                return self._simulate(state, target_ids)
+            # the input may have settled down since, give caching another go
+            self.simulating = False
+            source_kept = state == self.start_state
+            self.flush()
+            target = self._add_state(target_ids)
+            if source_kept:
+                self.transitions[entry] = target
+            return target
+
+        cached = self.state_ids.get(target_ids)
+        if cached is not None:
+            self.cache_hits += 1
+            self.transitions[entry] = cached
+            return cached
+
+        self.cache_misses += 1
+        if len(self.state_sets) < self.cache_size:
+            target = self._add_state(target_ids)
+            self.transitions[entry] = target
+            return target
+
+        source_kept = state == self.start_state
+        built = len(self.state_sets) - 1
+        # states are hardly ever reused, stop paying to cache them
+        self.simulating = self._scanned_since_flush < SCANNED_PER_STATE * built
+        self.flush()
+        if self.simulating:
+            return self._simulate(state, target_ids)
+        target = self._add_state(target_ids)
+        if source_kept:
+            self.transitions[entry] = target
+        return target
+
+    def _simulate(self, state: int, target_ids: int) -> int:
+        # nfa simulation, nothing is cached and two scratch states alternate
+        target = 1 if state != 1 else 2
+        while len(self.state_sets) <= target:
+            self._add_state(target_ids, cached=False)
+        self.state_sets[target] = target_ids
+        self.accepting[target] = self.nfa.is_accepting(target_ids)
+        self.tokens[target] = frozenset(self.nfa.find_tokens(target_ids))
+        self.state_kinds[target] = self._select_kind(
+            self.accepting[target], self.tokens[target]
+        )
+        return target
+
+    def match(self, string_to_match: str) -> bool:
+        transitions = self.transitions
+        num_classes = self.num_classes
+        char_class = self.char_class
+
+        curr_state = self.start_state
+        reported = 0
+        for position, curr_char in enumerate(string_to_match):
+            curr_class = char_class(curr_char)
+            next_state = transitions[curr_state * num_classes + curr_class]
+            if next_state == UNKNOWN_STATE:
+                next_state = self.fill(curr_state, curr_class, position - reported)
+                reported = position
+            if next_state == DEAD_STATE:
+                return False
+            curr_state = next_state
+
+        return bool(self.accepting[curr_state])
@@ -1,86 +1,304 @@
 import io
-from typing import List, Optional, Union
-from copy import deepcopy
+from array import array
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 
-from langtools.lexer.exceptions import LexicalError, TokenResolutionError
+from langtools.lexer.exceptions import LexicalError
 
-from langtools.lexer.state import DFAState
+from langtools.lexer.compiled import CompiledDFA, DEAD_STATE, NO_KIND
 from langtools.lexer.dfa import DFA
-from langtools.lexer.token import Token
-from langtools.lexer.utils import LexerStreamReader, EOF
+from langtools.lexer.lazy_dfa import LazyDFA, UNKNOWN_STATE
+from langtools.lexer.token import TokenMatch, TokenSource
+from langtools.lexer.utils import (
+    BufferedLexerReader,
+    ByteLexerReader,
+    DEFAULT_CHUNK_SIZE,
+)
 
+# bytes.isspace is only true for these, multi-byte white space isn't skipped
+ASCII_WHITE_SPACE = bytes(byte in b" \t\n\r\x0b\x0c" for byte in range(256))
 
-def tokenize_str(input_str: str, tokenizing_dfa: DFA):
-    return tokenize(io.StringIO(input_str), tokenizing_dfa)
+
+def tokenize_str(
+    input_str: str, tokenizing_dfa: Union[DFA, LazyDFA, CompiledDFA]
+) -> List[TokenMatch]:
+    """
+    Tokenizes a string held in memory. Tokens share input_str and only slice
+    their lexeme out of it when asked for
+    """
+    compiled = tokenizing_dfa.compile()
+    reader = BufferedLexerReader.from_string(input_str)
+    source = TokenSource(
+        compiled.token_kinds,
+        reader.line_starts,
+        input_str,
+        not compiled.has_skip_tokens,
+    )
+    return list(
+        _iter_tokens(
+            reader, compiled, source, compiled.char_class, str.isspace, False, False
+        )
+    )
+
+
+def tokenize_bytes(
+    input_bytes,
+    tokenizing_dfa: Union[DFA, LazyDFA, CompiledDFA],
+    white_space_delimit=False,
+    memoize_failures=False,
+) -> List[TokenMatch]:
+    """
+    Tokenizes UTF-8 encoded bytes, a memoryview or an mmap in place, without
+    decoding or copying it. tokenizing_dfa must be built with utf8=True.
+    Token offsets count bytes and lexemes are only decoded when asked for, so
+    an mmap has to stay open while they are used
+    """
+    if isinstance(input_bytes, memoryview):
+        input_bytes = input_bytes.cast("B")
+
+    compiled = tokenizing_dfa.compile()
+    reader = ByteLexerReader(input_bytes)
+    source = TokenSource(
+        compiled.token_kinds,
+        reader.line_starts,
+        input_bytes,
+        not compiled.has_skip_tokens,
+    )
+    return list(
+        _iter_tokens(
+            reader,
+            compiled,
+            source,
+            compiled.byte_classes.__getitem__,
+            ASCII_WHITE_SPACE.__getitem__,
+            white_space_delimit,
+            memoize_failures,
+        )
+    )
 
 
 def tokenize(
     input_stream: Union[io.TextIOBase, io.StringIO],
-    tokenizing_dfa: DFA,
+    tokenizing_dfa: Union[DFA, LazyDFA, CompiledDFA],
     white_space_delimit=False,
-):
+) -> List[TokenMatch]:
     """
     Performs simplified maximal munch on the input stream
     """
-    last_accepting_state: Optional[DFAState] = None
-    curr_state: DFAState = tokenizing_dfa.start_state
-    tokens: List[Token] = []
-    curr_lexme: List[str] = []  # lexme is stored in list for fast concat
-    reader = LexerStreamReader(input_stream, ignore_white_space=not white_space_delimit)
-
-    def resolve_transition_error():
-        nonlocal last_accepting_state
-        nonlocal reader
-        nonlocal curr_state
-
-        if last_accepting_state is not None:
-            reader.backtrack()
-            resolve_token()
-            last_accepting_state = None
-            curr_state = tokenizing_dfa.start_state
-        else:
-            raise LexicalError(reader=reader)
+    return list(iter_tokens(input_stream, tokenizing_dfa, white_space_delimit))
 
-    def resolve_token():
-        nonlocal curr_lexme
-        nonlocal tokens
 
-        if curr_lexme:
-            token_content = "".join(curr_lexme)
-            try:
-                tokens.append(
-                    deepcopy(last_accepting_state.resolve_token(token_content))
-                )
-            except TokenResolutionError as err:
-                raise LexicalError(message="TokenResolutionError", reader=reader)
+def iter_tokens(
+    input_stream: Union[io.TextIOBase, io.StringIO],
+    tokenizing_dfa: Union[DFA, LazyDFA, CompiledDFA],
+    white_space_delimit=False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    memoize_failures=False,
+) -> Iterator[TokenMatch]:
+    """
+    Performs simplified maximal munch on the input stream, yielding tokens as
+    they are found. The stream is read in chunks of chunk_size characters and
+    only the current token is kept around for backtracking.
 
-            curr_lexme = []
+    White space between tokens is skipped, and inside them too unless
+    white_space_delimit is set. A spec with skip tokens (Token(..., skip=True))
+    describes white space itself instead: no characters are skipped,
+    white_space_delimit has no effect and skip tokens are matched but dropped.
+
+    Backtracking can rescan the same characters many times (quadratic time on
+    inputs like "aaaa..." with tokens a and a*b). With memoize_failures, every
+    (state, position) pair seen after the last accepting state of a scan is
+    remembered as failed and later scans stop as soon as they reach one, which
+    bounds the whole run to linear time (Reps' algorithm)
+    """
+    compiled = tokenizing_dfa.compile()
+    reader = BufferedLexerReader(input_stream, chunk_size)
+    # the stream isn't kept, so each token stores its own lexeme and position,
+    # the reader only indexes the lines that are still buffered
+    source = TokenSource(compiled.token_kinds, ())
+    return _iter_tokens(
+        reader,
+        compiled,
+        source,
+        compiled.char_class,
+        str.isspace,
+        white_space_delimit,
+        memoize_failures,
+    )
+
+
+def _iter_tokens(
+    reader: Union[BufferedLexerReader, ByteLexerReader],
+    compiled: Union[CompiledDFA, LazyDFA],
+    source: TokenSource,
+    char_class: Callable,
+    is_space: Callable,
+    white_space_delimit: bool,
+    memoize_failures: bool,
+    start: int = 0,
+    scan_ends: Optional[array] = None,
+) -> Iterator[TokenMatch]:
+    """
+    Maximal munch over reader.buffer, which holds characters or bytes.
+    char_class and is_space take one element of it. Lexing begins at offset
+    start, which must be in the buffer. If scan_ends is given, the offset
+    just past the last character each token's scan looked at (end of input
+    counts as one) is appended to it as tokens are yielded, covering the
+    scans of skip tokens dropped before each one too
+    """
+    transitions = compiled.transitions
+    num_classes = compiled.num_classes
+    accepting = compiled.accepting
+    state_kinds = compiled.state_kinds
+    skip_kinds = compiled.skip_kinds
+    # skip tokens replace the built in white space handling
+    implicit_white_space = not compiled.has_skip_tokens
+    start_state: int = compiled.start_state
+    store_lexmes = source.text is None
+
+    buffer: str = reader.buffer
+    buffer_start: int = reader.buffer_start
+    # position in buffer of the next character to read
+    position = start - buffer_start
+
+    # absolute position -> bitset of states known not to reach an accepting state
+    failed_states: Dict[int, int] = dict()
+    failed_before = start
+    # a LazyDFA's cache may be flushed or switched off, which a memo can't survive
+    memoizing = memoize_failures
+    lazy = compiled if isinstance(compiled, LazyDFA) else None
+    seen_flushes = lazy.cache_flushes if lazy is not None else 0
+    # characters run through the table that a LazyDFA hasn't been told about,
+    # and where in the current scan counting them resumes
+    scanned = 0
+    furthest_scan = 0
 
     while True:
-        transition_char = reader.next()
+        # skip white space between tokens
+        while True:
+            if position == len(buffer):
+                if not reader.fill(buffer_start + position):
+                    return
+                buffer, buffer_start, position = reader.buffer, reader.buffer_start, 0
+            if not implicit_white_space or not is_space(buffer[position]):
+                break
+            position += 1
+
+        token_start = position
+        curr_state = start_state
+        # a LazyDFA may recycle state ids, so keep the token kind rather than the state
+        last_accepting_kind = NO_KIND
+        accepted = False
+        last_accepting_end = position
+        skipped_white_space = False
+        scan_mark = position
+        memo_hit = False
 
-        if transition_char.isspace():
-            if curr_state != tokenizing_dfa.start_state:
-                resolve_transition_error()
+        if memoize_failures:
+            # scans never go back before the token start, so forget older failures
+            while failed_before < buffer_start + token_start:
+                failed_states.pop(failed_before, None)
+                failed_before += 1
+            since_accepting: List[Tuple[int, int]] = []
 
-            while transition_char.isspace():
-                transition_char = reader.next()
+        while True:
+            if position == len(buffer):
+                if not reader.fill(buffer_start + token_start):
+                    break
+                shift = reader.buffer_start - buffer_start
+                buffer, buffer_start = reader.buffer, reader.buffer_start
+                token_start -= shift
+                last_accepting_end -= shift
+                scan_mark -= shift
+                position -= shift
 
-        if transition_char == EOF:
-            if reader.mark_at_end():
-                # reached EOF and tokenized entire stream
-                resolve_token()
+            transition_char = buffer[position]
+            if implicit_white_space and is_space(transition_char):
+                if white_space_delimit:
+                    break
+                skipped_white_space = True
+                position += 1
+                continue
+
+            transition_class = char_class(transition_char)
+            next_state = transitions[curr_state * num_classes + transition_class]
+            if next_state == UNKNOWN_STATE and lazy is not None:
+                next_state = lazy.fill(
+                    curr_state, transition_class, scanned + position - scan_mark
+                )
+                scanned, scan_mark = 0, position
+                if lazy.cache_flushes != seen_flushes:
+                    seen_flushes = lazy.cache_flushes
+                    if memoize_failures:
+                        # state ids were recycled, remembered failures are meaningless
+                        failed_states.clear()
+                        since_accepting.clear()
+                        # scratch states of nfa simulation can't be remembered at all
+                        memoizing = not lazy.simulating
+            if next_state == DEAD_STATE:
                 break
-            else:
-                resolve_transition_error()
-        else:
-            if transition_char in curr_state.transitions:
-                curr_state = curr_state.transitions[transition_char]
-                curr_lexme.append(transition_char)
-                if curr_state.accepting:
-                    last_accepting_state = curr_state
-                    reader.mark()
-            else:
-                resolve_transition_error()
-
-    return tokens
+
+            curr_state = next_state
+            position += 1
+            if accepting[curr_state]:
+                last_accepting_kind = state_kinds[curr_state]
+                accepted = True
+                last_accepting_end = position
+                if memoizing:
+                    since_accepting.clear()
+            elif memoizing:
+                absolute_position = buffer_start + position
+                if failed_states.get(absolute_position, 0) >> curr_state & 1:
+                    memo_hit = True
+                    break
+                since_accepting.append((absolute_position, curr_state))
+
+        scanned += position - scan_mark
+        if memoize_failures:
+            for absolute_position, state in since_accepting:
+                failed_states[absolute_position] = (
+                    failed_states.get(absolute_position, 0) | 1 << state
+                )
+
+        if not accepted:
+            if memo_hit:
+                # the memo only knows the scan fails, scan again without it to
+                # report the error where the scan really stops
+                position = token_start
+                memoizing = False
+                continue
+            reader.error_position = buffer_start + position
+            raise LexicalError(reader=reader)
+
+        if last_accepting_kind == NO_KIND:
+            # accepting, but no token was attached to the expression
+            reader.error_position = buffer_start + token_start
+            raise LexicalError(message="TokenResolutionError", reader=reader)
+
+        if scan_ends is not None:
+            furthest_scan = max(furthest_scan, buffer_start + position + 1)
+
+        if skip_kinds[last_accepting_kind]:
+            position = last_accepting_end
+            continue
+
+        lexme: Optional[str] = None
+        token_position: Optional[Tuple[int, int]] = None
+        if store_lexmes:
+            lexme = buffer[token_start:last_accepting_end]
+            if skipped_white_space:
+                lexme = "".join(char for char in lexme if not char.isspace())
+            token_position = reader.position(buffer_start + token_start)
+
+        if scan_ends is not None:
+            scan_ends.append(furthest_scan)
+            furthest_scan = 0
+
+        position = last_accepting_end
+        yield TokenMatch(
+            last_accepting_kind,
+            buffer_start + token_start,
+            buffer_start + last_accepting_end,
+            source,
+            lexme,
+            token_position,
+        )
@@ -1,24 +1,53 @@
 from abc import ABC
-from functools import reduce
-from copy import deepcopy
-from typing import List
-
+from typing import List, Optional, Tuple
+
+from langtools.lexer.regex import (
+    Regex,
+    CharExpr,
+    CharSetExpr,
+    EpsilonExpr,
+    UnionExpr,
+    ConcatExpr,
+    KleeneStarExpr,
+    TokenExpr,
+    compile_nfa,
+)
+from langtools.lexer.intervals import negate_intervals, normalize_intervals
 from langtools.lexer.state import NFAState
 from langtools.lexer.token import Token
 
 
 class NFA(ABC):
-    def __init__(
-        self,
-        start_state: NFAState,
-        end_state: NFAState,
-        alphabet,
-        states: List[NFAState],
-    ):
-        self.start_state = start_state
-        self.end_state = end_state
-        self.alphabet = alphabet
-        self.states = states
+    """
+    Composable description of a regular language. Each NFA wraps an immutable
+    Regex expression, the actual states are only built when first accessed
+    (normally by DFA), so composing NFAs never copies states
+    """
+
+    def __init__(self, expr: Regex):
+        self.expr = expr
+        self._compiled: Optional[Tuple[NFAState, NFAState, List[NFAState]]] = None
+
+    def _compile(self) -> Tuple[NFAState, NFAState, List[NFAState]]:
+        if self._compiled is None:
+            self._compiled = compile_nfa(self.expr)
+        return self._compiled
+
+    @property
+    def start_state(self) -> NFAState:
+        return self._compile()[0]
+
+    @property
+    def end_state(self) -> NFAState:
+        return self._compile()[1]
+
+    @property
+    def states(self) -> List[NFAState]:
+        return self._compile()[2]
+
+    @property
+    def alphabet(self):
+        return self.expr.alphabet
 
     def visualize(self):
         state_ids = dict()
@@ -51,135 +80,78 @@ class NFA(ABC):
                     )
 
     def add_token(self, new_token: Token):
-        self.end_state.tokens.add(new_token)
+        self.expr = TokenExpr(self.expr, new_token)
+        self._compiled = None
 
 
 class Atom(NFA):
     def __init__(self, char):
-        start_state = NFAState()
-        end_state = NFAState(accepting=True)
-        super().__init__(
-            start_state=start_state,
-            end_state=end_state,
-            alphabet=frozenset(char),
-            states=[start_state, end_state],
-        )
+        super().__init__(CharExpr(char))
         self.transition_char = char
-        self.start_state.add_transition(
-            transition_char=char, target_state=self.end_state
-        )
 
 
-class Epsilon(NFA):
-    def __init__(self):
-        start_state = end_state = NFAState(accepting=True)
-        super().__init__(
-            start_state=start_state,
-            end_state=end_state,
-            alphabet=frozenset(),
-            states=[start_state],
-        )
+class CharRange(NFA):
+    def __init__(self, low: str, high: str):
 
+        if ord(low) > ord(high):
+            raise Exception("CharRange low must not come after high")
 
-class Union(NFA):
-    def __init__(self, *operands, close=True):
+        super().__init__(CharSetExpr(((ord(low), ord(high)),)))
 
-        if len(operands) < 2:
-            raise Exception("Union must be passed >= 2 operands")
 
-        operands = [deepcopy(operand) for operand in operands]
+class CharClass(NFA):
+    """
+    Recognizes one character from its members, each either a string (every
+    character of it is included) or a (low, high) pair of characters. With
+    negated=True it recognizes any character except those
+    """
 
-        collective_alphabet = frozenset().union(
-            *[operand.alphabet for operand in operands]
-        )
+    def __init__(self, *members, negated=False):
 
-        start_state = NFAState()
-        end_state = NFAState(accepting=True)
+        intervals = []
+        for member in members:
+            if isinstance(member, tuple):
+                low, high = member
+                if ord(low) > ord(high):
+                    raise Exception("CharClass range low must not come after high")
+                intervals.append((ord(low), ord(high)))
+            else:
+                intervals.extend((ord(char), ord(char)) for char in member)
 
-        states = (
-            [start_state]
-            + reduce(lambda a, b: a + b, [operand.states for operand in operands])
-            + [end_state]
-        )
+        if negated:
+            intervals = negate_intervals(intervals)
+        else:
+            intervals = normalize_intervals(intervals)
 
-        super().__init__(
-            start_state=start_state,
-            end_state=end_state,
-            alphabet=collective_alphabet,
-            states=states,
-        )
+        if not intervals:
+            raise Exception("CharClass must recognize at least one character")
 
-        for operand in operands:
-            start_state.add_transition(
-                transition_char="", target_state=operand.start_state
-            )
-            if close:
-                operand.end_state.add_transition(
-                    transition_char="", target_state=end_state
-                )
-                operand.end_state.accepting = False
+        super().__init__(CharSetExpr(intervals))
 
 
-class Concat(NFA):
-    def __init__(self, *operands):
+class Epsilon(NFA):
+    def __init__(self):
+        super().__init__(EpsilonExpr())
 
-        if len(operands) < 2:
-            raise Exception("Concat must be passed >= 2 operands")
 
-        operands = [deepcopy(operand) for operand in operands]
-        collective_alphabet = frozenset().union(
-            *[operand.alphabet for operand in operands]
-        )
+class Union(NFA):
+    def __init__(self, *operands, close=True):
 
-        start_state = NFAState()
-        end_state = NFAState(accepting=True)
+        if len(operands) < 2:
+            raise Exception("Union must be passed >= 2 operands")
 
-        states = (
-            [start_state]
-            + reduce(lambda a, b: a + b, [operand.states for operand in operands])
-            + [end_state]
-        )
+        super().__init__(UnionExpr(tuple(operand.expr for operand in operands), close))
 
-        super().__init__(
-            start_state=start_state,
-            end_state=end_state,
-            alphabet=collective_alphabet,
-            states=states,
-        )
 
-        start_state.add_transition(
-            transition_char="", target_state=operands[0].start_state
-        )
+class Concat(NFA):
+    def __init__(self, *operands):
 
-        for i in range(len(operands) - 1):
-            bridge_state = NFAState(tag="B")
-            self.states.append(bridge_state)
-            operands[i].end_state.add_transition("", bridge_state)
-            operands[i].end_state.accepting = False
-            bridge_state.add_transition("", operands[i + 1].start_state)
+        if len(operands) < 2:
+            raise Exception("Concat must be passed >= 2 operands")
 
-        operands[-1].end_state.accepting = False
-        operands[-1].end_state.add_transition(
-            transition_char="", target_state=end_state
-        )
+        super().__init__(ConcatExpr(tuple(operand.expr for operand in operands)))
 
 
 class KleeneStar(NFA):
     def __init__(self, operand):
-
-        operand = deepcopy(operand)
-
-        start_state = end_state = NFAState(accepting=True, tag="KS")
-
-        states = [start_state] + operand.states
-
-        super().__init__(
-            start_state=start_state,
-            end_state=end_state,
-            alphabet=operand.alphabet,
-            states=states,
-        )
-
-        start_state.add_transition(transition_char="", target_state=operand.start_state)
-        operand.end_state.add_transition(transition_char="", target_state=end_state)
-        operand.end_state.accepting = False
+        super().__init__(KleeneStarExpr(operand.expr))
@@ -0,0 +1,246 @@
+import os
+from array import array
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Deque, Iterator, List, Optional, Tuple, Union
+
+from langtools.lexer.compiled import CompiledDFA
+from langtools.lexer.dfa import DFA
+from langtools.lexer.exceptions import LexicalError
+from langtools.lexer.lexer import ASCII_WHITE_SPACE, _iter_tokens
+from langtools.lexer.token import TokenMatch, TokenSource
+from langtools.lexer.utils import BufferedLexerReader, ByteLexerReader
+
+DEFAULT_PARALLEL_CHUNK_SIZE = 1 << 22
+
+
+class _SliceEnd(Exception):
+    """
+    A token needed input past the end of the slice a worker was given
+    """
+
+
+class _StrSliceReader(BufferedLexerReader):
+    def fill(self, keep_from: int) -> bool:
+        raise _SliceEnd
+
+
+class _ByteSliceReader(ByteLexerReader):
+    def fill(self, keep_from: int) -> bool:
+        raise _SliceEnd
+
+
+# set once per worker process by _init_worker
+_worker_dfa: Optional[CompiledDFA] = None
+
+
+def _init_worker(compiled: CompiledDFA) -> None:
+    global _worker_dfa
+    _worker_dfa = compiled
+
+
+def _lex_chunk(
+    text_slice, slice_start: int, chunk_end: int, final: bool, white_space_delimit: bool
+) -> Tuple[array, array, array, array]:
+    """
+    Speculatively lexes text_slice as if a token started at its beginning.
+    Returns (kinds, starts, lengths, ends) of the tokens that start before
+    chunk_end, offsets absolute. It stops early at a token that runs past the slice or
+    at a lexical error (the run may have started in the middle of a token),
+    stitching lexes on from there
+    """
+    compiled = _worker_dfa
+    if compiled is None:
+        raise Exception("_lex_chunk only runs in workers set up by _init_worker")
+    reader: Union[BufferedLexerReader, ByteLexerReader]
+    char_class: Callable
+    is_space: Callable
+    if isinstance(text_slice, str):
+        reader = (BufferedLexerReader if final else _StrSliceReader).from_string(
+            text_slice
+        )
+        char_class, is_space = compiled.char_class, str.isspace
+    else:
+        reader = (ByteLexerReader if final else _ByteSliceReader)(text_slice)
+        char_class, is_space = (
+            compiled.byte_classes.__getitem__,
+            ASCII_WHITE_SPACE.__getitem__,
+        )
+    source = TokenSource(
+        compiled.token_kinds,
+        reader.line_starts,
+        text_slice,
+        not compiled.has_skip_tokens,
+    )
+
+    kinds, starts, lengths, ends = array("i"), array("q"), array("q"), array("q")
+    try:
+        for token in _iter_tokens(
+            reader, compiled, source, char_class, is_space, white_space_delimit, False
+        ):
+            if token.start + slice_start >= chunk_end:
+                break
+            kinds.append(token.kind)
+            starts.append(token.start + slice_start)
+            lengths.append(token.end - token.start)
+            ends.append(token.end + slice_start)
+    except (_SliceEnd, LexicalError):
+        pass
+
+    return kinds, starts, lengths, ends
+
+
+def tokenize_parallel(
+    input_data,
+    tokenizing_dfa: DFA,
+    max_workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_PARALLEL_CHUNK_SIZE,
+    lookahead: Optional[int] = None,
+    white_space_delimit=False,
+) -> List[TokenMatch]:
+    """
+    Tokenizes a large str (like tokenize_str) or UTF-8 bytes (like
+    tokenize_bytes, with a DFA built with utf8=True) across a process pool,
+    returning exactly the tokens the sequential lexer would.
+
+    The input is cut into chunks of chunk_size and every worker lexes its
+    chunk (plus up to lookahead more) as if a token started at the cut.
+    Maximal munch from a given offset always produces the same tokens, so
+    once a real token ends where one of a worker's tokens did, the rest of
+    that worker's tokens are correct. The stitching step lexes sequentially
+    until that happens, which is normally within a token or two of each cut
+    """
+    compiled = tokenizing_dfa.compile()
+    if not isinstance(compiled, CompiledDFA):
+        raise Exception(
+            "tokenize_parallel needs a DFA, a LazyDFA's tables are per process"
+        )
+
+    if isinstance(input_data, memoryview):
+        input_data = input_data.cast("B")
+    reader: Union[BufferedLexerReader, ByteLexerReader]
+    char_class: Callable
+    is_space: Callable
+    if isinstance(input_data, str):
+        reader = BufferedLexerReader.from_string(input_data)
+        char_class, is_space = compiled.char_class, str.isspace
+    else:
+        reader = ByteLexerReader(input_data)
+        char_class, is_space = (
+            compiled.byte_classes.__getitem__,
+            ASCII_WHITE_SPACE.__getitem__,
+        )
+    source = TokenSource(
+        compiled.token_kinds,
+        reader.line_starts,
+        input_data,
+        not compiled.has_skip_tokens,
+    )
+
+    def sequential(start: int) -> Iterator[TokenMatch]:
+        return _iter_tokens(
+            reader,
+            compiled,
+            source,
+            char_class,
+            is_space,
+            white_space_delimit,
+            False,
+            start,
+        )
+
+    input_length = len(input_data)
+    if input_length <= chunk_size:
+        return list(sequential(0))
+
+    if lookahead is None:
+        lookahead = chunk_size // 4
+    max_workers = max_workers or os.cpu_count() or 1
+    chunk_starts = range(0, input_length, chunk_size)
+
+    tokens: List[TokenMatch] = []
+    # offset the next token is lexed from, the end of the last token
+    position = 0
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_init_worker, initargs=(compiled,)
+    ) as executor:
+        # a bounded number of chunks in flight keeps memory flat on huge inputs
+        pending: Deque[Tuple[int, Future]] = deque()
+        next_chunk = 0
+
+        while next_chunk < len(chunk_starts) or pending:
+            while next_chunk < len(chunk_starts) and len(pending) < 2 * max_workers:
+                chunk_start = chunk_starts[next_chunk]
+                chunk_end = min(chunk_start + chunk_size, input_length)
+                slice_end = min(chunk_end + lookahead, input_length)
+                pending.append(
+                    (
+                        chunk_end,
+                        executor.submit(
+                            _lex_chunk,
+                            input_data[chunk_start:slice_end],
+                            chunk_start,
+                            chunk_end,
+                            slice_end == input_length,
+                            white_space_delimit,
+                        ),
+                    )
+                )
+                next_chunk += 1
+
+            chunk_end, future = pending.popleft()
+            position = _stitch_chunk(
+                tokens, source, sequential, position, chunk_end, *future.result()
+            )
+
+    return tokens
+
+
+def _stitch_chunk(
+    tokens: List[TokenMatch],
+    source: TokenSource,
+    sequential,
+    position: int,
+    chunk_end: int,
+    kinds: array,
+    starts: array,
+    lengths: array,
+    ends: array,
+) -> int:
+    """
+    Extends tokens with the real tokens starting before chunk_end, taking them
+    from a worker's speculative run once it lines up. position is the end of
+    the last real token, the new one is returned
+    """
+    runner: Optional[Iterator[TokenMatch]] = None
+    synced = False
+
+    while position < chunk_end:
+        if not synced:
+            index = bisect_left(ends, position)
+            if index < len(ends) and ends[index] == position:
+                # lexing continues from here just like it did in the worker
+                index += 1
+                tokens.extend(
+                    TokenMatch.from_spans(
+                        kinds[index:], starts[index:], lengths[index:], source
+                    )
+                )
+                if index < len(ends):
+                    position = ends[-1]
+                # the worker's run may have stopped short of chunk_end
+                synced = True
+                runner = None
+                continue
+
+        if runner is None:
+            runner = sequential(position)
+        token = next(runner, None)
+        if token is None:
+            break
+        tokens.append(token)
+        position = token.end
+
+    return position
@@ -0,0 +1,617 @@
+import re
+from bisect import bisect_right
+from collections import deque
+from functools import lru_cache
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from langtools.lexer.compiled import CompiledDFA
+from langtools.lexer.dfa import DFA
+from langtools.lexer.exceptions import LexicalError, UnsupportedSpecError
+from langtools.lexer.intervals import (
+    MAX_CODE_POINT,
+    boundary_points,
+    normalize_intervals,
+)
+from langtools.lexer.lexer import _iter_tokens
+from langtools.lexer.nfa import NFA
+from langtools.lexer.regex import (
+    CharExpr,
+    CharSetExpr,
+    ConcatExpr,
+    EpsilonExpr,
+    KleeneStarExpr,
+    Regex,
+    TokenExpr,
+    UnionExpr,
+)
+from langtools.lexer.state import select_token
+from langtools.lexer.token import Token, TokenMatch, TokenSource
+from langtools.lexer.utils import BufferedLexerReader, LazyLineStarts
+
+# verification gives up, and the spec is refused, past this many states
+MAX_VERIFIED_STATES = 20000
+
+_WHITE_SPACE = re.compile(r"\s*")
+
+# instructions of the backtracking order program, see _Program
+_CHAR, _SPLIT, _MATCH = range(3)
+
+
+@lru_cache(maxsize=None)
+def _white_space_intervals() -> Tuple[Tuple[int, int], ...]:
+    """
+    Code points str.isspace accepts, which are also the ones re's \\s matches
+    """
+    return tuple(
+        (code_point, code_point)
+        for code_point in range(MAX_CODE_POINT + 1)
+        if chr(code_point).isspace()
+    )
+
+
+def _subtract_intervals(intervals, removed) -> Tuple[Tuple[int, int], ...]:
+    remaining: List[Tuple[int, int]] = []
+    for low, high in intervals:
+        for removed_low, removed_high in removed:
+            if removed_high < low or removed_low > high:
+                continue
+            if removed_low > low:
+                remaining.append((low, removed_low - 1))
+            low = removed_high + 1
+            if low > high:
+                break
+        if low <= high:
+            remaining.append((low, high))
+    return tuple(remaining)
+
+
+def _char_set_pattern(intervals: Sequence[Tuple[int, int]]) -> str:
+    if not intervals:
+        # a character set left empty once white space is taken out
+        return "(?!)"
+    if len(intervals) == 1 and intervals[0][0] == intervals[0][1]:
+        return re.escape(chr(intervals[0][0]))
+    ranges = "".join(
+        (
+            re.escape(chr(low))
+            if low == high
+            else f"{re.escape(chr(low))}-{re.escape(chr(high))}"
+        )
+        for low, high in intervals
+    )
+    return f"[{ranges}]"
+
+
+def _nullable(expr: Regex) -> bool:
+    if isinstance(expr, (CharExpr, CharSetExpr)):
+        return False
+    if isinstance(expr, ConcatExpr):
+        return all(_nullable(child) for child in expr.children)
+    if isinstance(expr, UnionExpr):
+        return any(_nullable(child) for child in expr.children)
+    return True
+
+
+def _token_alternatives(expr: Regex) -> List[Tuple[Regex, Token]]:
+    """
+    Splits a spec into its (expression, token) alternatives, in order. Only
+    unions of token expressions are accepted at the top, token expressions
+    nested anywhere else have no re equivalent
+    """
+    if isinstance(expr, UnionExpr):
+        return [
+            alternative
+            for child in expr.children
+            for alternative in _token_alternatives(child)
+        ]
+    if not isinstance(expr, TokenExpr):
+        raise UnsupportedSpecError(f"{expr!r} is matched without a token")
+
+    tokens = set()
+    while isinstance(expr, TokenExpr):
+        tokens.add(expr.token)
+        expr = expr.children[0]
+    token = select_token(tokens)
+    if token is None:
+        raise UnsupportedSpecError(f"{expr!r} is matched without a token")
+
+    for node in expr.walk():
+        if isinstance(node, TokenExpr):
+            raise UnsupportedSpecError(f"token {token.name} has tokens nested in it")
+        if isinstance(node, UnionExpr) and not node.close:
+            raise UnsupportedSpecError(
+                f"token {token.name} has a union with close=False nested in it"
+            )
+        if isinstance(node, KleeneStarExpr) and _nullable(node.children[0]):
+            # re stops repeating on an empty iteration, a DFA doesn't care
+            raise UnsupportedSpecError(
+                f"token {token.name} repeats an expression that matches nothing"
+            )
+    if _nullable(expr):
+        raise UnsupportedSpecError(f"token {token.name} matches the empty string")
+
+    return [(expr, token)]
+
+
+class _Program:
+    """
+    The alternatives as a list of instructions whose threads, run in order,
+    follow the same priorities re's backtracking does: union operands left
+    to right, one more repetition of a star before leaving it, and earlier
+    alternatives before later ones
+    """
+
+    def __init__(self, alternatives: List[Tuple[Regex, Token]], leaf_intervals):
+        # (_CHAR, intervals, next), (_SPLIT, targets in order, None) or
+        # (_MATCH, alternative, None)
+        self.ops: List[tuple] = []
+        self.leaf_intervals = leaf_intervals
+        self.starts = []
+        for alternative, (expr, _) in enumerate(alternatives):
+            self.ops.append((_MATCH, alternative, None))
+            self.starts.append(self._emit(expr, len(self.ops) - 1))
+
+    def _emit(self, expr: Regex, next_op: int) -> int:
+        """
+        Emits expr followed by next_op, returns the instruction it starts at
+        """
+        if isinstance(expr, (CharExpr, CharSetExpr)):
+            self.ops.append((_CHAR, self.leaf_intervals(expr), next_op))
+            return len(self.ops) - 1
+        if isinstance(expr, EpsilonExpr):
+            return next_op
+        if isinstance(expr, ConcatExpr):
+            for child in reversed(expr.children):
+                next_op = self._emit(child, next_op)
+            return next_op
+        if isinstance(expr, UnionExpr):
+            targets = tuple(self._emit(child, next_op) for child in expr.children)
+            self.ops.append((_SPLIT, targets, None))
+            return len(self.ops) - 1
+        # KleeneStarExpr, the split's targets are filled in once its body exists
+        loop = len(self.ops)
+        self.ops.append((_SPLIT, (), None))
+        self.ops[loop] = (_SPLIT, (self._emit(expr.children[0], loop), next_op), None)
+        return loop
+
+    def closure(self, ops: Sequence[int]) -> Tuple[int, ...]:
+        """
+        Character and match instructions reachable from ops without reading,
+        in priority order, each only at its first (highest priority) place
+        """
+        seen = set()
+        closure: List[int] = []
+        stack = list(reversed(ops))
+        while stack:
+            op = stack.pop()
+            if op in seen:
+                continue
+            seen.add(op)
+            if self.ops[op][0] == _SPLIT:
+                stack.extend(reversed(self.ops[op][1]))
+            else:
+                closure.append(op)
+        return tuple(closure)
+
+
+def _find_disagreement(
+    alternatives: List[Tuple[Regex, Token]], leaf_intervals
+) -> Optional[str]:
+    """
+    A text on which re's first match of the alternatives differs in length
+    or token from maximal munch with token priorities, None if there is none.
+
+    The program is run both ways at once over every input: a priority ordered
+    list of threads where a match discards the lower priority threads (what
+    backtracking finds), and the set of every thread (what maximal munch
+    finds). The pairs reachable are finite, so exploring them all decides
+    whether the two ever disagree
+    """
+    program = _Program(alternatives, leaf_intervals)
+    ops = program.ops
+
+    points = boundary_points(
+        (low, high, None) for op in ops if op[0] == _CHAR for low, high in op[1]
+    )
+    # symbols are the intervals between points, each char op reads a set of them
+    reads: Dict[int, FrozenSet[int]] = dict()
+    for index, op in enumerate(ops):
+        if op[0] == _CHAR:
+            reads[index] = frozenset(
+                symbol
+                for low, high in op[1]
+                for symbol in range(
+                    bisect_right(points, low) - 1, bisect_right(points, high)
+                )
+            )
+
+    def token_of(matches: List[int]) -> Optional[Token]:
+        if not matches:
+            return None
+        return select_token({alternatives[ops[op][1]][1] for op in matches})
+
+    def advance(threads: Tuple[int, ...], symbol: int) -> Tuple[int, ...]:
+        return program.closure(
+            [
+                ops[op][2]
+                for op in threads
+                if ops[op][0] == _CHAR and symbol in reads[op]
+            ]
+        )
+
+    def settle(ordered: Tuple[int, ...], every: Tuple[int, ...], agreed: bool):
+        # the threads still alive after this position and whether both ways
+        # would return the same token if the input ended here
+        longest = token_of([op for op in every if ops[op][0] == _MATCH])
+        first_match = next(
+            (index for index, op in enumerate(ordered) if ops[op][0] == _MATCH), None
+        )
+        if first_match is not None:
+            first = alternatives[ops[ordered[first_match]][1]][1]
+            ordered = ordered[:first_match]
+            agreed = longest is not None and first.name == longest.name
+        elif longest is not None:
+            agreed = False
+        alive = frozenset(op for op in every if ops[op][0] == _CHAR)
+        return ordered, alive, agreed
+
+    start = program.closure(program.starts)
+    start_state = settle(start, start, True)
+    # state -> (state it was reached from, character read), None for the start
+    parents: Dict[tuple, Optional[Tuple[tuple, str]]] = {start_state: None}
+    queue = deque([start_state])
+    while queue:
+        state = queue.popleft()
+        ordered, alive, agreed = state
+        if not agreed:
+            witness = []
+            parent = parents[state]
+            while parent is not None:
+                state, char = parent
+                witness.append(char)
+                parent = parents[state]
+            return "".join(reversed(witness))
+
+        symbols = sorted({symbol for op in alive for symbol in reads[op]})
+        for symbol in symbols:
+            every = advance(tuple(alive), symbol)
+            next_state = settle(advance(ordered, symbol), every, agreed)
+            if next_state not in parents:
+                if len(parents) >= MAX_VERIFIED_STATES:
+                    raise UnsupportedSpecError(
+                        "spec is too large to verify against maximal munch"
+                    )
+                parents[next_state] = (state, chr(points[symbol]))
+                queue.append(next_state)
+
+    return None
+
+
+def _first_intervals(expr: Regex, leaf_intervals) -> List[Tuple[int, int]]:
+    """
+    Code points a match of expr can start with
+    """
+    if isinstance(expr, (CharExpr, CharSetExpr)):
+        return list(leaf_intervals(expr))
+    if isinstance(expr, ConcatExpr):
+        intervals = []
+        for child in expr.children:
+            intervals.extend(_first_intervals(child, leaf_intervals))
+            if not _nullable(child):
+                break
+        return intervals
+    return [
+        interval
+        for child in expr.children
+        for interval in _first_intervals(child, leaf_intervals)
+    ]
+
+
+class RegexLexer:
+    """
+    Lexer that runs a spec with Python's re module instead of a DFA, returning
+    the same tokens and errors as tokenize_str (and tokenize with
+    white_space_delimit). Every token of the spec is translated to a pattern
+    and each translation is verified: re stops at the first way a pattern
+    matches while maximal munch wants the longest, so specs where the two can
+    ever differ, or that can't be translated at all, raise
+    UnsupportedSpecError.
+
+    When the whole spec, as one alternation in priority order, provably gives
+    the maximal munch token, every token is found with one re call (combined
+    is True). Otherwise each token that can start at a position is tried and
+    the longest match wins, ties going to the higher priority token.
+
+    The DFA is still built, for token priorities and for reporting errors:
+    once re finds no token, the DFA lexes from there to raise the same
+    LexicalError tokenize_str would
+    """
+
+    def __init__(self, spec: NFA, tokenizing_dfa: Optional[DFA] = None):
+        self.dfa = tokenizing_dfa or DFA(spec)
+        self.compiled = self.dfa.compile()
+        # a spec with skip tokens says what white space is, otherwise it is
+        # never part of a token, it is skipped or ends the token
+        self.implicit_white_space = not self.compiled.has_skip_tokens
+
+        # in priority order, which is the order the combined pattern tries them
+        self.alternatives = sorted(
+            _token_alternatives(spec.expr),
+            key=lambda alternative: alternative[1].priority,
+        )
+        self.kinds = list(self.compiled.token_kinds)
+        for _, token in self.alternatives:
+            if token.name not in self.kinds:
+                # shadowed by higher priority tokens everywhere, never produced
+                self.kinds.append(token.name)
+        self.skips = [False] * len(self.kinds)
+        for _, token in self.alternatives:
+            self.skips[self.kinds.index(token.name)] = token.skip
+
+        for expr, token in self.alternatives:
+            witness = _find_disagreement([(expr, token)], self._leaf_intervals)
+            if witness is not None:
+                raise UnsupportedSpecError(
+                    f"re matches token {token.name} differently from maximal munch"
+                    f" on {witness!r}"
+                )
+        try:
+            self.combined = (
+                _find_disagreement(self.alternatives, self._leaf_intervals) is None
+            )
+        except UnsupportedSpecError:
+            self.combined = False
+
+        # white_space_delimit -> compiled patterns, see _combined_matcher and
+        # _token_matchers
+        self._combined_matchers: Dict[bool, Tuple[Pattern[str], List[int]]] = dict()
+        self._token_matchers: Dict[
+            bool, List[Tuple[Callable, int, Tuple[Tuple[int, int], ...]]]
+        ] = dict()
+
+    def _leaf_intervals(
+        self, expr: Union[CharExpr, CharSetExpr]
+    ) -> Tuple[Tuple[int, int], ...]:
+        intervals: Tuple[Tuple[int, int], ...]
+        if isinstance(expr, CharExpr):
+            intervals = ((ord(expr.char), ord(expr.char)),)
+        else:
+            intervals = expr.intervals
+        if self.implicit_white_space:
+            return _subtract_intervals(intervals, _white_space_intervals())
+        return intervals
+
+    def _pattern(self, expr: Regex, leaf_prefix: str) -> str:
+        if isinstance(expr, (CharExpr, CharSetExpr)):
+            return leaf_prefix + _char_set_pattern(self._leaf_intervals(expr))
+        if isinstance(expr, EpsilonExpr):
+            return ""
+        if isinstance(expr, ConcatExpr):
+            return "".join(self._pattern(child, leaf_prefix) for child in expr.children)
+        if isinstance(expr, UnionExpr):
+            operands = [self._pattern(child, leaf_prefix) for child in expr.children]
+            return f"(?:{'|'.join(operands)})"
+        return f"(?:{self._pattern(expr.children[0], leaf_prefix)})*"
+
+    def patterns(self, white_space_delimit: bool = False) -> List[str]:
+        """
+        The pattern each token is matched with, in priority order
+        """
+        # white space inside a token is skipped unless it delimits tokens
+        skips_inside = self.implicit_white_space and not white_space_delimit
+        leaf_prefix = r"\s*" if skips_inside else ""
+        return [self._pattern(expr, leaf_prefix) for expr, _ in self.alternatives]
+
+    def _combined_matcher(
+        self, white_space_delimit: bool
+    ) -> Tuple[Pattern[str], List[int]]:
+        """
+        The combined pattern and each group's kind
+        """
+        white_space_delimit = white_space_delimit and self.implicit_white_space
+        if white_space_delimit not in self._combined_matchers:
+            groups = "|".join(
+                f"({pattern})" for pattern in self.patterns(white_space_delimit)
+            )
+            prefix = r"\s*" if self.implicit_white_space else ""
+            # group 0 is the whole match, lastindex is the alternative's group
+            self._combined_matchers[white_space_delimit] = (
+                re.compile(f"{prefix}(?:{groups})"),
+                [-1, *self._alternative_kinds()],
+            )
+        return self._combined_matchers[white_space_delimit]
+
+    def _token_matchers_for(
+        self, white_space_delimit: bool
+    ) -> List[Tuple[Callable, int, Tuple[Tuple[int, int], ...]]]:
+        """
+        Each token's match function, kind and first code points
+        """
+        white_space_delimit = white_space_delimit and self.implicit_white_space
+        if white_space_delimit not in self._token_matchers:
+            self._token_matchers[white_space_delimit] = [
+                (
+                    re.compile(pattern).match,
+                    kind,
+                    normalize_intervals(_first_intervals(expr, self._leaf_intervals)),
+                )
+                for pattern, kind, (expr, _) in zip(
+                    self.patterns(white_space_delimit),
+                    self._alternative_kinds(),
+                    self.alternatives,
+                )
+            ]
+        return self._token_matchers[white_space_delimit]
+
+    def _alternative_kinds(self) -> List[int]:
+        return [self.kinds.index(token.name) for _, token in self.alternatives]
+
+    def tokenize(self, text: str, white_space_delimit=False) -> List[TokenMatch]:
+        """
+        Tokenizes a string held in memory, see tokenize_str. Tokens are the
+        same TokenMatch records, with kinds numbered as in the DFA
+        """
+        source = TokenSource(
+            self.kinds, LazyLineStarts(text), text, self.implicit_white_space
+        )
+        spans: Tuple[List[int], List[int], List[int]] = ([], [], [])
+        if self.combined:
+            position = self._scan_combined(text, white_space_delimit, *spans)
+        else:
+            position = self._scan_each(text, white_space_delimit, *spans)
+
+        if position != len(text):
+            # let the DFA raise the error, from the token re couldn't find
+            reader = BufferedLexerReader.from_string(text)
+            for _ in _iter_tokens(
+                reader,
+                self.compiled,
+                source,
+                self.compiled.char_class,
+                str.isspace,
+                white_space_delimit,
+                False,
+                position,
+            ):
+                pass
+            raise Exception(f"re found no token at {position} but the DFA did")
+
+        return list(TokenMatch.from_spans(*spans, source))
+
+    def _scan_combined(self, text, white_space_delimit, kinds, starts, lengths) -> int:
+        """
+        Appends tokens until the pattern stops matching, returns where it did
+        """
+        pattern, group_kinds = self._combined_matcher(white_space_delimit)
+        skips = self.skips
+        position = 0
+
+        match_at = pattern.match
+        match = match_at(text)
+        while match is not None:
+            group = match.lastindex
+            if group is None:
+                # an alternative's group is part of every match
+                break
+            kind = group_kinds[group]
+            position = match.end()
+            if not skips[kind]:
+                start = match.start(group)
+                kinds.append(kind)
+                starts.append(start)
+                lengths.append(position - start)
+            match = match_at(text, position)
+
+        if self.implicit_white_space:
+            # \s* always matches
+            white_space = _WHITE_SPACE.match(text, position)
+            if white_space is not None:
+                position = white_space.end()
+        return position
+
+    def _scan_each(self, text, white_space_delimit, kinds, starts, lengths) -> int:
+        """
+        Appends tokens until no token matches, returns where none did
+        """
+        matchers = self._token_matchers_for(white_space_delimit)
+        skips = self.skips
+        implicit_white_space = self.implicit_white_space
+        # character -> (match, kind) of every token that can start with it
+        candidates_of: Dict[str, tuple] = dict()
+        text_length = len(text)
+        position = 0
+
+        while True:
+            if implicit_white_space:
+                white_space = _WHITE_SPACE.match(text, position)
+                if white_space is not None:
+                    position = white_space.end()
+            if position == text_length:
+                return position
+
+            char = text[position]
+            candidates = candidates_of.get(char)
+            if candidates is None:
+                code_point = ord(char)
+                candidates = candidates_of[char] = tuple(
+                    (match, kind)
+                    for match, kind, first in matchers
+                    if any(low <= code_point <= high for low, high in first)
+                )
+
+            # the longest match wins, ties go to the earlier, higher priority, token
+            token_end = position
+            token_kind = -1
+            for match, kind in candidates:
+                found = match(text, position)
+                if found is not None and found.end() > token_end:
+                    token_end = found.end()
+                    token_kind = kind
+
+            if token_kind == -1:
+                return position
+            if not skips[token_kind]:
+                kinds.append(token_kind)
+                starts.append(position)
+                lengths.append(token_end - position)
+            position = token_end
+
+
+def _outcome(tokenize_text: Callable[..., Iterable[TokenMatch]], *args):
+    try:
+        return [
+            (token.name, token.start, token.end, token.lexme)
+            for token in tokenize_text(*args)
+        ]
+    except LexicalError as error:
+        return (error.error_line, error.error_col, str(error))
+
+
+def _tokenize_with_dfa(
+    compiled: CompiledDFA, text: str, white_space_delimit: bool
+) -> Iterator[TokenMatch]:
+    source = TokenSource(
+        compiled.token_kinds,
+        LazyLineStarts(text),
+        text,
+        not compiled.has_skip_tokens,
+    )
+    return _iter_tokens(
+        BufferedLexerReader.from_string(text, source.line_starts),
+        compiled,
+        source,
+        compiled.char_class,
+        str.isspace,
+        white_space_delimit,
+        False,
+    )
+
+
+def differential_check(
+    lexer: RegexLexer, texts: Iterable[str], white_space_delimit=False
+) -> List[str]:
+    """
+    Lexes every text with both lexer and its DFA, returns the texts where the
+    tokens or the LexicalError differ. Meant for tests and for checking a
+    spec on representative inputs before switching it to the re backend
+    """
+    mismatches = []
+    for text in texts:
+        expected = _outcome(
+            _tokenize_with_dfa, lexer.compiled, text, white_space_delimit
+        )
+        if _outcome(lexer.tokenize, text, white_space_delimit) != expected:
+            mismatches.append(text)
+    return mismatches
@@ -0,0 +1,342 @@
+import hashlib
+from abc import ABC, abstractmethod
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from weakref import WeakValueDictionary
+
+from langtools.lexer.state import NFAState
+from langtools.lexer.token import Token
+
+
+class Regex(ABC):
+    """
+    Immutable regular expression node. Nodes are hash-consed, so building the
+    same subexpression twice returns the same object and composing them is
+    cheap. NFA states are only created by compile_nfa
+    """
+
+    __slots__ = ("children", "_alphabet", "__weakref__")
+    # set once by _init, through object.__setattr__
+    children: Tuple["Regex", ...]
+    _alphabet: Optional[FrozenSet[str]]
+
+    _interned: "WeakValueDictionary[tuple, Regex]" = WeakValueDictionary()
+
+    def __new__(cls, *args):
+        key = (cls,) + args
+        node = Regex._interned.get(key)
+        if node is None:
+            node = super().__new__(cls)
+            object.__setattr__(node, "_alphabet", None)
+            node._init(*args)
+            Regex._interned[key] = node
+        return node
+
+    def _init(self, *args) -> None:
+        object.__setattr__(self, "children", ())
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __reduce__(self):
+        return (self.__class__, self._key_args())
+
+    def _key_args(self) -> tuple:
+        return ()
+
+    @property
+    def alphabet(self) -> FrozenSet[str]:
+        """
+        Literal characters used by the expression, character sets are not expanded
+        """
+        alphabet = self._alphabet
+        if alphabet is None:
+            chars = set()
+            for node in self.walk():
+                if isinstance(node, CharExpr):
+                    chars.add(node.char)
+            alphabet = frozenset(chars)
+            object.__setattr__(self, "_alphabet", alphabet)
+        return alphabet
+
+    def walk(self):
+        """
+        Yields every distinct node reachable from this one, shared nodes once
+        """
+        seen = {id(self)}
+        stack: List[Regex] = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            for child in node.children:
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    stack.append(child)
+
+    def _describe(self) -> str:
+        """
+        Parameters of this node other than its children, used for fingerprints
+        """
+        return ""
+
+    def _with_children(self, children: Tuple["Regex", ...]) -> "Regex":
+        """
+        The same node over different children, leaves return themselves
+        """
+        return self
+
+    def fingerprint(self) -> str:
+        """
+        Stable hex digest of the expression's structure and tokens. Unlike id
+        or hash it is the same across processes, so it can identify the spec a
+        saved DFA was built from
+        """
+        digests: Dict[int, bytes] = dict()
+        stack: List[Tuple[Regex, bool]] = [(self, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if id(node) in digests:
+                continue
+            if children_done:
+                digest = hashlib.sha256()
+                digest.update(f"{node.__class__.__name__}({node._describe()})".encode())
+                for child in node.children:
+                    digest.update(digests[id(child)])
+                digests[id(node)] = digest.digest()
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
+
+        return digests[id(self)].hex()
+
+    @abstractmethod
+    def _build(
+        self, operands: List[Tuple[NFAState, NFAState]], new_state
+    ) -> Tuple[NFAState, NFAState]:
+        """
+        Thompson fragment of this node, given its children's fragments
+        """
+
+
+class CharExpr(Regex):
+    __slots__ = ("char",)
+    char: str
+
+    def _init(self, char: str) -> None:
+        super()._init()
+        object.__setattr__(self, "char", char)
+
+    def _key_args(self) -> tuple:
+        return (self.char,)
+
+    def __repr__(self) -> str:
+        return f"Char({self.char!r})"
+
+    def _describe(self) -> str:
+        return repr(self.char)
+
+    def _build(self, operands, new_state):
+        start_state = new_state()
+        end_state = new_state(accepting=True)
+        start_state.add_transition(transition_char=self.char, target_state=end_state)
+        return start_state, end_state
+
+
+class CharSetExpr(Regex):
+    """
+    Matches any single character in a set of normalized, inclusive code point
+    intervals. Compiles to interval edges rather than one edge per character
+    """
+
+    __slots__ = ("intervals",)
+    intervals: Tuple[Tuple[int, int], ...]
+
+    def _init(self, intervals: Tuple[Tuple[int, int], ...]) -> None:
+        super()._init()
+        object.__setattr__(self, "intervals", intervals)
+
+    def _key_args(self) -> tuple:
+        return (self.intervals,)
+
+    def __repr__(self) -> str:
+        ranges = ", ".join(
+            f"{chr(low)!r}-{chr(high)!r}" for low, high in self.intervals
+        )
+        return f"CharSet({ranges})"
+
+    def _describe(self) -> str:
+        return repr(self.intervals)
+
+    def _build(self, operands, new_state):
+        start_state = new_state()
+        end_state = new_state(accepting=True)
+        for low, high in self.intervals:
+            start_state.add_range_transition(low, high, end_state)
+        return start_state, end_state
+
+
+class EpsilonExpr(Regex):
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "Epsilon()"
+
+    def _build(self, operands, new_state):
+        start_state = end_state = new_state(accepting=True)
+        return start_state, end_state
+
+
+class UnionExpr(Regex):
+    __slots__ = ("close",)
+    close: bool
+
+    def _init(self, operands: Tuple[Regex, ...], close: bool) -> None:
+        object.__setattr__(self, "children", operands)
+        object.__setattr__(self, "close", close)
+
+    def _key_args(self) -> tuple:
+        return (self.children, self.close)
+
+    def __repr__(self) -> str:
+        operands = ", ".join(repr(child) for child in self.children)
+        return f"Union({operands}, close={self.close})"
+
+    def _describe(self) -> str:
+        return repr(self.close)
+
+    def _with_children(self, children):
+        return UnionExpr(children, self.close)
+
+    def _build(self, operands, new_state):
+        start_state = new_state()
+        end_state = new_state(accepting=True)
+
+        for operand_start, operand_end in operands:
+            start_state.add_transition(transition_char="", target_state=operand_start)
+            if self.close:
+                operand_end.add_transition(transition_char="", target_state=end_state)
+                operand_end.accepting = False
+
+        return start_state, end_state
+
+
+class ConcatExpr(Regex):
+    __slots__ = ()
+
+    def _init(self, operands: Tuple[Regex, ...]) -> None:
+        object.__setattr__(self, "children", operands)
+
+    def _key_args(self) -> tuple:
+        return (self.children,)
+
+    def __repr__(self) -> str:
+        operands = ", ".join(repr(child) for child in self.children)
+        return f"Concat({operands})"
+
+    def _with_children(self, children):
+        return ConcatExpr(children)
+
+    def _build(self, operands, new_state):
+        start_state = new_state()
+        end_state = new_state(accepting=True)
+
+        start_state.add_transition(transition_char="", target_state=operands[0][0])
+
+        for i in range(len(operands) - 1):
+            bridge_state = new_state(tag="B")
+            operands[i][1].add_transition("", bridge_state)
+            operands[i][1].accepting = False
+            bridge_state.add_transition("", operands[i + 1][0])
+
+        operands[-1][1].accepting = False
+        operands[-1][1].add_transition(transition_char="", target_state=end_state)
+
+        return start_state, end_state
+
+
+class KleeneStarExpr(Regex):
+    __slots__ = ()
+
+    def _init(self, operand: Regex) -> None:
+        object.__setattr__(self, "children", (operand,))
+
+    def _key_args(self) -> tuple:
+        return self.children
+
+    def __repr__(self) -> str:
+        return f"KleeneStar({self.children[0]!r})"
+
+    def _with_children(self, children):
+        return KleeneStarExpr(children[0])
+
+    def _build(self, operands, new_state):
+        operand_start, operand_end = operands[0]
+        start_state = end_state = new_state(accepting=True, tag="KS")
+
+        start_state.add_transition(transition_char="", target_state=operand_start)
+        operand_end.add_transition(transition_char="", target_state=end_state)
+        operand_end.accepting = False
+
+        return start_state, end_state
+
+
+class TokenExpr(Regex):
+    """
+    Attaches a token to the end state of its operand
+    """
+
+    __slots__ = ("token",)
+    token: Token
+
+    def _init(self, operand: Regex, token: Token) -> None:
+        object.__setattr__(self, "children", (operand,))
+        object.__setattr__(self, "token", token)
+
+    def _key_args(self) -> tuple:
+        return (self.children[0], self.token)
+
+    def __repr__(self) -> str:
+        return f"Token({self.children[0]!r}, {self.token.name!r})"
+
+    def _describe(self) -> str:
+        if self.token.skip:
+            return repr((self.token.name, self.token.priority, "skip"))
+        return repr((self.token.name, self.token.priority))
+
+    def _with_children(self, children):
+        return TokenExpr(children[0], self.token)
+
+    def _build(self, operands, new_state):
+        start_state, end_state = operands[0]
+        end_state.tokens.add(self.token)
+        return start_state, end_state
+
+
+def compile_nfa(expr: Regex) -> Tuple[NFAState, NFAState, List[NFAState]]:
+    """
+    Thompson construction of expr, returns (start_state, end_state, states).
+    Every occurrence of a shared node gets its own states. The traversal is
+    iterative so deeply nested expressions can't exhaust the stack
+    """
+    states: List[NFAState] = []
+
+    def new_state(accepting: bool = False, tag: Optional[str] = None) -> NFAState:
+        state = NFAState(accepting=accepting, tag=tag)
+        states.append(state)
+        return state
+
+    fragments: List[Tuple[NFAState, NFAState]] = []
+    stack: List[Tuple[Regex, bool]] = [(expr, False)]
+    while stack:
+        node, operands_built = stack.pop()
+        if operands_built:
+            num_operands = len(node.children)
+            operands = fragments[len(fragments) - num_operands :]
+            del fragments[len(fragments) - num_operands :]
+            fragments.append(node._build(operands, new_state))
+        else:
+            stack.append((node, True))
+            for child in reversed(node.children):
+                stack.append((child, False))
+
+    start_state, end_state = fragments[0]
+    return start_state, end_state, states
@@ -0,0 +1,126 @@
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from langtools.lexer.compiled import CompiledDFA, DEAD_STATE
+from langtools.lexer.intervals import MAX_CODE_POINT
+from langtools.lexer.state import DFAState, NFAState
+from langtools.lexer.subset import IndexedNFA, subset_construction
+from langtools.lexer.token import TokenMatch, TokenSource
+from langtools.lexer.utils import LazyLineStarts
+
+
+class _ReversedNFA:
+    """
+    Accepts the reversal of every string that starts with a match of the
+    original DFA: .* followed by the DFA with its edges turned around
+    """
+
+    def __init__(self, start_state: DFAState, states: List[DFAState]):
+        reversed_states = {state: NFAState() for state in states}
+        reversed_states[start_state].accepting = True
+        self.start_state = NFAState()
+        # reads any prefix of the reversed text, i.e. any suffix after a match
+        self.start_state.add_range_transition(0, MAX_CODE_POINT, self.start_state)
+
+        for state in states:
+            if state.accepting:
+                self.start_state.add_transition("", reversed_states[state])
+            for low, high, target in state.edges():
+                reversed_states[target].add_range_transition(
+                    low, high, reversed_states[state]
+                )
+
+        self.states = [self.start_state, *reversed_states.values()]
+
+
+def reverse_dfa(start_state: DFAState, states: List[DFAState]) -> CompiledDFA:
+    """
+    Compiled DFA that, run backwards over a text, is in an accepting state
+    right after reading each offset a non empty match starts at
+    """
+    reversed_start, _ = subset_construction(
+        IndexedNFA(_ReversedNFA(start_state, states))
+    )
+    return CompiledDFA.from_states(reversed_start)
+
+
+def finditer(
+    compiled: CompiledDFA,
+    reverse: CompiledDFA,
+    text,
+    start: int = 0,
+    end: Optional[int] = None,
+) -> Iterator[TokenMatch]:
+    """
+    Leftmost longest, non overlapping, non empty matches of compiled in
+    text[start:end]. text is a str, or UTF-8 bytes for a DFA built with
+    utf8=True, in which case offsets count bytes
+    """
+    if isinstance(text, memoryview):
+        text = text.cast("B")
+    if end is None:
+        end = len(text)
+    char_class: Callable
+    reverse_class: Callable
+    if isinstance(text, str):
+        char_class, reverse_class = compiled.char_class, reverse.char_class
+    else:
+        char_class = compiled.byte_classes.__getitem__
+        reverse_class = reverse.byte_classes.__getitem__
+
+    # one backwards pass marks every offset a match starts at
+    match_starts = bytearray(end - start)
+    transitions, num_classes = reverse.transitions, reverse.num_classes
+    accepting = reverse.accepting
+    state = reverse.start_state
+    for position in range(end - 1, start - 1, -1):
+        state = transitions[state * num_classes + reverse_class(text[position])]
+        if accepting[state]:
+            match_starts[position - start] = 1
+
+    # NO_KIND (-1) indexes the trailing None, matches without a token have no name
+    kinds: List = [*compiled.token_kinds, None]
+    source = TokenSource(kinds, LazyLineStarts(text), text, False)
+
+    transitions, num_classes = compiled.transitions, compiled.num_classes
+    accepting, state_kinds = compiled.accepting, compiled.state_kinds
+    # position -> bitset of states known not to reach an accepting state before
+    # end. Each scan stops at a pair an earlier scan already gave up on, so the
+    # forward scans take linear time in total however far they each look ahead
+    failed_states: Dict[int, int] = dict()
+    failed_before = start
+    match_start = match_starts.find(1)
+    while match_start != -1:
+        # scans never go back before a match start, so forget older failures
+        while failed_before < start + match_start:
+            failed_states.pop(failed_before, None)
+            failed_before += 1
+
+        # forward from a known start, only to find where the longest match ends
+        position = start + match_start
+        state = compiled.start_state
+        match_end = position
+        kind = state_kinds[state]
+        since_accepting: List[Tuple[int, int]] = []
+        while position < end:
+            state = transitions[state * num_classes + char_class(text[position])]
+            if state == DEAD_STATE:
+                break
+            position += 1
+            if accepting[state]:
+                match_end = position
+                kind = state_kinds[state]
+                since_accepting.clear()
+            else:
+                if failed_states.get(position, 0) >> state & 1:
+                    break
+                since_accepting.append((position, state))
+
+        for position, state in since_accepting:
+            failed_states[position] = failed_states.get(position, 0) | 1 << state
+
+        if match_end == start + match_start:
+            # the start state accepts, but only non empty matches count
+            match_start = match_starts.find(1, match_start + 1)
+            continue
+        yield TokenMatch(kind, start + match_start, match_end, source)
+        match_start = match_starts.find(1, match_end - start)
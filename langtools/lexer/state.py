@@ -1,6 +1,6 @@
+from bisect import bisect_right
 from collections import defaultdict
-from abc import ABC, abstractmethod
-from typing import Optional, Set, Dict
+from typing import AbstractSet, Iterator, List, Optional, Set, Dict, Tuple
 
 from langtools.lexer.exceptions import TokenResolutionError
 from langtools.lexer.token import Token
@@ -11,6 +11,8 @@ class NFAState:
         self, accepting: bool = False, tokens: Optional[Set[Token]] = None, tag=None
     ):
         self.transitions: Dict[str, Set[NFAState]] = defaultdict(set)
+        # inclusive code point intervals, (low, high, target_state)
+        self.range_transitions: List[Tuple[int, int, NFAState]] = []
         self.accepting: bool = accepting
         self.tokens: Set[Token] = accepting and tokens or set()
         self.tag: Optional[str] = tag
@@ -18,11 +20,16 @@ class NFAState:
     def add_transition(self, transition_char, target_state):
         self.transitions[transition_char].add(target_state)
 
+    def add_range_transition(self, low: int, high: int, target_state):
+        self.range_transitions.append((low, high, target_state))
+
     def show(self):
         lines = [f"{id(self)} (A: {self.accepting}):"]
         for char, targets in self.transitions.items():
             targets_string = ",".join([str(id(target)) for target in targets])
             lines.append(f"\t{char} -> {targets_string}")
+        for low, high, target in self.range_transitions:
+            lines.append(f"\t[{chr(low)}-{chr(high)}] -> {id(target)}")
 
         return "\n".join(lines)
 
@@ -30,36 +37,57 @@ class NFAState:
 class DFAState:
     def __init__(self, accepting=False, tokens=None):
         self.transitions = dict()
+        # sorted, disjoint inclusive code point intervals, (low, high, target_state)
+        self.range_transitions: List[Tuple[int, int, DFAState]] = []
         self.accepting = accepting
         self.tokens = accepting and tokens or set()
 
     def set_transition(self, transition_char, target_state):
         self.transitions[transition_char] = target_state
 
+    def add_range_transition(self, low: int, high: int, target_state):
+        # ranges must be added in increasing order
+        self.range_transitions.append((low, high, target_state))
+
+    def next_state(self, char: str) -> Optional["DFAState"]:
+        target = self.transitions.get(char)
+        if target is None and self.range_transitions:
+            code_point = ord(char)
+            i = bisect_right(self.range_transitions, (code_point, float("inf"))) - 1
+            if i >= 0 and self.range_transitions[i][1] >= code_point:
+                target = self.range_transitions[i][2]
+        return target
+
+    def edges(self) -> Iterator[Tuple[int, int, "DFAState"]]:
+        """
+        Yields every transition as an inclusive code point interval
+        """
+        for char, target in self.transitions.items():
+            yield ord(char), ord(char), target
+        yield from self.range_transitions
+
     def show(self):
         lines = [f"{id(self)} (A: {self.accepting}):"]
         for char, target in self.transitions.items():
             lines.append(f"\t{char} -> {id(target)}")
+        for low, high, target in self.range_transitions:
+            lines.append(f"\t[{chr(low)}-{chr(high)}] -> {id(target)}")
 
         return "\n".join(lines)
 
-    def resolve_token(self, lexme):
-
-        # TODO: Store tokens in priority_queue in the first place
-        curr_selected_token = None
-        curr_priority = float("inf")
 
-        if len(self.tokens) == 0:
-            raise TokenResolutionError(f"State representing {lexme} has no tokens")
+def select_token(tokens: AbstractSet[Token]) -> Optional[Token]:
+    """
+    The token with the lowest priority, None if there are no tokens. Raises
+    TokenResolutionError if several tokens share the lowest priority
+    """
+    if len(tokens) == 0:
+        return None
 
-        for token in self.tokens:
-            if token.priority < curr_priority:
-                curr_selected_token = token
-                curr_priority = token.priority
-            elif token.priority == curr_priority:
-                raise TokenResolutionError(
-                    f"Ambiguous Tokenization: {curr_selected_token.name} - {token.name}"
-                )
+    selected_token = min(tokens, key=lambda token: token.priority)
+    tied = [token for token in tokens if token.priority == selected_token.priority]
+    if len(tied) > 1:
+        names = " - ".join(sorted(str(token.name) for token in tied))
+        raise TokenResolutionError(f"Ambiguous Tokenization: {names}")
 
-        curr_selected_token.lexme = lexme
-        return curr_selected_token
+    return selected_token
@@ -0,0 +1,206 @@
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Set, Tuple
+
+from langtools.lexer.intervals import split_intervals
+from langtools.lexer.state import DFAState, NFAState
+from langtools.lexer.token import Token
+
+
+def iter_bits(bits: int) -> Iterator[int]:
+    while bits:
+        lowest_bit = bits & -bits
+        yield lowest_bit.bit_length() - 1
+        bits ^= lowest_bit
+
+
+class IndexedNFA:
+    """
+    Integer view of an NFA for subset construction. States are numbered, sets
+    of states are int bitsets, every state's epsilon closure is computed once
+    up front
+    """
+
+    def __init__(self, nfa):
+
+        states: List[NFAState] = list(nfa.states)
+        state_ids: Dict[NFAState, int] = {state: i for i, state in enumerate(states)}
+
+        self.num_states = len(states)
+        self.closures = self._find_epsilon_closures(states, state_ids)
+
+        self.accepting_mask = 0
+        self.token_mask = 0
+        self.tokens: List[Set[Token]] = []
+        # only states that consume characters have an entry here
+        self.edges: Dict[int, List[Tuple[int, int, int]]] = dict()
+
+        for i, state in enumerate(states):
+            if state.accepting:
+                self.accepting_mask |= 1 << i
+            if state.tokens:
+                self.token_mask |= 1 << i
+            self.tokens.append(state.tokens)
+
+            state_edges: List[Tuple[int, int, int]] = []
+            for transition_char, targets in state.transitions.items():
+                if transition_char:
+                    code_point = ord(transition_char)
+                    state_edges.extend(
+                        (code_point, code_point, state_ids[target])
+                        for target in targets
+                    )
+            state_edges.extend(
+                (low, high, state_ids[target])
+                for low, high, target in state.range_transitions
+            )
+            if state_edges:
+                self.edges[i] = state_edges
+
+        self.consuming_mask = 0
+        for i in self.edges:
+            self.consuming_mask |= 1 << i
+
+        self.start = self.closures[state_ids[nfa.start_state]]
+
+    @staticmethod
+    def _find_epsilon_closures(
+        states: List[NFAState], state_ids: Dict[NFAState, int]
+    ) -> List[int]:
+        """
+        Closure of every state at once. Epsilon cycles (from KleeneStar) are
+        collapsed with an iterative Tarjan SCC pass, so each closure is the
+        union of its component and the already finished successor components
+        """
+        successors: List[List[int]] = [
+            [state_ids[target] for target in state.transitions.get("", ())]
+            for state in states
+        ]
+
+        num_states = len(states)
+        index = [-1] * num_states
+        low_link = [0] * num_states
+        on_stack = [False] * num_states
+        component_stack: List[int] = []
+        closures = [0] * num_states
+        next_index = 0
+
+        for root in range(num_states):
+            if index[root] != -1:
+                continue
+
+            work: List[Tuple[int, int]] = [(root, 0)]
+            while work:
+                node, child_position = work.pop()
+                if child_position == 0:
+                    index[node] = low_link[node] = next_index
+                    next_index += 1
+                    component_stack.append(node)
+                    on_stack[node] = True
+
+                if child_position < len(successors[node]):
+                    child = successors[node][child_position]
+                    work.append((node, child_position + 1))
+                    if index[child] == -1:
+                        work.append((child, 0))
+                    elif on_stack[child]:
+                        low_link[node] = min(low_link[node], index[child])
+                    continue
+
+                # every successor is finished, propagate low link to the parent
+                if work:
+                    parent = work[-1][0]
+                    low_link[parent] = min(low_link[parent], low_link[node])
+
+                if low_link[node] == index[node]:
+                    component: List[int] = []
+                    while True:
+                        member = component_stack.pop()
+                        on_stack[member] = False
+                        component.append(member)
+                        if member == node:
+                            break
+
+                    closure = 0
+                    for member in component:
+                        closure |= 1 << member
+                    for member in component:
+                        for successor in successors[member]:
+                            closure |= closures[successor]
+                    for member in component:
+                        closures[member] = closure
+
+        return closures
+
+    def is_accepting(self, bits: int) -> bool:
+        return bool(bits & self.accepting_mask)
+
+    def find_tokens(self, bits: int) -> Set[Token]:
+        tokens: Set[Token] = set()
+        for i in iter_bits(bits & self.token_mask):
+            tokens.update(self.tokens[i])
+        return tokens
+
+    def transitions(self, bits: int) -> List[Tuple[int, int, int]]:
+        """
+        Sorted, disjoint (low, high, target_bits) transitions out of a set of
+        states, with adjacent intervals sharing a target merged
+        """
+        edges: List[Tuple[int, int, int]] = []
+        for i in iter_bits(bits & self.consuming_mask):
+            edges.extend(self.edges[i])
+
+        merged: List[List[int]] = []
+        for low, high, target_ids in split_intervals(edges):
+            target = 0
+            for target_id in target_ids:
+                target |= self.closures[target_id]
+            if merged and merged[-1][1] == low - 1 and merged[-1][2] == target:
+                merged[-1][1] = high
+            else:
+                merged.append([low, high, target])
+
+        return [(low, high, target) for low, high, target in merged]
+
+    def step(self, bits: int, code_point: int) -> int:
+        target = 0
+        for i in iter_bits(bits & self.consuming_mask):
+            for low, high, target_id in self.edges[i]:
+                if low <= code_point <= high:
+                    target |= self.closures[target_id]
+        return target
+
+
+def subset_construction(indexed_nfa: IndexedNFA) -> Tuple[DFAState, List[DFAState]]:
+    """
+    Builds the DFA states reachable from the nfa's start, returns
+    (start_state, states)
+    """
+    # will map from a bitset of nfa state ids to a dfa_state
+    dfa_states: Dict[int, DFAState] = dict()
+
+    def add_dfa_state(nfa_state_ids: int) -> DFAState:
+        dfa_state = DFAState(accepting=indexed_nfa.is_accepting(nfa_state_ids))
+        dfa_state.tokens = indexed_nfa.find_tokens(nfa_state_ids)
+        dfa_states[nfa_state_ids] = dfa_state
+        q.appendleft(nfa_state_ids)
+        return dfa_state
+
+    q: Deque[int] = deque()
+    start_state = add_dfa_state(indexed_nfa.start)
+
+    while q:
+        curr_nfa_state_ids = q.pop()
+        curr_dfa_state = dfa_states[curr_nfa_state_ids]
+
+        # edges are already split on interval boundaries and epsilon closed
+        for low, high, target_ids in indexed_nfa.transitions(curr_nfa_state_ids):
+            target_state = dfa_states.get(target_ids)
+            if target_state is None:
+                target_state = add_dfa_state(target_ids)
+
+            if low == high:
+                curr_dfa_state.set_transition(chr(low), target_state)
+            else:
+                curr_dfa_state.add_range_transition(low, high, target_state)
+
+    return start_state, list(dfa_states.values())
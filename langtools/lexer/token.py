@@ -1,11 +1,141 @@
-from typing import Optional
+from bisect import bisect_right
+from itertools import repeat
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
 
 
 class Token:
-    def __init__(self, name, lexme: Optional[str] = None, priority=1):
+    def __init__(self, name, lexme: Optional[str] = None, priority=1, skip=False):
         self.name = name
         self.priority = priority
         self.lexme = lexme
+        # matched like any other token but never emitted, e.g. white space or comments
+        self.skip = skip
 
     def __repr__(self):
         return self.name + f": {self.lexme}" if self.lexme else ""
+
+
+class TokenSource:
+    """
+    State shared by every token of one input: the names of the token kinds,
+    the offsets at which lines start and, if the whole input is kept in
+    memory, its text. The text is either a str or UTF-8 encoded bytes (bytes,
+    memoryview or mmap), in which case offsets count bytes. strip_white_space
+    is set when the lexer skipped white space inside tokens
+    """
+
+    __slots__ = ("kinds", "line_starts", "text", "strip_white_space")
+
+    def __init__(
+        self,
+        kinds: List[str],
+        line_starts: Sequence[int],
+        text=None,
+        strip_white_space: bool = True,
+    ):
+        self.kinds = kinds
+        # sorted, line_starts[0] is 0. May keep growing while the input is read
+        self.line_starts = line_starts
+        self.text = text
+        self.strip_white_space = strip_white_space
+
+    def position(self, offset: int) -> Tuple[int, int]:
+        """
+        Returns (line_number, column) of offset, both counted from 0
+        """
+        line_number = bisect_right(self.line_starts, offset) - 1
+        return line_number, offset - self.line_starts[line_number]
+
+    def lexme(self, start: int, end: int) -> str:
+        text = self.text[start:end]
+        if not self.strip_white_space:
+            return text if isinstance(text, str) else bytes(text).decode("utf-8")
+        # white space skipped inside a token isn't part of its lexeme
+        if isinstance(text, str):
+            return "".join(text.split())
+        return b"".join(bytes(text).split()).decode("utf-8")
+
+
+class TokenMatch(tuple):
+    """
+    Immutable token emitted by the lexer. It is a bare tuple of an interned
+    kind id, the span of input it matched and the source the span refers to.
+    The name, lexeme and position are looked up in the source when asked for
+    """
+
+    __slots__ = ()
+
+    def __new__(
+        cls,
+        kind: int,
+        start: int,
+        end: int,
+        source: TokenSource,
+        lexme: Optional[str] = None,
+        position: Optional[Tuple[int, int]] = None,
+    ):
+        # lengths are nearly always small ints, which python doesn't allocate
+        if lexme is None:
+            return tuple.__new__(cls, (kind, start, end - start, source))
+        # a source that doesn't keep its text, e.g. a stream, needs the lexeme
+        # and (line, column) stored, its line index doesn't go back that far
+        line, column = position if position is not None else source.position(start)
+        return tuple.__new__(
+            cls, (kind, start, end - start, source, lexme, line, column)
+        )
+
+    @classmethod
+    def from_spans(
+        cls,
+        kinds: Iterable[int],
+        starts: Iterable[int],
+        lengths: Iterable[int],
+        source: TokenSource,
+    ) -> Iterator["TokenMatch"]:
+        """
+        Builds tokens in bulk, without going through __new__ for each one
+        """
+        return map(
+            tuple.__new__, repeat(cls), zip(kinds, starts, lengths, repeat(source))
+        )
+
+    @property
+    def kind(self) -> int:
+        return self[0]
+
+    @property
+    def start(self) -> int:
+        return self[1]
+
+    @property
+    def end(self) -> int:
+        return self[1] + self[2]
+
+    @property
+    def source(self) -> TokenSource:
+        return self[3]
+
+    @property
+    def name(self) -> str:
+        return self[3].kinds[self[0]]
+
+    @property
+    def lexme(self) -> str:
+        if len(self) == 7:
+            return self[4]
+        return self[3].lexme(self[1], self[1] + self[2])
+
+    @property
+    def line(self) -> int:
+        if len(self) == 7:
+            return self[5]
+        return self[3].position(self[1])[0]
+
+    @property
+    def column(self) -> int:
+        if len(self) == 7:
+            return self[6]
+        return self[3].position(self[1])[1]
+
+    def __repr__(self):
+        return f"{self.name}: {self.lexme}"
@@ -0,0 +1,118 @@
+from typing import Dict, List, Tuple
+
+from langtools.lexer.nfa import NFA
+from langtools.lexer.regex import (
+    CharExpr,
+    CharSetExpr,
+    ConcatExpr,
+    Regex,
+    UnionExpr,
+)
+
+# code points that can't be encoded, UTF-8 has no surrogates
+SURROGATES = (0xD800, 0xDFFF)
+# largest code point encoded in 1, 2 and 3 bytes
+ENCODED_LENGTH_LIMITS = (0x7F, 0x7FF, 0xFFFF)
+
+
+def utf8_sequences(low: int, high: int) -> List[List[Tuple[int, int]]]:
+    """
+    Splits the code points [low, high] into sequences of byte ranges. A code
+    point is in the interval exactly when its UTF-8 encoding matches one of
+    the sequences, byte i falling in range i
+    """
+    sequences: List[List[Tuple[int, int]]] = []
+    stack: List[Tuple[int, int]] = [(low, high)]
+
+    while stack:
+        low, high = stack.pop()
+        if low > high:
+            continue
+
+        if low <= SURROGATES[1] and high >= SURROGATES[0]:
+            stack.append((low, SURROGATES[0] - 1))
+            stack.append((SURROGATES[1] + 1, high))
+            continue
+
+        split = False
+        for limit in ENCODED_LENGTH_LIMITS:
+            if low <= limit < high:
+                stack.append((low, limit))
+                stack.append((limit + 1, high))
+                split = True
+                break
+        if split:
+            continue
+
+        # every byte after the first must span whole continuation byte ranges
+        for continuation_bytes in range(1, 4):
+            mask = (1 << (6 * continuation_bytes)) - 1
+            if low & ~mask != high & ~mask:
+                if low & mask != 0:
+                    stack.append((low, low | mask))
+                    stack.append(((low | mask) + 1, high))
+                    split = True
+                    break
+                if high & mask != mask:
+                    stack.append((low, (high & ~mask) - 1))
+                    stack.append((high & ~mask, high))
+                    split = True
+                    break
+        if split:
+            continue
+
+        sequences.append(list(zip(chr(low).encode("utf-8"), chr(high).encode("utf-8"))))
+
+    return sequences
+
+
+def _utf8_leaf(node: Regex) -> Regex:
+    if isinstance(node, CharExpr):
+        encoded = node.char.encode("utf-8")
+        if len(encoded) == 1:
+            return node
+        return ConcatExpr(tuple(CharExpr(chr(byte)) for byte in encoded))
+
+    if isinstance(node, CharSetExpr):
+        alternatives: List[Regex] = []
+        for low, high in node.intervals:
+            for sequence in utf8_sequences(low, high):
+                byte_sets = tuple(CharSetExpr((byte_range,)) for byte_range in sequence)
+                alternatives.append(
+                    byte_sets[0] if len(byte_sets) == 1 else ConcatExpr(byte_sets)
+                )
+        if len(alternatives) == 1:
+            return alternatives[0]
+        if alternatives:
+            return UnionExpr(tuple(alternatives), True)
+
+    return node
+
+
+def utf8_expr(expr: Regex) -> Regex:
+    """
+    Rewrites expr to match the UTF-8 encoding of its language. Characters of
+    the result are bytes, written as the code points 0 to 255
+    """
+    rewritten: Dict[int, Regex] = dict()
+    stack: List[Tuple[Regex, bool]] = [(expr, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if id(node) in rewritten:
+            continue
+        if children_done:
+            if node.children:
+                rewritten[id(node)] = node._with_children(
+                    tuple(rewritten[id(child)] for child in node.children)
+                )
+            else:
+                rewritten[id(node)] = _utf8_leaf(node)
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.children)
+
+    return rewritten[id(expr)]
+
+
+def utf8_nfa(nfa: NFA) -> NFA:
+    return NFA(utf8_expr(nfa.expr))
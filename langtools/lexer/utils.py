@@ -1,69 +1,198 @@
 import io
+import re
+from array import array
+from bisect import bisect_right
+from typing import Optional, Sequence, Tuple, Union
 
-from typing import List, Tuple, Union
-from langtools.lexer.exceptions import LexicalError
+EOF = "EOF"
 
+DEFAULT_CHUNK_SIZE = 1 << 16
 
-EOF = "EOF"
 
+class BufferedLexerReader:
+    """
+    Reads a text stream in large chunks into a buffer. The lexer indexes the
+    buffer directly and asks for more with fill, which also drops everything
+    before the oldest position it may still backtrack to. Nothing relies on
+    tell or seek, so pipes and sockets work and memory stays bounded by the
+    longest token rather than the input. Line starts are only kept for what
+    is still buffered, with a count of the lines dropped before them, unless
+    an existing index of all the lines is passed in. start is the absolute
+    offset the stream's first character is at
+    """
 
-class LexerStreamReader:
     def __init__(
-        self, stream: Union[io.TextIOBase, io.StringIO], ignore_white_space=True
+        self,
+        stream: Union[io.TextIOBase, io.StringIO],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        start: int = 0,
+        line_starts: Optional[Sequence[int]] = None,
     ):
         self.stream = stream
-        self.marks_stack: List[int] = []
-        self.line_start_positions: List[int] = [0]
-        self.ignore_white_space: bool = ignore_white_space
-
-    def next(self) -> str:
-        next_char: str = self.stream.read(1)
-        while self.ignore_white_space and next_char.isspace():
-            if next_char == "\n":
-                self.line_start_positions.append(self.stream.tell())
-            next_char = self.stream.read(1)
-
-        return next_char if next_char else EOF
-
-    def mark(self) -> None:
-        self.marks_stack.append(self.stream.tell())
-
-    def backtrack(self) -> None:
-        if self.marks_stack:
-            self.stream.seek(self.marks_stack[-1])
-            while (
-                self.line_start_positions
-                and self.line_start_positions[-1] > self.marks_stack[-1]
-            ):
-                self.line_start_positions.pop()
+        self.chunk_size = chunk_size
+        self.buffer: str = ""
+        # absolute stream offset of buffer[0]
+        self.buffer_start: int = start
+        self.at_eof: bool = False
+        # absolute offset of the start of every line from the one buffer_start
+        # is in, which is line number first_line. A reader over a string may
+        # use an existing index of its lines instead
+        self.indexed_lines = array("q", [start])
+        self.line_starts: Sequence[int] = self.indexed_lines
+        if line_starts is not None:
+            self.line_starts = line_starts
+        self.first_line: int = 0
+        # absolute offset reported by get_curr_line
+        self.error_position: int = start
+
+    @classmethod
+    def from_string(
+        cls, text: str, line_starts: Optional[Sequence[int]] = None
+    ) -> "BufferedLexerReader":
+        """
+        Reader over a string that is already in memory. The whole string stays
+        in the buffer, so absolute offsets index text directly. line_starts is
+        an existing index of text's lines, to save building one
+        """
+        reader = cls(io.StringIO())
+        reader.buffer = text
+        reader.at_eof = True
+        if line_starts is None:
+            reader._index_lines(text, 0)
         else:
-            raise LexicalError(reader=self)
+            reader.line_starts = line_starts
+        return reader
+
+    def _index_lines(self, chunk: str, chunk_start: int) -> None:
+        newline = chunk.find("\n")
+        while newline != -1:
+            self.indexed_lines.append(chunk_start + newline + 1)
+            newline = chunk.find("\n", newline + 1)
+
+    def fill(self, keep_from: int) -> bool:
+        """
+        Drops the buffer before absolute offset keep_from and appends the next
+        chunk. Returns False, leaving the buffer untouched, at end of stream
+        """
+        if self.at_eof:
+            return False
 
-    def mark_at_end(self) -> bool:
-        if not self.marks_stack:
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.at_eof = True
             return False
-        curr_pos = self.stream.tell()
-        self.stream.seek(self.marks_stack[-1])
-        next_char = self.stream.read(1)
 
-        result = True
+        indexing = self.line_starts is self.indexed_lines
+        if indexing:
+            self._index_lines(chunk, self.buffer_start + len(self.buffer))
+        drop = keep_from - self.buffer_start
+        self.buffer = self.buffer[drop:] + chunk
+        self.buffer_start = keep_from
 
-        while next_char:
-            if not next_char.isspace():
-                result = False
-                break
-            next_char = self.stream.read(1)
+        dropped_lines = bisect_right(self.indexed_lines, keep_from) - 1
+        if indexing and dropped_lines > 0:
+            del self.indexed_lines[:dropped_lines]
+            self.first_line += dropped_lines
+        return True
 
-        self.stream.seek(curr_pos)
-        return result
+    def position(self, offset: int) -> Tuple[int, int]:
+        """
+        Returns (line_number, column) of an absolute offset that is still
+        buffered, both counted from 0
+        """
+        index = bisect_right(self.line_starts, offset) - 1
+        return self.first_line + index, offset - self.line_starts[index]
 
     def get_curr_line(self) -> Tuple[int, int, str]:
         """
-        Returns (curr_line_number, position_in_line, content_of_line)
+        Returns (curr_line_number, position_in_line, content_of_line) for error_position
         """
-        curr_pos = self.stream.tell()
-        line_start = self.line_start_positions[-1]
-        self.stream.seek(line_start)
-        retval = self.stream.readline()
-        self.stream.seek(curr_pos)
-        return (len(self.line_start_positions) - 1, curr_pos - line_start - 1, retval)
+        position = self.error_position - self.buffer_start
+        line_number, column = self.position(self.error_position)
+        line_start = self.error_position - column - self.buffer_start
+        if line_start < 0:
+            # the start of a very long line may already be dropped
+            line_prefix = " " * -line_start
+            line_start = 0
+        else:
+            line_prefix = ""
+
+        line_end = self.buffer.find("\n", position)
+        while line_end == -1 and self.fill(self.buffer_start):
+            line_end = self.buffer.find("\n", position)
+        if line_end == -1:
+            line_end = len(self.buffer)
+
+        return (line_number, column, line_prefix + self.buffer[line_start:line_end])
+
+
+class ByteLexerReader:
+    """
+    Reader over UTF-8 encoded input that is already in memory or memory mapped
+    (bytes, memoryview or mmap). The lexer indexes the input in place, so
+    nothing is decoded or copied. Offsets and columns count bytes, except in
+    get_curr_line which reports characters for error messages
+    """
+
+    def __init__(self, data):
+        self.buffer = data
+        self.buffer_start: int = 0
+        self.at_eof: bool = True
+        self.line_starts = array("q", [0])
+        self.line_starts.extend(newline.end() for newline in re.finditer(b"\n", data))
+        self.error_position: int = 0
+
+    def fill(self, keep_from: int) -> bool:
+        return False
+
+    def position(self, offset: int) -> Tuple[int, int]:
+        """
+        Returns (line_number, column) of offset, both counted from 0, the
+        column in bytes
+        """
+        line_number = bisect_right(self.line_starts, offset) - 1
+        return line_number, offset - self.line_starts[line_number]
+
+    def get_curr_line(self) -> Tuple[int, int, str]:
+        """
+        Returns (curr_line_number, position_in_line, content_of_line) for error_position
+        """
+        line_number = bisect_right(self.line_starts, self.error_position) - 1
+        line_start = self.line_starts[line_number]
+        if line_number + 1 < len(self.line_starts):
+            line_end = self.line_starts[line_number + 1] - 1
+        else:
+            line_end = len(self.buffer)
+
+        line = bytes(self.buffer[line_start:line_end])
+        column = len(
+            line[: self.error_position - line_start].decode("utf-8", "replace")
+        )
+        return (line_number, column, line.decode("utf-8", "replace"))
+
+
+class LazyLineStarts(Sequence[int]):
+    """
+    Offsets at which the lines of a str or UTF-8 text start, only indexed the
+    first time a token's line or column is asked for
+    """
+
+    __slots__ = ("text", "_starts")
+
+    def __init__(self, text):
+        self.text = text
+        self._starts: Optional[Sequence[int]] = None
+
+    def _index(self) -> Sequence[int]:
+        if self._starts is None:
+            if isinstance(self.text, str):
+                self._starts = BufferedLexerReader.from_string(self.text).line_starts
+            else:
+                self._starts = ByteLexerReader(self.text).line_starts
+        return self._starts
+
+    def __getitem__(self, index):
+        return self._index()[index]
+
+    def __len__(self) -> int:
+        return len(self._index())
@@ -0,0 +1,78 @@
+from typing import Iterable, List, Union
+
+
+def match_many(compiled, strings: Iterable[Union[str, bytes]]):
+    """
+    Whole string membership of every string at once, returns a numpy bool
+    array. All strings advance together, one table gather per column, so the
+    per character work happens in numpy. Strings are bytes for a DFA built
+    with utf8=True
+    """
+    try:
+        import numpy
+    except ImportError as error:
+        raise ImportError("match_many requires numpy, pip install numpy") from error
+
+    # all str or all bytes
+    items: List = list(strings)
+    if not items:
+        return numpy.zeros(0, dtype=bool)
+
+    num_states, num_classes = compiled.num_states, compiled.num_classes
+    index_type = numpy.int32 if (num_states + 1) * num_classes < 2**31 else numpy.int64
+    # dead transitions lead to an extra state that never leaves or accepts
+    dead = num_states
+    transitions = numpy.full((num_states + 1) * num_classes, dead, dtype=index_type)
+    transitions[: num_states * num_classes] = numpy.asarray(compiled.transitions)
+    transitions[transitions < 0] = dead
+    accepting = numpy.zeros(num_states + 1, dtype=bool)
+    accepting[:num_states] = numpy.frombuffer(
+        bytes(compiled.accepting), dtype=numpy.uint8
+    )
+
+    # every character, flat, mapped to its character class
+    byte_classes = numpy.asarray(compiled.byte_classes, dtype=index_type)
+    if isinstance(items[0], str):
+        code_points = numpy.frombuffer(
+            "".join(items).encode("utf-32-le", "surrogatepass"), dtype="<u4"
+        )
+        flat_classes = byte_classes[numpy.minimum(code_points, 255)]
+        # only characters past latin-1 need the interval search
+        wide = numpy.flatnonzero(code_points > 255)
+        if len(wide):
+            interval_indices = numpy.searchsorted(
+                numpy.asarray(compiled.boundaries), code_points[wide], side="right"
+            )
+            flat_classes[wide] = numpy.asarray(compiled.interval_classes)[
+                interval_indices - 1
+            ]
+    else:
+        flat_classes = byte_classes[
+            numpy.frombuffer(b"".join(items), dtype=numpy.uint8)
+        ]
+
+    lengths = numpy.fromiter(map(len, items), dtype=numpy.int64, count=len(items))
+    offsets = numpy.zeros(len(items), dtype=numpy.int64)
+    numpy.cumsum(lengths[:-1], out=offsets[1:])
+
+    # longest first, so the strings still running at any column are a prefix.
+    # Short lengths sort with a radix sort
+    max_length = int(lengths.max())
+    sort_keys = max_length - lengths
+    if max_length < 2**16:
+        sort_keys = sort_keys.astype(numpy.uint16)
+    order = numpy.argsort(sort_keys, kind="stable")
+    offsets = offsets[order]
+    descending_lengths = -lengths[order]
+
+    states = numpy.full(len(items), compiled.start_state, dtype=index_type)
+    for column in range(max_length):
+        count = int(numpy.searchsorted(descending_lengths, -column, side="left"))
+        active = states[:count]
+        numpy.multiply(active, num_classes, out=active)
+        numpy.add(active, flat_classes[offsets[:count] + column], out=active)
+        states[:count] = transitions[active]
+
+    matched = numpy.empty(len(items), dtype=bool)
+    matched[order] = accepting[states]
+    return matched
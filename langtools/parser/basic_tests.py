@@ -1,6 +1,14 @@
+import itertools
 import unittest
 
+from langtools.lexer.dfa import DFA
+from langtools.lexer.exceptions import LexicalError
+from langtools.lexer.lexer import tokenize_str
+from langtools.lexer.nfa import Atom, CharRange, Concat, KleeneStar, Union
+from langtools.lexer.token import Token
+from langtools.parser.batch import parse_batch
 from langtools.parser.cfg import CFG, ProductionRule, NonTerminal, Terminal, Epsilon
+from langtools.parser.exceptions import GrammarConflictError, ParsingException
 
 ASCII = [chr(i) for i in range(128)]
 
@@ -88,8 +96,757 @@ class FirstFollowNullableTests(unittest.TestCase):
         self.assertFalse(self.__class__.cfg.is_grammar_LL1())
 
 
+class FixedPointAnalysisTests(unittest.TestCase):
+    def test___find_first__MutualRecursion__CompleteSets(self):
+        A = NonTerminal("A")
+        B = NonTerminal("B")
+        a, b, c, d = (Terminal(name) for name in "abcd")
+
+        cfg = CFG(
+            production_rules=[
+                ProductionRule(A, [B, a]),
+                ProductionRule(A, [c]),
+                ProductionRule(B, [A, b]),
+                ProductionRule(B, [d]),
+            ],
+            alphabet=ASCII,
+            start_symbol=A,
+        )
+
+        self.assertCountEqual({"c", "d"}, cfg._find_first(A))
+        self.assertCountEqual({"c", "d"}, cfg._find_first(B))
+        self.assertCountEqual({"b", "EOF"}, cfg._find_follow(A))
+        self.assertCountEqual({"a"}, cfg._find_follow(B))
+
+    def test___is_nullable__Cycles__OnlyNullableWithEpsilonRule(self):
+        P = NonTerminal("P")
+        Q = NonTerminal("Q")
+        X = NonTerminal("X")
+        Y = NonTerminal("Y")
+
+        cfg = CFG(
+            production_rules=[
+                ProductionRule(P, [Q]),
+                ProductionRule(Q, [P]),
+                ProductionRule(X, [Y, Y]),
+                ProductionRule(Y, [X]),
+                ProductionRule(Y, [Epsilon()]),
+                ProductionRule(Y, [P, X]),
+            ],
+            alphabet=ASCII,
+            start_symbol=X,
+        )
+
+        self.assertFalse(cfg._is_nullable(P))
+        self.assertFalse(cfg._is_nullable(Q))
+        self.assertTrue(cfg._is_nullable(X))
+        self.assertTrue(cfg._is_nullable([Y, X, Y]))
+        self.assertFalse(cfg._is_nullable([X, P]))
+
+    def test___generate_parse_table__DeepChain__NoRecursionLimit(self):
+        chain = [NonTerminal(f"N{i}") for i in range(5000)]
+        x = Terminal("x")
+        rules = [
+            ProductionRule(chain[i], [chain[i + 1], x]) for i in range(len(chain) - 1)
+        ]
+        rules.append(ProductionRule(chain[-1], [Terminal("b")]))
+
+        cfg = CFG(production_rules=rules, alphabet=ASCII, start_symbol=chain[0])
+
+        self.assertCountEqual({"b"}, cfg._find_first(chain[0]))
+        self.assertCountEqual({"EOF"}, cfg._find_follow(chain[0]))
+        self.assertCountEqual({"x"}, cfg._find_follow(chain[-1]))
+        self.assertEqual(cfg.parse_table[(chain[0], "b")], {rules[0]})
+        self.assertTrue(cfg.is_grammar_LL1())
+
+
 class LL1ParseTests(unittest.TestCase):
-    pass
+    @classmethod
+    def setUpClass(cls):
+        word = Concat(CharRange("a", "z"), KleeneStar(CharRange("a", "z")))
+        word.add_token(Token("WORD"))
+        comma = Atom(",")
+        comma.add_token(Token("COMMA"))
+        cls.dfa = DFA(Union(word, comma, close=False))
+
+        List = NonTerminal("List")
+        Rest = NonTerminal("Rest")
+        Item = NonTerminal("Item")
+        WORD = Terminal("WORD")
+        COMMA = Terminal("COMMA")
+        cls.cfg = CFG(
+            production_rules=[
+                ProductionRule(List, [Item, Rest]),
+                ProductionRule(Rest, [COMMA, Item, Epsilon(), Rest]),
+                ProductionRule(Rest, [Epsilon()]),
+                ProductionRule(Item, [WORD]),
+            ],
+            alphabet=["WORD", "COMMA"],
+            start_symbol=List,
+        )
+
+    def shape(self, node):
+        return (node.name, node.lexme, [self.shape(child) for child in node.children])
+
+    def test__LL1_parse__List__CorrectAST(self):
+
+        ast = self.__class__.cfg.LL1_parse(tokenize_str("a, b", self.__class__.dfa))
+
+        self.assertEqual(
+            self.shape(ast),
+            (
+                "S-Prime",
+                None,
+                [
+                    ("BOF", None, []),
+                    (
+                        "List",
+                        None,
+                        [
+                            ("Item", None, [("WORD", "a", [])]),
+                            (
+                                "Rest",
+                                None,
+                                [
+                                    ("COMMA", ",", []),
+                                    ("Item", None, [("WORD", "b", [])]),
+                                    ("Rest", None, []),
+                                ],
+                            ),
+                        ],
+                    ),
+                    ("EOF", None, []),
+                ],
+            ),
+        )
+
+    def test__LL1_parse__UnexpectedToken__ParsingException(self):
+
+        with self.assertRaises(ParsingException):
+            self.__class__.cfg.LL1_parse(tokenize_str("a,, b", self.__class__.dfa))
+
+        with self.assertRaises(ParsingException):
+            self.__class__.cfg.LL1_parse(tokenize_str("a,", self.__class__.dfa))
+
+        with self.assertRaises(ParsingException):
+            self.__class__.cfg.LL1_parse([Token("SEMICOLON", ";")])
+
+    def test__LL1_parse__NotLL1__ParsingException(self):
+
+        A = NonTerminal("A")
+        a = Terminal("a")
+        cfg = CFG(
+            production_rules=[ProductionRule(A, [a]), ProductionRule(A, [a, a])],
+            alphabet=ASCII,
+            start_symbol=A,
+        )
+
+        with self.assertRaises(ParsingException):
+            cfg.LL1_parse([Token("a", "a")])
+
+    def test__compile__CalledTwice__SameParser(self):
+
+        self.assertIs(self.__class__.cfg.compile(), self.__class__.cfg.compile())
+        self.assertTrue(self.__class__.cfg.compile().is_LL1)
+
+
+class LALRParseTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.A = NonTerminal("A")
+        cls.B = NonTerminal("B")
+        cls.C = NonTerminal("C")
+        cls.a = Terminal("a")
+        cls.b = Terminal("b")
+        cls.c = Terminal("c")
+
+        cls.rules = [
+            ProductionRule(cls.A, [Epsilon()]),
+            ProductionRule(cls.A, [cls.A, cls.a]),
+            ProductionRule(cls.A, [cls.b]),
+            ProductionRule(cls.B, [cls.c, cls.C]),
+            ProductionRule(cls.A, [cls.B, cls.b]),
+            ProductionRule(cls.C, [Epsilon()]),
+        ]
+        cls.cfg = CFG(production_rules=cls.rules, alphabet=ASCII, start_symbol=cls.A)
+
+        E = NonTerminal("E")
+        T = NonTerminal("T")
+        F = NonTerminal("F")
+        cls.expression_cfg = CFG(
+            production_rules=[
+                ProductionRule(E, [E, Terminal("+"), T]),
+                ProductionRule(E, [T]),
+                ProductionRule(T, [T, Terminal("*"), F]),
+                ProductionRule(T, [F]),
+                ProductionRule(F, [Terminal("("), E, Terminal(")")]),
+                ProductionRule(F, [Terminal("id")]),
+            ],
+            alphabet=ASCII,
+            start_symbol=E,
+        )
+
+    def shape(self, node):
+        return (node.name, node.lexme, [self.shape(child) for child in node.children])
+
+    def tokens(self, names):
+        return [Token(name, name) for name in names.split()]
+
+    def test__LALR_parse__LeftRecursion__LeftLeaningAST(self):
+
+        ast = self.__class__.cfg.LALR_parse(self.tokens("c b a a"))
+
+        self.assertEqual(
+            self.shape(ast),
+            (
+                "S-Prime",
+                None,
+                [
+                    ("BOF", None, []),
+                    (
+                        "A",
+                        None,
+                        [
+                            (
+                                "A",
+                                None,
+                                [
+                                    (
+                                        "A",
+                                        None,
+                                        [
+                                            (
+                                                "B",
+                                                None,
+                                                [("c", "c", []), ("C", None, [])],
+                                            ),
+                                            ("b", "b", []),
+                                        ],
+                                    ),
+                                    ("a", "a", []),
+                                ],
+                            ),
+                            ("a", "a", []),
+                        ],
+                    ),
+                    ("EOF", None, []),
+                ],
+            ),
+        )
+
+    def test__LALR_parse__EmptyInput__EpsilonNode(self):
+
+        ast = self.__class__.cfg.LALR_parse([])
+
+        self.assertEqual(
+            self.shape(ast),
+            ("S-Prime", None, [("BOF", None, []), ("A", None, []), ("EOF", None, [])]),
+        )
+
+    def test__LALR_parse__Expression__PrecedenceInAST(self):
+
+        ast = self.__class__.expression_cfg.LALR_parse(self.tokens("id + id * id"))
+        E = ast.children[1]
+
+        self.assertEqual([child.name for child in E.children], ["E", "+", "T"])
+        self.assertEqual(
+            [child.name for child in E.children[2].children], ["T", "*", "F"]
+        )
+
+    def test__LALR_parse__LL1Grammar__SameASTAsLL1Parse(self):
+
+        word = Concat(CharRange("a", "z"), KleeneStar(CharRange("a", "z")))
+        word.add_token(Token("WORD"))
+        comma = Atom(",")
+        comma.add_token(Token("COMMA"))
+        dfa = DFA(Union(word, comma, close=False))
+
+        List = NonTerminal("List")
+        Rest = NonTerminal("Rest")
+        Item = NonTerminal("Item")
+        cfg = CFG(
+            production_rules=[
+                ProductionRule(List, [Item, Rest]),
+                ProductionRule(Rest, [Terminal("COMMA"), Item, Epsilon(), Rest]),
+                ProductionRule(Rest, [Epsilon()]),
+                ProductionRule(Item, [Terminal("WORD")]),
+            ],
+            alphabet=["WORD", "COMMA"],
+            start_symbol=List,
+        )
+
+        for text in ["a", "a, b", "a, b, cd, e"]:
+            self.assertEqual(
+                self.shape(cfg.LALR_parse(tokenize_str(text, dfa))),
+                self.shape(cfg.LL1_parse(tokenize_str(text, dfa))),
+            )
+
+    def test__LALR_parse__Hooks__CalledInShiftReduceOrder(self):
+
+        events = []
+        cfg = CFG(
+            production_rules=list(self.__class__.rules[:3]),
+            alphabet=ASCII,
+            start_symbol=self.__class__.A,
+            match_hook=lambda terminal: events.append(terminal.name),
+            rule_hook=lambda rule: events.append(repr(rule)),
+        )
+
+        cfg.LALR_parse(self.tokens("b a"))
+
+        self.assertEqual(
+            events,
+            [
+                "BOF",
+                "b",
+                "A -> [b]",
+                "a",
+                "A -> [A, a]",
+                "EOF",
+                "S-Prime -> [BOF, A, EOF]",
+            ],
+        )
+
+    def test__LALR_parse__BadTokens__ParsingException(self):
+
+        with self.assertRaises(ParsingException):
+            self.__class__.cfg.LALR_parse(self.tokens("a b"))
+
+        with self.assertRaises(ParsingException):
+            self.__class__.cfg.LALR_parse(self.tokens("d"))
+
+        with self.assertRaises(ParsingException):
+            self.__class__.expression_cfg.LALR_parse(self.tokens("id +"))
+
+    def test__compile_lalr__Ambiguous__GrammarConflictError(self):
+
+        E = NonTerminal("E")
+        plus = Terminal("+")
+        cfg = CFG(
+            production_rules=[
+                ProductionRule(E, [E, plus, E]),
+                ProductionRule(E, [Terminal("id")]),
+            ],
+            alphabet=ASCII,
+            start_symbol=E,
+        )
+
+        with self.assertRaises(GrammarConflictError) as context:
+            cfg.compile_lalr()
+
+        self.assertIn("shift/reduce", context.exception.conflicts[0])
+
+    def test__compile_lalr__ReduceReduce__GrammarConflictError(self):
+
+        S = NonTerminal("S")
+        X = NonTerminal("X")
+        Y = NonTerminal("Y")
+        x = Terminal("x")
+        cfg = CFG(
+            production_rules=[
+                ProductionRule(S, [X]),
+                ProductionRule(S, [Y]),
+                ProductionRule(X, [x]),
+                ProductionRule(Y, [x]),
+            ],
+            alphabet=ASCII,
+            start_symbol=S,
+        )
+
+        with self.assertRaises(GrammarConflictError) as context:
+            cfg.compile_lalr()
+
+        self.assertIn("reduce/reduce", context.exception.conflicts[0])
+
+    def test__compile_lalr__CalledTwice__SameParser(self):
+
+        self.assertIs(
+            self.__class__.cfg.compile_lalr(), self.__class__.cfg.compile_lalr()
+        )
+
+
+class EarleyParseTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        E = NonTerminal("E")
+        cls.ambiguous_cfg = CFG(
+            production_rules=[
+                ProductionRule(E, [E, Terminal("+"), E]),
+                ProductionRule(E, [Terminal("x")]),
+            ],
+            alphabet=ASCII,
+            start_symbol=E,
+        )
+
+        L = NonTerminal("L")
+        cls.right_recursive_cfg = CFG(
+            production_rules=[
+                ProductionRule(L, [Terminal("a"), L]),
+                ProductionRule(L, [Terminal("a")]),
+            ],
+            alphabet=ASCII,
+            start_symbol=L,
+        )
+
+    def shape(self, node):
+        return (node.name, node.lexme, [self.shape(child) for child in node.children])
+
+    def tokens(self, names):
+        return [Token(name, name) for name in names.split()]
+
+    def test__earley_parse__Ambiguous__EveryTree(self):
+
+        forest = self.__class__.ambiguous_cfg.earley_parse(self.tokens("x + x + x"))
+        trees = [self.shape(tree.children[1]) for tree in forest.trees()]
+
+        x = ("E", None, [("x", "x", [])])
+        left = ("E", None, [("E", None, [x, ("+", "+", []), x]), ("+", "+", []), x])
+        right = ("E", None, [x, ("+", "+", []), ("E", None, [x, ("+", "+", []), x])])
+        self.assertCountEqual(trees, [left, right])
+        self.assertIn(self.shape(forest.tree().children[1]), [left, right])
+
+    def test__earley_parse__HighlyAmbiguous__PolynomialForest(self):
+
+        forest = self.__class__.ambiguous_cfg.earley_parse(
+            self.tokens(" + ".join(["x"] * 60))
+        )
+
+        # Catalan(59) trees, over 1e32, share a forest of a few thousand links
+        links = sum(len(links) for items in forest.sets for links in items.values())
+        self.assertLess(links, 60**3)
+        self.assertEqual(len(list(itertools.islice(forest.trees(), 25))), 25)
+        self.assertEqual(forest.tree().children[1].name, "E")
+
+        forest = self.__class__.ambiguous_cfg.earley_parse(
+            self.tokens(" + ".join(["x"] * 6))
+        )
+        self.assertEqual(len(list(forest.trees())), 42)
+
+    def test__earley_parse__RightRecursion__LinearItemsAndDeepTree(self):
+
+        forest = self.__class__.right_recursive_cfg.earley_parse(
+            self.tokens("a " * 5000)
+        )
+
+        self.assertLess(sum(len(items) for items in forest.sets), 10 * 5000)
+        node = forest.tree().children[1]
+        depth = 1
+        while len(node.children) == 2:
+            node = node.children[1]
+            depth += 1
+        self.assertEqual(depth, 5000)
+
+    def test__earley_parse__LongLeoChain__CompletedWithoutRecursion(self):
+
+        A = NonTerminal("A")
+        cfg = CFG(
+            production_rules=[
+                ProductionRule(A, [Terminal("a"), A]),
+                ProductionRule(A, [Terminal("b")]),
+            ],
+            alphabet=ASCII,
+            start_symbol=A,
+        )
+
+        # A is only completed by the last token, through a chain of 3000 items
+        forest = cfg.earley_parse(self.tokens("a " * 3000 + "b"))
+
+        self.assertLess(sum(len(items) for items in forest.sets), 10 * 3000)
+        node = forest.tree().children[1]
+        depth = 1
+        while len(node.children) == 2:
+            node = node.children[1]
+            depth += 1
+        self.assertEqual(depth, 3001)
+        self.assertEqual(node.children[0].name, "b")
+
+    def test__earley_parse__LeftRecursionAndEpsilon__SameTreeAsLALRParse(self):
+
+        A = NonTerminal("A")
+        B = NonTerminal("B")
+        C = NonTerminal("C")
+        a = Terminal("a")
+        b = Terminal("b")
+        cfg = CFG(
+            production_rules=[
+                ProductionRule(A, [Epsilon()]),
+                ProductionRule(A, [A, a]),
+                ProductionRule(A, [b]),
+                ProductionRule(B, [Terminal("c"), C]),
+                ProductionRule(A, [B, b]),
+                ProductionRule(C, [Epsilon()]),
+            ],
+            alphabet=ASCII,
+            start_symbol=A,
+        )
+
+        for text in ["", "a", "b a a", "c b a"]:
+            forest = cfg.earley_parse(self.tokens(text))
+            self.assertEqual(
+                [self.shape(tree) for tree in forest.trees()],
+                [self.shape(cfg.LALR_parse(self.tokens(text)))],
+            )
+
+    def test__earley_parse__CyclicGrammar__TreesWithoutCycles(self):
+
+        A = NonTerminal("A")
+        cfg = CFG(
+            production_rules=[
+                ProductionRule(A, [A]),
+                ProductionRule(A, [Terminal("a")]),
+                ProductionRule(A, [Epsilon()]),
+            ],
+            alphabet=ASCII,
+            start_symbol=A,
+        )
+
+        forest = cfg.earley_parse(self.tokens("a"))
+
+        expected = ("A", None, [("a", "a", [])])
+        self.assertEqual(self.shape(forest.tree().children[1]), expected)
+        self.assertEqual(
+            [self.shape(tree.children[1]) for tree in forest.trees()], [expected]
+        )
+
+    def test__earley_parse__BadTokens__ParsingException(self):
+
+        with self.assertRaises(ParsingException):
+            self.__class__.ambiguous_cfg.earley_parse(self.tokens("x x"))
+
+        with self.assertRaises(ParsingException):
+            self.__class__.ambiguous_cfg.earley_parse(self.tokens("x +"))
+
+        with self.assertRaises(ParsingException):
+            self.__class__.ambiguous_cfg.earley_parse(self.tokens("y"))
+
+
+class LL1TransformTests(unittest.TestCase):
+    def shape(self, node):
+        return (node.name, node.lexme, [self.shape(child) for child in node.children])
+
+    def tokens(self, names):
+        return [Token(name, name) for name in names.split()]
+
+    def test__to_ll1__DirectLeftRecursion__LL1WithOriginalTrees(self):
+
+        E = NonTerminal("E")
+        T = NonTerminal("T")
+        F = NonTerminal("F")
+        cfg = CFG(
+            production_rules=[
+                ProductionRule(E, [E, Terminal("+"), T]),
+                ProductionRule(E, [T]),
+                ProductionRule(T, [T, Terminal("*"), F]),
+                ProductionRule(T, [F]),
+                ProductionRule(F, [Terminal("("), E, Terminal(")")]),
+                ProductionRule(F, [Terminal("id")]),
+            ],
+            alphabet=ASCII,
+            start_symbol=E,
+        )
+
+        transform = cfg.to_ll1()
+
+        self.assertTrue(transform.cfg.is_grammar_LL1())
+        self.assertEqual(transform.tails, {"E": "E-Tail", "T": "T-Tail"})
+        for text in ["id", "id + id * id", "( id + id ) * id * id + id"]:
+            self.assertEqual(
+                self.shape(transform.LL1_parse(self.tokens(text))),
+                self.shape(cfg.LALR_parse(self.tokens(text))),
+            )
+
+    def test__to_ll1__IndirectLeftRecursion__LL1WithOriginalTrees(self):
+
+        A = NonTerminal("A")
+        B = NonTerminal("B")
+        cfg = CFG(
+            production_rules=[
+                ProductionRule(A, [B, Terminal("a")]),
+                ProductionRule(A, [Terminal("c")]),
+                ProductionRule(B, [A, Terminal("b")]),
+                ProductionRule(B, [Terminal("d")]),
+            ],
+            alphabet=ASCII,
+            start_symbol=A,
+        )
+
+        transform = cfg.to_ll1()
+
+        self.assertTrue(transform.cfg.is_grammar_LL1())
+        for text in ["c", "d a", "c b a", "d a b a b a"]:
+            self.assertEqual(
+                self.shape(transform.LL1_parse(self.tokens(text))),
+                self.shape(cfg.earley_parse(self.tokens(text)).tree()),
+            )
+
+    def test__to_ll1__CommonPrefixes__FactoredWithOriginalTrees(self):
+
+        S = NonTerminal("S")
+        x = Terminal("x")
+        y = Terminal("y")
+        cfg = CFG(
+            production_rules=[
+                ProductionRule(S, [x, y, Terminal("z")]),
+                ProductionRule(S, [x, y, Terminal("w")]),
+                ProductionRule(S, [x, y]),
+                ProductionRule(S, [x, Terminal("v")]),
+                ProductionRule(S, [Terminal("u")]),
+            ],
+            alphabet=ASCII,
+            start_symbol=S,
+        )
+
+        transform = cfg.to_ll1()
+
+        self.assertTrue(transform.cfg.is_grammar_LL1())
+        self.assertEqual(transform.factors, {"S-Factor", "S-Factor2"})
+        for text in ["x y z", "x y w", "x y", "x v", "u"]:
+            self.assertEqual(
+                self.shape(transform.LL1_parse(self.tokens(text))),
+                self.shape(cfg.earley_parse(self.tokens(text)).tree()),
+            )
+
+    def test__to_ll1__LeftRecursionWithEpsilon__LL1WithOriginalTrees(self):
+
+        A = NonTerminal("A")
+        B = NonTerminal("B")
+        C = NonTerminal("C")
+        cfg = CFG(
+            production_rules=[
+                ProductionRule(A, [Epsilon()]),
+                ProductionRule(A, [A, Terminal("a")]),
+                ProductionRule(A, [Terminal("b")]),
+                ProductionRule(B, [Terminal("c"), C]),
+                ProductionRule(A, [B, Terminal("b")]),
+                ProductionRule(C, [Epsilon()]),
+            ],
+            alphabet=ASCII,
+            start_symbol=A,
+        )
+
+        transform = cfg.to_ll1()
+
+        self.assertFalse(cfg.is_grammar_LL1())
+        self.assertTrue(transform.cfg.is_grammar_LL1())
+        for text in ["", "a", "b a a", "c b a"]:
+            self.assertEqual(
+                self.shape(transform.LL1_parse(self.tokens(text))),
+                self.shape(cfg.LALR_parse(self.tokens(text))),
+            )
+
+    def test__to_ll1__LongList__RestoredWithoutRecursion(self):
+
+        List = NonTerminal("List")
+        cfg = CFG(
+            production_rules=[
+                ProductionRule(List, [List, Terminal(","), Terminal("x")]),
+                ProductionRule(List, [Terminal("x")]),
+            ],
+            alphabet=ASCII,
+            start_symbol=List,
+        )
+
+        ast = cfg.to_ll1().LL1_parse(self.tokens(" , ".join(["x"] * 3000)))
+
+        node = ast.children[1]
+        depth = 1
+        while len(node.children) == 3:
+            self.assertEqual(node.children[2].name, "x")
+            node = node.children[0]
+            depth += 1
+        self.assertEqual(depth, 3000)
+
+
+class BatchParseTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        word = Concat(CharRange("a", "z"), KleeneStar(CharRange("a", "z")))
+        word.add_token(Token("WORD"))
+        comma = Atom(",")
+        comma.add_token(Token("COMMA"))
+        cls.dfa = DFA(Union(word, comma, close=False))
+
+        List = NonTerminal("List")
+        Rest = NonTerminal("Rest")
+        WORD = Terminal("WORD")
+        COMMA = Terminal("COMMA")
+        cls.cfg = CFG(
+            production_rules=[
+                ProductionRule(List, [WORD, Rest]),
+                ProductionRule(Rest, [COMMA, WORD, Rest]),
+                ProductionRule(Rest, [Epsilon()]),
+            ],
+            alphabet=["WORD", "COMMA"],
+            start_symbol=List,
+        )
+
+    def test__parse_batch__ManyDocuments__SameASTsInOrder(self):
+
+        documents = [f"a{'b' * i}, c, d{'e' * i}" for i in range(50)]
+
+        results = list(
+            parse_batch(
+                documents,
+                self.__class__.dfa,
+                self.__class__.cfg,
+                max_workers=2,
+                batch_size=7,
+            )
+        )
+
+        self.assertEqual(len(results), len(documents))
+        for document, result in zip(documents, results):
+            self.assertTrue(result.ok)
+            expected = self.__class__.cfg.LL1_parse(
+                tokenize_str(document, self.__class__.dfa)
+            )
+            self.assertEqual(repr(result.ast), repr(expected))
+
+    def test__parse_batch__BadDocuments__ErrorsCapturedPerDocument(self):
+
+        documents = ["a, b", "a,,b", "a ; b", "c"]
+
+        results = list(
+            parse_batch(
+                documents, self.__class__.dfa, self.__class__.cfg, max_workers=2
+            )
+        )
+
+        self.assertEqual([result.ok for result in results], [True, False, False, True])
+        self.assertIsInstance(results[1].error, ParsingException)
+        self.assertIsInstance(results[2].error, LexicalError)
+        self.assertEqual(results[2].error.error_col, 2)
+
+    def test__parse_batch__TreeTooDeepToPickle__ErrorCapturedPerDocument(self):
+
+        documents = ["a, b", ", ".join(["x"] * 3000), "c"]
+
+        results = list(
+            parse_batch(
+                documents, self.__class__.dfa, self.__class__.cfg, max_workers=2
+            )
+        )
+
+        self.assertEqual([result.ok for result in results], [True, False, True])
+        self.assertIsInstance(results[1].error, RecursionError)
+        self.assertEqual(results[2].ast.children[1].children[0].lexme, "c")
+
+    def test__parse_batch__EndlessInput__ReadLazily(self):
+
+        documents = (f"w, {'x' * (i % 5 + 1)}" for i in itertools.count())
+
+        results = parse_batch(
+            documents,
+            self.__class__.dfa,
+            self.__class__.cfg,
+            max_workers=2,
+            batch_size=4,
+        )
+        first = list(itertools.islice(results, 30))
+        results.close()
+
+        self.assertTrue(all(result.ok for result in first))
+        self.assertEqual(first[7].ast.children[1].children[1].children[1].lexme, "xxx")
 
 
 if __name__ == "__main__":
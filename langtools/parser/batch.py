@@ -0,0 +1,133 @@
+import os
+import pickle
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
+
+from langtools.ast.ast import ASTNode
+from langtools.lexer.compiled import CompiledDFA
+from langtools.lexer.dfa import DFA
+from langtools.lexer.lexer import tokenize_bytes, tokenize_str
+from langtools.parser.cfg import CFG
+
+DEFAULT_BATCH_SIZE = 64
+
+
+class BatchResult:
+    """
+    Outcome of lexing and parsing one document: its AST, or the exception
+    that stopped it (a LexicalError or ParsingException)
+    """
+
+    __slots__ = ("ast", "error")
+
+    def __init__(
+        self, ast: Optional[ASTNode] = None, error: Optional[Exception] = None
+    ):
+        self.ast = ast
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        if self.error is None:
+            return "BatchResult(ok)"
+        return f"BatchResult(error: {self.error!r})"
+
+
+# set once per worker process by _init_worker
+_worker_dfa: Optional[CompiledDFA] = None
+_worker_cfg: Optional[CFG] = None
+
+
+def _init_worker(compiled: CompiledDFA, cfg: CFG) -> None:
+    global _worker_dfa, _worker_cfg
+    _worker_dfa = compiled
+    _worker_cfg = cfg
+
+
+def _parse_document(document) -> bytes:
+    """
+    The pickled BatchResult of one document. Pickling it here means a result
+    that can't be sent back, like a tree too deep to pickle, is that
+    document's error rather than its whole batch's
+    """
+    if _worker_dfa is None or _worker_cfg is None:
+        raise Exception("parse_batch worker wasn't initialized")
+    try:
+        if isinstance(document, str):
+            tokens = tokenize_str(document, _worker_dfa)
+        else:
+            tokens = tokenize_bytes(document, _worker_dfa)
+        result = BatchResult(ast=_worker_cfg.LL1_parse(tokens))
+    except Exception as error:
+        result = BatchResult(error=error)
+
+    try:
+        return pickle.dumps(result)
+    except Exception as error:
+        return pickle.dumps(BatchResult(error=error))
+
+
+def _parse_documents(documents: List) -> List[bytes]:
+    return [_parse_document(document) for document in documents]
+
+
+def parse_batch(
+    documents: Iterable,
+    tokenizing_dfa: DFA,
+    cfg: CFG,
+    max_workers: Optional[int] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[BatchResult]:
+    """
+    Lexes and LL1 parses every document (a str, or UTF-8 bytes with a DFA
+    built with utf8=True) across a process pool, yielding one BatchResult per
+    document in input order. A document that fails doesn't stop the others.
+
+    Each worker is sent the compiled DFA and the CFG once, when it starts, and
+    documents are sent batch_size at a time. Documents are only read from the
+    iterable as batches finish, at most 2 * max_workers batches are in flight,
+    so a huge or endless iterable is processed in bounded memory. The CFG's
+    hooks, if any, must be picklable
+    """
+    compiled = tokenizing_dfa.compile()
+    if not isinstance(compiled, CompiledDFA):
+        raise Exception("parse_batch needs a DFA, a LazyDFA's tables are per process")
+
+    max_workers = max_workers or os.cpu_count() or 1
+    documents = iter(documents)
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_init_worker, initargs=(compiled, cfg)
+    ) as executor:
+        # each batch's future and how many documents it has
+        pending: Deque[Tuple[Future, int]] = deque()
+        exhausted = False
+
+        while not exhausted or pending:
+            while not exhausted and len(pending) < 2 * max_workers:
+                batch = list(islice(documents, batch_size))
+                if not batch:
+                    exhausted = True
+                    break
+                try:
+                    future = executor.submit(_parse_documents, batch)
+                except Exception as error:
+                    # the pool broke, e.g. a worker was killed
+                    future = Future()
+                    future.set_exception(error)
+                pending.append((future, len(batch)))
+
+            if pending:
+                future, size = pending.popleft()
+                try:
+                    results = future.result()
+                except Exception as error:
+                    yield from (BatchResult(error=error) for _ in range(size))
+                    continue
+                for result in results:
+                    yield pickle.loads(result)
@@ -2,8 +2,11 @@ from abc import ABC
 from collections import defaultdict
 from typing import List, Iterable, Union, Set, Optional, Tuple, Dict, Callable
 
-from langtools.parser.exceptions import ParsingException
-from langtools.lexer.token import Token
+from langtools.parser.compiled import CompiledLL1Parser
+from langtools.parser.earley import EarleyParser, ParseForest
+from langtools.parser.lalr import LALRParser
+from langtools.parser.transform import LL1Transform
+from langtools.lexer.token import Token, TokenMatch
 from langtools.ast.ast import ASTNode
 
 
@@ -85,149 +88,190 @@ class CFG:
             ProductionRule(self.start_prime, [BOF(), self.start_symbol, EOF()])
         )
         self.alphabet = alphabet
+        self._compiled: Optional[CompiledLL1Parser] = None
+        self._lalr: Optional[LALRParser] = None
+        self._earley: Optional[EarleyParser] = None
         self._generate_parse_table()
         self.match_hook: Optional[Callable[[Terminal], None]] = match_hook
         self.rule_hook: Optional[Callable[[ProductionRule], None]] = rule_hook
 
-    def _is_nullable(
-        self,
-        sequence: Union[Symbol, List[Symbol]],
-        visited: Optional[Set[Symbol]] = None,
-    ) -> bool:
-
-        visited = visited or set()
+    def _analyze(self) -> None:
+        """
+        Computes nullable, FIRST and FOLLOW of every nonterminal as fixed points
+        over an index of the rules by lhs. Nonterminals are numbered and sets
+        of terminals are int bitsets over terminal_names, so each pass is a
+        worklist of bitwise ors rather than a recursive search of every rule
+        """
+        self.rules_by_lhs: Dict[Symbol, List[ProductionRule]] = defaultdict(list)
+        ids: Dict[Symbol, int] = dict()
+        for rule in self.production_rules:
+            self.rules_by_lhs[rule.lhs].append(rule)
+            for symbol in [rule.lhs, *rule.rhs]:
+                if isinstance(symbol, NonTerminal) and symbol not in ids:
+                    ids[symbol] = len(ids)
+        self._nonterminal_ids = ids
+        self.terminal_names: List[str] = []
+        self._terminal_bits: Dict[str, int] = dict()
+        self._terminal_first: Dict[Symbol, int] = dict()
+
+        num_nonterminals = len(ids)
+
+        # a rule becomes nullable once every nonterminal in its rhs is
+        self._nullable = [False] * num_nonterminals
+        waiting = [0] * len(self.production_rules)
+        occurrences: List[List[int]] = [[] for _ in range(num_nonterminals)]
+        worklist: List[int] = []
+        for index, rule in enumerate(self.production_rules):
+            if any(
+                isinstance(symbol, Terminal) and not symbol.is_epsilon
+                for symbol in rule.rhs
+            ):
+                continue
+            for symbol in rule.rhs:
+                if isinstance(symbol, NonTerminal):
+                    waiting[index] += 1
+                    occurrences[ids[symbol]].append(index)
+            if waiting[index] == 0 and not self._nullable[ids[rule.lhs]]:
+                self._nullable[ids[rule.lhs]] = True
+                worklist.append(ids[rule.lhs])
+        while worklist:
+            for index in occurrences[worklist.pop()]:
+                waiting[index] -= 1
+                lhs = ids[self.production_rules[index].lhs]
+                if waiting[index] == 0 and not self._nullable[lhs]:
+                    self._nullable[lhs] = True
+                    worklist.append(lhs)
+
+        # FIRST of a nonterminal is FIRST of what each of its rules starts with
+        self._first = [0] * num_nonterminals
+        first_flows: List[List[int]] = [[] for _ in range(num_nonterminals)]
+        for rule in self.production_rules:
+            if not rule.rhs:
+                continue
+            if isinstance(rule.rhs[0], NonTerminal):
+                first_flows[ids[rule.rhs[0]]].append(ids[rule.lhs])
+            else:
+                self._first[ids[rule.lhs]] |= self._first_bits(rule.rhs[0])
+        self._propagate(self._first, first_flows)
+
+        # FOLLOW of a nonterminal gets FIRST of the symbol after each of its
+        # occurrences, and FOLLOW of that symbol if it is nullable, or FOLLOW
+        # of the lhs at the end of a rule
+        self._follow = [0] * num_nonterminals
+        follow_flows: List[List[int]] = [[] for _ in range(num_nonterminals)]
+
+        def followed_by(symbol: Symbol, nonterminal: int) -> None:
+            self._follow[nonterminal] |= self._first_bits(symbol)
+            if isinstance(symbol, NonTerminal) and self._nullable[ids[symbol]]:
+                follow_flows[ids[symbol]].append(nonterminal)
+
+        left_recursive = {
+            rule.lhs for rule in self.production_rules if rule.rhs[:1] == [rule.lhs]
+        }
+        for rule in self.production_rules:
+            lhs = ids[rule.lhs]
+            # a left recursive nonterminal can be followed by the start of any of
+            # its rules, which is what gives rules like A -> A a table entries
+            if rule.lhs in left_recursive and rule.rhs:
+                followed_by(rule.rhs[0], lhs)
+            for i, symbol in enumerate(rule.rhs):
+                if isinstance(symbol, NonTerminal):
+                    if i < len(rule.rhs) - 1:
+                        followed_by(rule.rhs[i + 1], ids[symbol])
+                    else:
+                        follow_flows[lhs].append(ids[symbol])
+        self._propagate(self._follow, follow_flows)
+
+        for symbol, index in ids.items():
+            symbol.nullable = self._nullable[index]
+            symbol.first = self._terminal_set(self._first[index])
+            symbol.follow = self._terminal_set(self._follow[index])
+
+    @staticmethod
+    def _propagate(sets: List[int], flows: List[List[int]]) -> None:
+        """
+        Grows sets until sets[target] includes sets[source] for every target
+        in flows[source]
+        """
+        worklist = [source for source, bits in enumerate(sets) if bits]
+        while worklist:
+            source = worklist.pop()
+            bits = sets[source]
+            for target in flows[source]:
+                merged = sets[target] | bits
+                if merged != sets[target]:
+                    sets[target] = merged
+                    worklist.append(target)
+
+    def _first_bits(self, symbol: Symbol) -> int:
+        if isinstance(symbol, NonTerminal):
+            index = self._nonterminal_ids.get(symbol)
+            return 0 if index is None else self._first[index]
+        bits = self._terminal_first.get(symbol)
+        if bits is None:
+            bits = 0
+            if not isinstance(symbol, Epsilon):
+                for name in symbol.first or ():
+                    if name not in self._terminal_bits:
+                        self._terminal_bits[name] = len(self.terminal_names)
+                        self.terminal_names.append(name)
+                    bits |= 1 << self._terminal_bits[name]
+            self._terminal_first[symbol] = bits
+        return bits
+
+    def _follow_bits(self, symbol: Symbol) -> int:
+        index = self._nonterminal_ids.get(symbol)
+        return 0 if index is None else self._follow[index]
+
+    def _terminal_set(self, bits: int) -> Set[str]:
+        names: Set[str] = set()
+        while bits:
+            lowest = bits & -bits
+            names.add(self.terminal_names[lowest.bit_length() - 1])
+            bits ^= lowest
+        return names
+
+    def _is_nullable(self, sequence: Union[Symbol, List[Symbol]]) -> bool:
 
         if not hasattr(sequence, "__iter__"):
             sequence = [sequence]
 
-        result = True
         for symbol in sequence:
-            if symbol in visited:
-                continue
-            else:
-                visited.add(symbol)
-                if symbol.nullable is False:
-                    result = False
-                    break
-                elif isinstance(symbol, Terminal) and symbol.is_epsilon is False:
-                    result = False
-                    break
-                elif isinstance(symbol, NonTerminal):
-                    symbol_is_nullable = False
-                    for rule in self.production_rules:
-                        if rule.lhs is symbol:
-                            rule_is_nullable = self._is_nullable(
-                                visited=visited, sequence=rule.rhs
-                            )
-
-                            # if any rule is "nullable", the symbol is nullable
-                            if rule_is_nullable is True:
-                                symbol_is_nullable = True
-                                break
-
-                    symbol.nullable = symbol_is_nullable
-                    if symbol_is_nullable is False:
-                        result = False
-                        break
-
-        return result
-
-    def _find_first(
-        self, symbol: Symbol, visited: Optional[Set[Symbol]] = None
-    ) -> Set[str]:
-
-        visited = visited or set()
-
-        result: Set[str] = set()
-        if symbol in visited:
-            return result
-
-        # note terminals should always have first already defined
-        if symbol.first is not None:
-            return symbol.first
-
-        visited.add(symbol)
-        for rule in self.production_rules:
-            if rule.lhs is symbol:
-                if (
-                    isinstance(rule.rhs[0], Terminal)
-                    and rule.rhs[0].is_epsilon is False
-                    and rule.rhs[0].first is not None
-                ):
-                    result = result.union(rule.rhs[0].first)
-                elif (
-                    isinstance(rule.rhs[0], Terminal) and rule.rhs[0].is_epsilon is True
-                ):
-                    # intentionally do nothing
-                    pass
-                elif isinstance(rule.rhs[0], NonTerminal):
-                    result = result.union(
-                        self._find_first(visited=visited, symbol=rule.rhs[0])
-                    )
-
-        symbol.first = result
-        return result
-
-    def _find_follow(
-        self, symbol: Symbol, visited: Optional[Set[Symbol]] = None
-    ) -> Set[str]:
-
-        visited = visited or set()
-
-        if symbol in visited:
-            return set()
-
-        if symbol.follow is not None:
-            return symbol.follow
-
-        visited.add(symbol)
-        result: Set[str] = set()
-
-        symbol_has_left_recursive_rule = False
-        for rule in self.production_rules:
-            if rule.lhs is symbol and rule.rhs[0] is symbol:
-                symbol_has_left_recursive_rule = True
-                break
-
-        for rule in self.production_rules:
-            if symbol_has_left_recursive_rule and rule.lhs is symbol:
-                result = result.union(self._find_first(rule.rhs[0]))
-                if self._is_nullable(rule.rhs[0]):
-                    result = result.union(self._find_follow(rule.rhs[0], visited))
+            if isinstance(symbol, NonTerminal):
+                index = self._nonterminal_ids.get(symbol)
+                if index is None or not self._nullable[index]:
+                    return False
+            elif not isinstance(symbol, Epsilon):
+                return False
+        return True
 
-            for i in range(len(rule.rhs)):
-                if rule.rhs[i] is symbol:
-                    if i < len(rule.rhs) - 1:
-                        result = result.union(self._find_first(rule.rhs[i + 1]))
-                        if self._is_nullable(rule.rhs[i + 1]):
-                            result = result.union(
-                                self._find_follow(rule.rhs[i + 1], visited)
-                            )
-                    else:
-                        result = result.union(self._find_follow(rule.lhs, visited))
+    def _find_first(self, symbol: Symbol) -> Set[str]:
+        return self._terminal_set(self._first_bits(symbol))
 
-        return result
+    def _find_follow(self, symbol: Symbol) -> Set[str]:
+        return self._terminal_set(self._follow_bits(symbol))
 
     def _generate_parse_table(self) -> None:
+        self._analyze()
         parse_table: Dict[Tuple[NonTerminal, str], Set[ProductionRule]] = defaultdict(
             set
         )
         for rule in self.production_rules:
-            transition_chars: Set[str] = set()
-            transition_chars = transition_chars.union(self._find_first(rule.rhs[0]))
+            transition_bits = self._first_bits(rule.rhs[0])
 
             if self._is_nullable(rule.rhs[0]):
-                transition_chars = transition_chars.union(
-                    self._find_follow(rule.rhs[0])
-                )
+                transition_bits |= self._follow_bits(rule.rhs[0])
 
             if self._is_nullable(rule.rhs):
-                transition_chars = transition_chars.union(self._find_follow(rule.lhs))
+                transition_bits |= self._follow_bits(rule.lhs)
 
-            for char in transition_chars:
+            for char in self._terminal_set(transition_bits):
                 parse_table[(rule.lhs, char)].add(rule)
 
         self.parse_table = parse_table
+        self._compiled = None
+        self._lalr = None
+        self._earley = None
 
     def is_grammar_LL1(self) -> bool:
         for index, cell in self.parse_table.items():
@@ -237,67 +281,62 @@ class CFG:
                 return False
         return True
 
+    def to_ll1(self) -> LL1Transform:
+        """
+        Rewrites the grammar without left recursion and with common prefixes
+        factored out, which often makes it LL1. The result's cfg is the new
+        grammar and its LL1_parse returns trees shaped like this grammar's.
+        Check result.cfg.is_grammar_LL1(), not every grammar has an LL1 form
+        """
+        return LL1Transform(self)
+
     def print_parse_table(self) -> None:
         for key, value in self.parse_table.items():
             print(f"{key} : {value}")
 
-    def LL1_parse(self, tokens: List[Token]) -> ASTNode:
-
-        root = ASTNode(name="Container")
-        ast_stack: List[Tuple[ASTNode, int]] = [(root, 1)]
-
-        if self.is_grammar_LL1():
-            stack: List[Symbol] = [self.start_prime]
-            tokens = [Token(name="BOF")] + tokens + [Token(name="EOF")]
-            token_iterator = iter(tokens)
-            curr_token = next(token_iterator)
-            tokens_exhausted = False
-            while stack:
-                top = stack.pop()
-                while isinstance(top, Epsilon):
-                    top = stack.pop()
-                    ast_stack[-1] = (ast_stack[-1][0], ast_stack[-1][1] - 1)
-                    while len(ast_stack) > 1 and ast_stack[-1][1] == 0:
-                        ast_stack.pop()
-                        ast_stack[-1] = (ast_stack[-1][0], ast_stack[-1][1] - 1)
-                if isinstance(top, NonTerminal):
-                    correct_rule = self.parse_table[(top, curr_token.name)]
-                    if len(correct_rule) < 1:
-                        raise ParsingException(
-                            f"ParsingException: No matching rule starting at {top}, reading {curr_token.name} found"
-                        )
-                    for rule in correct_rule:
-                        # this will only run once
-                        rule_node = ASTNode(name=rule.lhs.name)
-                        ast_stack[-1][0].children.append(rule_node)
-                        ast_stack.append((rule_node, len(rule.rhs)))
-                        stack += list(reversed(rule.rhs))
-                elif isinstance(top, Terminal):
-                    if top.name == curr_token.name:
-                        ast_stack[-1][0].children.append(
-                            ASTNode(name=curr_token.name, lexme=curr_token.lexme)
-                        )
-                        ast_stack[-1] = (ast_stack[-1][0], ast_stack[-1][1] - 1)
-                        while len(ast_stack) > 1 and ast_stack[-1][1] == 0:
-                            ast_stack.pop()
-                            ast_stack[-1] = (ast_stack[-1][0], ast_stack[-1][1] - 1)
-                        try:
-                            curr_token = next(token_iterator)
-                        except StopIteration:
-                            tokens_exhausted = True
-                            break
-                    else:
-                        # TODO: Improve this error message
-                        raise ParsingException(
-                            f"Failed to match token: {curr_token}, top: {top}"
-                        )
-
-            if tokens_exhausted is False:
-                raise ParsingException(
-                    f"ParsingException: Unexpected token: {curr_token}"
-                )
-            elif len(stack) > 0:
-                raise ParsingException(f"ParsingException: Expected more tokens")
-            return root.children[0]
-        else:
-            raise ParsingException("Grammar must be LL1 in order to LL1 parse")
+    def compile(self) -> CompiledLL1Parser:
+        """
+        Returns the table driven form of the LL1 parser, built once and cached.
+        Checking the grammar is LL1 happens here, once, rather than per parse
+        """
+        if self._compiled is None:
+            self._compiled = CompiledLL1Parser(self)
+        return self._compiled
+
+    def LL1_parse(self, tokens: Iterable[Union[Token, TokenMatch]]) -> ASTNode:
+        """
+        Predictive parse of tokens, returns the S-Prime node with BOF, the
+        start symbol's tree and EOF as children. Raises ParsingException if
+        the tokens don't match or the grammar isn't LL1
+        """
+        return self.compile().parse(tokens)
+
+    def compile_lalr(self) -> LALRParser:
+        """
+        Returns the LALR(1) tables of the grammar, built once and cached.
+        Raises GrammarConflictError listing every conflict if the grammar
+        isn't LALR(1)
+        """
+        if self._lalr is None:
+            self._lalr = LALRParser(self)
+        return self._lalr
+
+    def LALR_parse(self, tokens: Iterable[Token]) -> ASTNode:
+        """
+        Shift-reduce parse of tokens, returns the same tree LL1_parse would,
+        so left recursive rules give left leaning trees. match_hook is called
+        with each terminal as it is shifted and rule_hook with each rule as
+        it is reduced, children before their parents
+        """
+        return self.compile_lalr().parse(tokens, self.match_hook, self.rule_hook)
+
+    def earley_parse(self, tokens: Iterable[Token]) -> ParseForest:
+        """
+        Parses tokens with any grammar, ambiguous or not, and returns the
+        forest of every parse. forest.tree() builds one tree, shaped like
+        LL1_parse's, and forest.trees() iterates over all of them. Raises
+        ParsingException if there is no parse
+        """
+        if self._earley is None:
+            self._earley = EarleyParser(self)
+        return self._earley.parse(tokens)
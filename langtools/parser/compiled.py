@@ -0,0 +1,151 @@
+from array import array
+from itertools import chain
+from typing import Dict, Iterable, List, Tuple, Union
+
+from langtools.ast.ast import ASTNode
+from langtools.lexer.token import Token, TokenMatch
+from langtools.parser.exceptions import ParsingException
+
+# table entry of a (nonterminal, terminal) pair without a rule
+NO_RULE = -1
+# id of token names no rule mentions
+UNKNOWN_TERMINAL = -1
+
+
+class CompiledLL1Parser:
+    """
+    Flat, integer indexed form of an LL1 CFG's parse table. Nonterminals and
+    terminals are numbered from 0 and the rule for each pair lives in one row
+    major table of num_nonterminals * num_terminals entries. On the parse
+    stack a nonterminal is its id and a terminal t is ~t (always negative).
+    Each rule's right hand side is kept reversed, ready to push, with Epsilon
+    symbols left out
+    """
+
+    def __init__(self, cfg):
+        self.is_LL1 = cfg.is_grammar_LL1()
+
+        self.nonterminal_ids: Dict[object, int] = dict(cfg._nonterminal_ids)
+        self.nonterminal_names: List[str] = [None] * len(self.nonterminal_ids)
+        for symbol, nonterminal in self.nonterminal_ids.items():
+            self.nonterminal_names[nonterminal] = symbol.name
+
+        self.terminal_ids: Dict[str, int] = dict()
+        self.terminal_names: List[str] = []
+        names = list(cfg.terminal_names)
+        for rule in cfg.production_rules:
+            names.extend(
+                symbol.name
+                for symbol in rule.rhs
+                if symbol not in self.nonterminal_ids and not symbol.is_epsilon
+            )
+        for name in names:
+            if name not in self.terminal_ids:
+                self.terminal_ids[name] = len(self.terminal_names)
+                self.terminal_names.append(name)
+        self.num_terminals = len(self.terminal_names)
+
+        rule_ids = {rule: index for index, rule in enumerate(cfg.production_rules)}
+        self.rule_names: List[str] = [rule.lhs.name for rule in cfg.production_rules]
+        # Epsilon symbols complete without a node, so they are never pushed
+        self.reversed_rhs: List[Tuple[int, ...]] = [
+            tuple(
+                self._encode(symbol)
+                for symbol in reversed(rule.rhs)
+                if symbol in self.nonterminal_ids or not symbol.is_epsilon
+            )
+            for rule in cfg.production_rules
+        ]
+
+        self.table = array(
+            "i", [NO_RULE] * (len(self.nonterminal_names) * self.num_terminals)
+        )
+        for (nonterminal, name), rules in cfg.parse_table.items():
+            if len(rules) == 1:
+                (rule,) = rules
+                self.table[
+                    self.nonterminal_ids[nonterminal] * self.num_terminals
+                    + self.terminal_ids[name]
+                ] = rule_ids[rule]
+
+        self.start_prime = self.nonterminal_ids[cfg.start_prime]
+
+    def _encode(self, symbol) -> int:
+        if symbol in self.nonterminal_ids:
+            return self.nonterminal_ids[symbol]
+        return ~self.terminal_ids[symbol.name]
+
+    def parse(self, tokens: Iterable[Union[Token, TokenMatch]]) -> ASTNode:
+        """
+        Predictive parse of tokens, see CFG.LL1_parse
+        """
+        if not self.is_LL1:
+            raise ParsingException("Grammar must be LL1 in order to LL1 parse")
+
+        table = self.table
+        num_terminals = self.num_terminals
+        terminal_ids = self.terminal_ids
+        rule_names = self.rule_names
+        reversed_rhs = self.reversed_rhs
+
+        root = ASTNode(name="Container")
+        # the open nodes and how many more children each of them expects
+        nodes: List[ASTNode] = [root]
+        remaining: List[int] = [1]
+        stack: List[int] = [self.start_prime]
+
+        token_iterator = chain((Token(name="BOF"),), tokens, (Token(name="EOF"),))
+        curr_token = next(token_iterator)
+        terminal = terminal_ids.get(curr_token.name, UNKNOWN_TERMINAL)
+        tokens_exhausted = False
+
+        while stack:
+            top = stack.pop()
+            if top >= 0:
+                rule = NO_RULE
+                if terminal != UNKNOWN_TERMINAL:
+                    rule = table[top * num_terminals + terminal]
+                if rule == NO_RULE:
+                    raise ParsingException(
+                        "ParsingException: No matching rule starting at"
+                        f" {self.nonterminal_names[top]}, reading {curr_token.name}"
+                        " found"
+                    )
+                rule_node = ASTNode(name=rule_names[rule])
+                nodes[-1].children.append(rule_node)
+                rhs = reversed_rhs[rule]
+                if rhs:
+                    nodes.append(rule_node)
+                    remaining.append(len(rhs))
+                    stack.extend(rhs)
+                    continue
+            else:
+                if ~top != terminal:
+                    raise ParsingException(
+                        f"Failed to match token: {curr_token},"
+                        f" top: {self.terminal_names[~top]}"
+                    )
+                nodes[-1].children.append(
+                    ASTNode(name=curr_token.name, lexme=curr_token.lexme)
+                )
+
+            # a child was completed, close every node that has all of its children
+            remaining[-1] -= 1
+            while remaining[-1] == 0 and len(nodes) > 1:
+                nodes.pop()
+                remaining.pop()
+                remaining[-1] -= 1
+
+            if top < 0:
+                next_token = next(token_iterator, None)
+                if next_token is None:
+                    tokens_exhausted = True
+                    break
+                curr_token = next_token
+                terminal = terminal_ids.get(curr_token.name, UNKNOWN_TERMINAL)
+
+        if tokens_exhausted is False:
+            raise ParsingException(f"ParsingException: Unexpected token: {curr_token}")
+        elif len(stack) > 0:
+            raise ParsingException("ParsingException: Expected more tokens")
+        return root.children[0]
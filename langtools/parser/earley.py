@@ -0,0 +1,436 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from langtools.ast.ast import ASTNode
+from langtools.lexer.token import Token
+from langtools.parser.encoding import EncodedGrammar
+from langtools.parser.exceptions import ParsingException
+
+UNKNOWN_TERMINAL = -1
+
+# (rule, dot, origin) of an item, within the Earley set it's in
+Item = Tuple[int, int, int]
+# (nonterminal, start, end), every derivation of the nonterminal over
+# tokens[start:end]
+Node = Tuple[int, int, int]
+# (set the item before the dot moved is in, that item, the child the dot
+# moved over). The child is a token position or a Node
+Link = Tuple[int, Item, Union[int, Node]]
+# (Leo item, node), a completion that went straight to the Leo item's top
+LeoLink = Tuple["LeoItem", Node]
+
+
+class LeoItem:
+    """
+    Marks a deterministic reduction path: item is the only item of Earley
+    set position waiting on a nonterminal and it's waiting on its last
+    symbol, so completing that nonterminal completes item, which may in
+    turn be the only thing waiting on its lhs, and so on up to top. The
+    chain is followed in one step, which is what makes right recursion
+    linear, and only unwound if a tree through it is extracted
+    """
+
+    __slots__ = ("position", "item", "parent", "top")
+
+    def __init__(
+        self, position: int, item: Item, parent: Optional["LeoItem"], top: Item
+    ):
+        self.position = position
+        self.item = item
+        self.parent = parent
+        self.top = top
+
+
+def _add_item(
+    items: Dict[Item, List[Link]],
+    worklist: List[Item],
+    item: Item,
+    link: Optional[Link],
+) -> None:
+    """
+    Adds item to an Earley set, queued to be processed if it's new
+    """
+    links = items.get(item)
+    if links is None:
+        links = items[item] = []
+        worklist.append(item)
+    if link is not None:
+        links.append(link)
+
+
+class EarleyParser(EncodedGrammar):
+    """
+    Earley recognizer over any CFG, ambiguous, left or right recursive or
+    with cycles, that records enough to build a shared packed parse forest.
+    Items in each set are indexed by the symbol after their dot, nullable
+    nonterminals are stepped over when predicted (Aycock and Horspool) and
+    right recursion is completed through Leo items
+    """
+
+    def __init__(self, cfg):
+        super().__init__(cfg)
+        self.start_prime = self.rule_lhs[self.accept_rule]
+        self.cyclic = self._find_cycles()
+
+    def _find_cycles(self) -> bool:
+        """
+        Whether some nonterminal derives itself, A =>+ A, which puts cycles
+        in the forest
+        """
+        num_terminals = self.num_terminals
+        derives: List[set] = [set() for _ in range(self.num_nonterminals)]
+        for lhs, rhs in zip(self.rule_lhs, self.rule_rhs):
+            if any(symbol < num_terminals for symbol in rhs):
+                continue
+            nullable = [self.nullable[symbol - num_terminals] for symbol in rhs]
+            for index, symbol in enumerate(rhs):
+                if all(nullable[:index]) and all(nullable[index + 1 :]):
+                    derives[lhs].add(symbol - num_terminals)
+
+        for nonterminal in range(self.num_nonterminals):
+            reached = set(derives[nonterminal])
+            frontier = list(reached)
+            while frontier:
+                for derived in derives[frontier.pop()]:
+                    if derived not in reached:
+                        reached.add(derived)
+                        frontier.append(derived)
+            if nonterminal in reached:
+                return True
+        return False
+
+    def _leo_item(
+        self,
+        leo_items: Dict[Tuple[int, int], Optional[LeoItem]],
+        waiting: List[Dict[int, List[Item]]],
+        position: int,
+        nonterminal: int,
+    ) -> Optional[LeoItem]:
+        # the chain is walked up first and its Leo items made top down, so
+        # long chains need no recursion
+        chain: List[Tuple[Tuple[int, int], Item]] = []
+        key = (position, nonterminal)
+        above: Optional[LeoItem] = None
+        while True:
+            if key in leo_items:
+                above = leo_items[key]
+                break
+            # a chain that leads back here stops instead
+            leo_items[key] = None
+
+            parents = waiting[key[0]].get(self.num_terminals + key[1])
+            if parents is None or len(parents) != 1:
+                break
+            rule, dot, origin = parents[0]
+            if dot + 1 != self.rule_lengths[rule]:
+                break
+            chain.append((key, parents[0]))
+            key = (origin, self.rule_lhs[rule])
+
+        for key, item in reversed(chain):
+            rule, dot, origin = item
+            top = above.top if above is not None else (rule, dot + 1, origin)
+            above = leo_items[key] = LeoItem(key[0], item, above, top)
+        return above
+
+    def parse(self, tokens: Iterable[Token]) -> "ParseForest":
+        """
+        Parses tokens, see CFG.earley_parse
+        """
+        tokens = [Token(name="BOF"), *tokens, Token(name="EOF")]
+        num_terminals = self.num_terminals
+        terminal_ids = self.terminal_ids
+        rule_lhs = self.rule_lhs
+        rule_rhs = self.rule_rhs
+        rules_of = self.rules_of
+        nullable = self.nullable
+
+        sets: List[Dict[Item, List[Link]]] = []
+        # items of each set by the symbol after their dot
+        waiting: List[Dict[int, List[Item]]] = []
+        # complete items of each set by (lhs, origin), the packed nodes
+        completed: List[Dict[Tuple[int, int], List[Item]]] = []
+        # completions through Leo items, by the top item, kept out of the
+        # sets until a tree through them is extracted
+        leo_links: List[Dict[Item, List[LeoLink]]] = []
+        leo_items: Dict[Tuple[int, int], Optional[LeoItem]] = dict()
+
+        next_items: Dict[Item, List[Link]] = {(self.accept_rule, 0, 0): []}
+        for position in range(len(tokens) + 1):
+            items = next_items
+            set_waiting: Dict[int, List[Item]] = dict()
+            set_completed: Dict[Tuple[int, int], List[Item]] = dict()
+            sets.append(items)
+            waiting.append(set_waiting)
+            completed.append(set_completed)
+            set_leo_links: Dict[Item, List[LeoLink]] = dict()
+            leo_links.append(set_leo_links)
+            worklist = list(items)
+            predicted = set()
+
+            for item in worklist:
+                rule, dot, origin = item
+                rhs = rule_rhs[rule]
+
+                if dot == len(rhs):
+                    lhs = rule_lhs[rule]
+                    alternatives = set_completed.get((lhs, origin))
+                    if alternatives is not None:
+                        alternatives.append(item)
+                        continue
+                    set_completed[(lhs, origin)] = [item]
+                    # items waiting on a nullable lhs in this set stepped over it
+                    # when it was predicted
+                    if origin == position:
+                        continue
+                    node = (lhs, origin, position)
+                    leo = self._leo_item(leo_items, waiting, origin, lhs)
+                    if leo is not None:
+                        _add_item(items, worklist, leo.top, None)
+                        set_leo_links.setdefault(leo.top, []).append((leo, node))
+                    else:
+                        for parent in waiting[origin].get(num_terminals + lhs, ()):
+                            _add_item(
+                                items,
+                                worklist,
+                                (parent[0], parent[1] + 1, parent[2]),
+                                (origin, parent, node),
+                            )
+                    continue
+
+                symbol = rhs[dot]
+                set_waiting.setdefault(symbol, []).append(item)
+                if symbol >= num_terminals:
+                    nonterminal = symbol - num_terminals
+                    if nonterminal not in predicted:
+                        predicted.add(nonterminal)
+                        for predicted_rule in rules_of[nonterminal]:
+                            _add_item(
+                                items, worklist, (predicted_rule, 0, position), None
+                            )
+                    if nullable[nonterminal]:
+                        _add_item(
+                            items,
+                            worklist,
+                            (rule, dot + 1, origin),
+                            (position, item, (nonterminal, position, position)),
+                        )
+
+            if position == len(tokens):
+                break
+
+            token = tokens[position]
+            terminal = terminal_ids.get(token.name, UNKNOWN_TERMINAL)
+            next_items = dict()
+            for item in set_waiting.get(terminal, ()):
+                next_items[(item[0], item[1] + 1, item[2])] = [
+                    (position, item, position)
+                ]
+            if not next_items:
+                if position == len(tokens) - 1:
+                    raise ParsingException("ParsingException: Expected more tokens")
+                raise ParsingException(f"ParsingException: Unexpected token: {token}")
+
+        return ParseForest(
+            self,
+            tokens,
+            sets,
+            completed,
+            leo_links,
+            (self.start_prime, 0, len(tokens)),
+        )
+
+
+class ParseForest:
+    """
+    Every parse of a token list, as the Earley sets that found them. A node
+    (nonterminal, start, end) is shared by everything built on it and packs
+    its derivations, the complete items for it, and each item links back
+    through the item before its dot, so the forest stays polynomial in the
+    number of tokens however many trees it holds. Trees are only built on
+    request
+    """
+
+    def __init__(
+        self,
+        parser: EarleyParser,
+        tokens: List[Token],
+        sets: List[Dict[Item, List[Link]]],
+        completed: List[Dict[Tuple[int, int], List[Item]]],
+        leo_links: List[Dict[Item, List[LeoLink]]],
+        root: Node,
+    ):
+        self.parser = parser
+        self.tokens = tokens
+        self.sets = sets
+        self.completed = completed
+        self.leo_links = leo_links
+        self.root = root
+
+    def _alternatives(self, node: Node) -> List[Item]:
+        return self.completed[node[2]].get((node[0], node[1]), [])
+
+    def _links(self, position: int, item: Item) -> List[Link]:
+        """
+        Links of an item, with any Leo links unwound into the items they
+        skipped, which are added to the set and their nodes
+        """
+        links = self.sets[position][item]
+        leo_links = self.leo_links[position].pop(item, None)
+        if leo_links is None:
+            return links
+
+        rule_lhs = self.parser.rule_lhs
+        for leo, child in leo_links:
+            while leo.parent is not None:
+                rule, dot, origin = leo.item
+                skipped = (rule, dot + 1, origin)
+                skipped_links = self.sets[position].get(skipped)
+                if skipped_links is None:
+                    skipped_links = self.sets[position][skipped] = []
+                    self.completed[position].setdefault(
+                        (rule_lhs[rule], origin), []
+                    ).append(skipped)
+                if (leo.position, leo.item, child) not in skipped_links:
+                    skipped_links.append((leo.position, leo.item, child))
+                child = (rule_lhs[rule], origin, position)
+                leo = leo.parent
+            if (leo.position, leo.item, child) not in links:
+                links.append((leo.position, leo.item, child))
+        return links
+
+    def _post_order(self) -> List[Tuple[bool, tuple]]:
+        """
+        Nodes and items reachable from the root, (True, node) or
+        (False, (position, item)), each after what it links to unless they
+        are on a cycle
+        """
+        order: List[Tuple[bool, tuple]] = []
+        seen = set()
+        stack: List[Tuple[bool, tuple, bool]] = [(True, self.root, False)]
+        while stack:
+            is_node, key, finished = stack.pop()
+            if finished:
+                order.append((is_node, key))
+                continue
+            if (is_node, key) in seen:
+                continue
+            seen.add((is_node, key))
+            stack.append((is_node, key, True))
+
+            if is_node:
+                for item in self._alternatives(key):
+                    if item[1] > 0:
+                        stack.append((False, (key[2], item), False))
+                continue
+            position, item = key
+            for origin, pred, child in self._links(position, item):
+                if pred[1] > 0:
+                    stack.append((False, (origin, pred), False))
+                if not isinstance(child, int):
+                    stack.append((True, child, False))
+        return order
+
+    def tree(self) -> ASTNode:
+        """
+        One parse tree, the same shape LL1_parse gives: the S-Prime node with
+        BOF, the start symbol's tree and EOF as children, Epsilon giving no
+        node. Built without recursion, so deep trees are fine
+        """
+        chosen_alternative: Dict[Node, Item] = dict()
+        chosen_link: Dict[Tuple[int, Item], Link] = dict()
+
+        def is_built(origin: int, pred: Item, child: Union[int, Node]) -> bool:
+            return (pred[1] == 0 or (origin, pred) in chosen_link) and (
+                isinstance(child, int) or child in chosen_alternative
+            )
+
+        # a derivation is picked for something once everything it uses has
+        # one, which keeps cycles out of the tree
+        order = self._post_order()
+        changed = True
+        while changed:
+            changed = False
+            for is_node, key in order:
+                if is_node:
+                    if key in chosen_alternative:
+                        continue
+                    for item in self._alternatives(key):
+                        if item[1] == 0 or (key[2], item) in chosen_link:
+                            chosen_alternative[key] = item
+                            changed = True
+                            break
+                elif key not in chosen_link:
+                    for link in self._links(*key):
+                        if is_built(*link):
+                            chosen_link[key] = link
+                            changed = True
+                            break
+
+        nonterminal_names = self.parser.nonterminal_names
+        root = ASTNode(name=nonterminal_names[self.root[0]])
+        stack: List[Tuple[Node, ASTNode]] = [(self.root, root)]
+        while stack:
+            node, ast = stack.pop()
+            position, item = node[2], chosen_alternative[node]
+            while item[1] > 0:
+                origin, pred, child = chosen_link[(position, item)]
+                if isinstance(child, int):
+                    token = self.tokens[child]
+                    ast.children.append(ASTNode(name=token.name, lexme=token.lexme))
+                else:
+                    child_ast = ASTNode(name=nonterminal_names[child[0]])
+                    ast.children.append(child_ast)
+                    stack.append((child, child_ast))
+                position, item = origin, pred
+            ast.children.reverse()
+        return root
+
+    def trees(self) -> Iterator[ASTNode]:
+        """
+        Every parse tree, built one at a time as they are iterated. With a
+        cyclic grammar there are infinitely many, only trees where no node
+        contains itself are given
+        """
+        for description in self._node_descriptions(self.root, frozenset()):
+            yield self._build(description)
+
+    def _node_descriptions(self, node: Node, path: frozenset) -> Iterator[tuple]:
+        # a tree is described as nested (nonterminal, children) tuples with
+        # token positions as leaves, which can be shared between trees
+        if self.parser.cyclic:
+            if node in path:
+                return
+            path = path | {node}
+        for item in self._alternatives(node):
+            for children in self._item_descriptions(node[2], item, path):
+                yield (node[0], children)
+
+    def _item_descriptions(
+        self, position: int, item: Item, path: frozenset
+    ) -> Iterator[tuple]:
+        if item[1] == 0:
+            yield ()
+            return
+        for origin, pred, child in self._links(position, item):
+            for prefix in self._item_descriptions(origin, pred, path):
+                if isinstance(child, int):
+                    yield prefix + (child,)
+                    continue
+                for child_description in self._node_descriptions(child, path):
+                    yield prefix + (child_description,)
+
+    def _build(self, description: tuple) -> ASTNode:
+        nonterminal_names = self.parser.nonterminal_names
+        root = ASTNode(name=nonterminal_names[description[0]])
+        stack = [(root, description[1])]
+        while stack:
+            ast, children = stack.pop()
+            for child in children:
+                if isinstance(child, int):
+                    token = self.tokens[child]
+                    ast.children.append(ASTNode(name=token.name, lexme=token.lexme))
+                else:
+                    child_ast = ASTNode(name=nonterminal_names[child[0]])
+                    ast.children.append(child_ast)
+                    stack.append((child_ast, child[1]))
+        return root
@@ -0,0 +1,100 @@
+from array import array
+from typing import Dict, List, Tuple
+
+# name of the terminal after EOF, which the S-Prime rule is reduced on
+END = "$end"
+
+
+class EncodedGrammar:
+    """
+    A CFG's symbols and rules numbered for table driven parsers. Terminals
+    are numbered from 0 by name, nonterminals are numbered after them so
+    both share one symbol numbering in rule_rhs. Epsilon symbols derive
+    nothing, so they are left out of rule_rhs
+    """
+
+    def __init__(self, cfg):
+        from langtools.parser.cfg import Epsilon, NonTerminal
+
+        self.nonterminal_names: List[str] = []
+        nonterminal_ids: Dict[object, int] = dict()
+        for rule in cfg.production_rules:
+            if rule.lhs not in nonterminal_ids:
+                nonterminal_ids[rule.lhs] = len(nonterminal_ids)
+                self.nonterminal_names.append(rule.lhs.name)
+
+        self.terminal_ids: Dict[str, int] = dict()
+        self.terminal_names: List[str] = []
+        # first Terminal of each name, for match_hook
+        self.terminal_symbols: List[object] = []
+        for rule in cfg.production_rules:
+            for symbol in rule.rhs:
+                if symbol in nonterminal_ids:
+                    continue
+                if isinstance(symbol, NonTerminal):
+                    # a nonterminal without rules, it never derives anything
+                    nonterminal_ids[symbol] = len(nonterminal_ids)
+                    self.nonterminal_names.append(symbol.name)
+                elif (
+                    not isinstance(symbol, Epsilon)
+                    and symbol.name not in self.terminal_ids
+                ):
+                    self.terminal_ids[symbol.name] = len(self.terminal_names)
+                    self.terminal_names.append(symbol.name)
+                    self.terminal_symbols.append(symbol)
+        self.end = self.terminal_ids[END] = len(self.terminal_names)
+        self.terminal_names.append(END)
+        self.terminal_symbols.append(None)
+        self.num_terminals = len(self.terminal_names)
+        self.num_nonterminals = len(self.nonterminal_names)
+
+        num_terminals = self.num_terminals
+        self.rules = list(cfg.production_rules)
+        self.rule_lhs = array("i", [nonterminal_ids[rule.lhs] for rule in self.rules])
+        self.rule_rhs: List[Tuple[int, ...]] = [
+            tuple(
+                (
+                    num_terminals + nonterminal_ids[symbol]
+                    if symbol in nonterminal_ids
+                    else self.terminal_ids[symbol.name]
+                )
+                for symbol in rule.rhs
+                if not isinstance(symbol, Epsilon)
+            )
+            for rule in self.rules
+        ]
+        self.rule_lengths = array("i", [len(rhs) for rhs in self.rule_rhs])
+        self.accept_rule = self.rules.index(
+            next(rule for rule in self.rules if rule.lhs is cfg.start_prime)
+        )
+        self.rules_of: List[List[int]] = [[] for _ in range(self.num_nonterminals)]
+        for index, lhs in enumerate(self.rule_lhs):
+            self.rules_of[lhs].append(index)
+
+        # a rule becomes nullable once every nonterminal in its rhs is
+        self.nullable: List[bool] = [False] * self.num_nonterminals
+        waiting = [len(rhs) for rhs in self.rule_rhs]
+        occurrences: List[List[int]] = [[] for _ in range(self.num_nonterminals)]
+        worklist: List[int] = []
+        for lhs, rules in enumerate(self.rules_of):
+            for rule in rules:
+                rhs = self.rule_rhs[rule]
+                if any(symbol < num_terminals for symbol in rhs):
+                    continue
+                for symbol in rhs:
+                    occurrences[symbol - num_terminals].append(rule)
+                if not rhs and not self.nullable[lhs]:
+                    self.nullable[lhs] = True
+                    worklist.append(lhs)
+        while worklist:
+            for rule in occurrences[worklist.pop()]:
+                waiting[rule] -= 1
+                lhs = self.rule_lhs[rule]
+                if waiting[rule] == 0 and not self.nullable[lhs]:
+                    self.nullable[lhs] = True
+                    worklist.append(lhs)
+
+    def symbol_name(self, symbol: int) -> str:
+        if symbol < self.num_terminals:
+            return self.terminal_names[symbol]
+        return self.nonterminal_names[symbol - self.num_terminals]
@@ -1,2 +1,8 @@
 class ParsingException(Exception):
     pass
+
+
+class GrammarConflictError(Exception):
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__("GrammarConflictError: " + "\n".join(conflicts))
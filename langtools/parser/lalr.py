@@ -0,0 +1,321 @@
+from array import array
+from collections import deque
+from itertools import chain
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from langtools.ast.ast import ASTNode
+from langtools.lexer.token import Token
+from langtools.parser.encoding import EncodedGrammar
+from langtools.parser.exceptions import GrammarConflictError, ParsingException
+
+# action table entries: ERROR, a shift to state s is s + 1 and a reduction by
+# rule r is ~r (always negative)
+ERROR = 0
+UNKNOWN_TERMINAL = -1
+
+Item = Tuple[int, int]
+
+
+class LALRParser(EncodedGrammar):
+    """
+    LALR(1) parse tables of a CFG and the shift-reduce driver that runs them.
+    The LR(0) automaton is built first, then lookaheads are worked out once
+    per kernel item, by spontaneous generation and propagation, instead of
+    building the much larger LR(1) automaton and merging it. Sets of
+    terminals are int bitsets.
+
+    Handles left recursion, so rules like A -> A a need no rewriting.
+    Grammars that aren't LALR(1) raise GrammarConflictError listing every
+    conflict
+    """
+
+    def __init__(self, cfg):
+        super().__init__(cfg)
+        self._find_first()
+        kernels, transitions = self._build_lr0()
+        lookaheads = self._find_lookaheads(kernels, transitions)
+        self._build_tables(kernels, transitions, lookaheads)
+
+    def _find_first(self) -> None:
+        """
+        FIRST of every nonterminal, then FIRST and nullable of every rule
+        suffix rhs[dot:], which LR(1) closures look up
+        """
+        from langtools.parser.cfg import CFG
+
+        num_terminals = self.num_terminals
+        nullable = self.nullable
+        # FIRST of a nonterminal gets every terminal its rules start with, and
+        # FIRST of every nonterminal in a nullable prefix of them
+        first = [0] * self.num_nonterminals
+        first_flows: List[List[int]] = [[] for _ in range(self.num_nonterminals)]
+        for lhs, rules in enumerate(self.rules_of):
+            for rule in rules:
+                for symbol in self.rule_rhs[rule]:
+                    if symbol < num_terminals:
+                        first[lhs] |= 1 << symbol
+                        break
+                    first_flows[symbol - num_terminals].append(lhs)
+                    if not nullable[symbol - num_terminals]:
+                        break
+        CFG._propagate(first, first_flows)
+
+        # suffix_first[rule][dot] and suffix_nullable[rule][dot], for dot up to
+        # the rule's length
+        self.suffix_first: List[List[int]] = []
+        self.suffix_nullable: List[List[bool]] = []
+        for rhs in self.rule_rhs:
+            suffix_first = [0] * (len(rhs) + 1)
+            suffix_nullable = [True] * (len(rhs) + 1)
+            for dot in range(len(rhs) - 1, -1, -1):
+                symbol = rhs[dot]
+                if symbol < num_terminals:
+                    suffix_first[dot] = 1 << symbol
+                    suffix_nullable[dot] = False
+                else:
+                    suffix_first[dot] = first[symbol - num_terminals]
+                    if nullable[symbol - num_terminals]:
+                        suffix_first[dot] |= suffix_first[dot + 1]
+                    else:
+                        suffix_nullable[dot] = False
+                    suffix_nullable[dot] = (
+                        suffix_nullable[dot] and suffix_nullable[dot + 1]
+                    )
+            self.suffix_first.append(suffix_first)
+            self.suffix_nullable.append(suffix_nullable)
+
+    def _closure(self, kernel: Iterable[Item]) -> List[Item]:
+        """
+        LR(0) closure of a kernel, kernel items first
+        """
+        num_terminals = self.num_terminals
+        items = list(kernel)
+        seen = set(items)
+        for rule, dot in items:
+            rhs = self.rule_rhs[rule]
+            if dot < len(rhs) and rhs[dot] >= num_terminals:
+                for added in self.rules_of[rhs[dot] - num_terminals]:
+                    if (added, 0) not in seen:
+                        seen.add((added, 0))
+                        items.append((added, 0))
+        return items
+
+    def _closure_lr1(self, kernel: Dict[Item, int]) -> Dict[Item, int]:
+        """
+        LR(1) closure of kernel items with lookahead bitsets
+        """
+        num_terminals = self.num_terminals
+        items = dict(kernel)
+        worklist = list(items)
+        while worklist:
+            rule, dot = worklist.pop()
+            rhs = self.rule_rhs[rule]
+            if dot == len(rhs) or rhs[dot] < num_terminals:
+                continue
+            lookahead = self.suffix_first[rule][dot + 1]
+            if self.suffix_nullable[rule][dot + 1]:
+                lookahead |= items[(rule, dot)]
+            for added in self.rules_of[rhs[dot] - num_terminals]:
+                merged = items.get((added, 0), 0) | lookahead
+                if merged != items.get((added, 0)):
+                    items[(added, 0)] = merged
+                    worklist.append((added, 0))
+        return items
+
+    def _build_lr0(self) -> Tuple[List[Tuple[Item, ...]], List[Dict[int, int]]]:
+        """
+        Kernels of the LR(0) states, numbered breadth first from the start
+        state, and each state's transitions by symbol
+        """
+        start: Tuple[Item, ...] = ((self.accept_rule, 0),)
+        kernels: List[Tuple[Item, ...]] = [start]
+        state_ids: Dict[FrozenSet[Item], int] = {frozenset(start): 0}
+        transitions: List[Dict[int, int]] = []
+
+        for kernel in kernels:
+            moved: Dict[int, List[Item]] = dict()
+            for rule, dot in self._closure(kernel):
+                rhs = self.rule_rhs[rule]
+                if dot < len(rhs):
+                    moved.setdefault(rhs[dot], []).append((rule, dot + 1))
+
+            state_transitions: Dict[int, int] = dict()
+            for symbol, target in moved.items():
+                key = frozenset(target)
+                if key not in state_ids:
+                    state_ids[key] = len(kernels)
+                    kernels.append(tuple(target))
+                state_transitions[symbol] = state_ids[key]
+            transitions.append(state_transitions)
+
+        return kernels, transitions
+
+    def _find_lookaheads(
+        self, kernels: List[Tuple[Item, ...]], transitions: List[Dict[int, int]]
+    ) -> List[Dict[Item, int]]:
+        """
+        Lookahead bitset of every kernel item. Closing each kernel item alone
+        under a placeholder lookahead shows which lookaheads its successors
+        get spontaneously and which they inherit from it (the placeholder
+        survived), the inherited ones are then propagated to a fixed point
+        """
+        placeholder = 1 << self.num_terminals
+        lookaheads: List[Dict[Item, int]] = [
+            {item: 0 for item in kernel} for kernel in kernels
+        ]
+        lookaheads[0][(self.accept_rule, 0)] = 1 << self.end
+        propagates: Dict[Tuple[int, Item], List[Tuple[int, Item]]] = dict()
+
+        for state, kernel in enumerate(kernels):
+            for kernel_item in kernel:
+                closure = self._closure_lr1({kernel_item: placeholder})
+                for (rule, dot), lookahead in closure.items():
+                    rhs = self.rule_rhs[rule]
+                    if dot == len(rhs):
+                        continue
+                    target = (transitions[state][rhs[dot]], (rule, dot + 1))
+                    lookaheads[target[0]][target[1]] |= lookahead & ~placeholder
+                    if lookahead & placeholder:
+                        propagates.setdefault((state, kernel_item), []).append(target)
+
+        worklist = deque(
+            (state, item)
+            for state, kernel in enumerate(kernels)
+            for item in kernel
+            if lookaheads[state][item]
+        )
+        while worklist:
+            source = worklist.popleft()
+            bits = lookaheads[source[0]][source[1]]
+            for state, item in propagates.get(source, ()):
+                merged = lookaheads[state][item] | bits
+                if merged != lookaheads[state][item]:
+                    lookaheads[state][item] = merged
+                    worklist.append((state, item))
+
+        return lookaheads
+
+    def _build_tables(
+        self,
+        kernels: List[Tuple[Item, ...]],
+        transitions: List[Dict[int, int]],
+        lookaheads: List[Dict[Item, int]],
+    ) -> None:
+        num_terminals = self.num_terminals
+        self.num_states = len(kernels)
+        self.action = array("i", [ERROR] * (self.num_states * num_terminals))
+        self.goto = array("i", [-1] * (self.num_states * self.num_nonterminals))
+        conflicts: List[str] = []
+
+        for state, state_transitions in enumerate(transitions):
+            for symbol, target in state_transitions.items():
+                if symbol < num_terminals:
+                    self.action[state * num_terminals + symbol] = target + 1
+                else:
+                    self.goto[
+                        state * self.num_nonterminals + symbol - num_terminals
+                    ] = target
+
+            closure = self._closure_lr1(lookaheads[state])
+            for (rule, dot), lookahead in closure.items():
+                if dot != self.rule_lengths[rule]:
+                    continue
+                while lookahead:
+                    lowest = lookahead & -lookahead
+                    lookahead ^= lowest
+                    terminal = lowest.bit_length() - 1
+                    entry = state * num_terminals + terminal
+                    existing = self.action[entry]
+                    if existing == ERROR:
+                        self.action[entry] = ~rule
+                        continue
+                    if existing > 0:
+                        kind = "shift/reduce"
+                        other = f"shifting {self.terminal_names[terminal]}"
+                    else:
+                        kind = "reduce/reduce"
+                        other = f"reducing {self.rules[~existing]}"
+                    conflicts.append(
+                        f"{kind} conflict reading {self.terminal_names[terminal]}"
+                        f" after {self._describe_state(kernels[state])}: {other}"
+                        f" or reducing {self.rules[rule]}"
+                    )
+
+        if conflicts:
+            raise GrammarConflictError(conflicts)
+
+    def _describe_state(self, kernel: Tuple[Item, ...]) -> str:
+        items = []
+        for rule, dot in kernel:
+            names = [self.symbol_name(symbol) for symbol in self.rule_rhs[rule]]
+            names.insert(dot, ".")
+            items.append(
+                f"{self.nonterminal_names[self.rule_lhs[rule]]} -> {' '.join(names)}"
+            )
+        return "[" + ", ".join(items) + "]"
+
+    def parse(
+        self,
+        tokens: Iterable[Token],
+        match_hook: Optional[Callable] = None,
+        rule_hook: Optional[Callable] = None,
+    ) -> ASTNode:
+        """
+        Shift-reduce parse of tokens, see CFG.LALR_parse
+        """
+        action = self.action
+        goto = self.goto
+        num_terminals = self.num_terminals
+        num_nonterminals = self.num_nonterminals
+        terminal_ids = self.terminal_ids
+        rule_lhs = self.rule_lhs
+        rule_lengths = self.rule_lengths
+        nonterminal_names = self.nonterminal_names
+
+        states: List[int] = [0]
+        # the subtree of every symbol on the stack, lined up with states[1:]
+        nodes: List[ASTNode] = []
+
+        eof = Token(name="EOF")
+        token_iterator = chain((Token(name="BOF"),), tokens, (eof,))
+        curr_token = next(token_iterator)
+        terminal = terminal_ids.get(curr_token.name, UNKNOWN_TERMINAL)
+
+        while True:
+            entry = ERROR
+            if terminal != UNKNOWN_TERMINAL:
+                entry = action[states[-1] * num_terminals + terminal]
+
+            if entry > 0:
+                nodes.append(ASTNode(name=curr_token.name, lexme=curr_token.lexme))
+                if match_hook is not None:
+                    match_hook(self.terminal_symbols[terminal])
+                states.append(entry - 1)
+                if curr_token is eof:
+                    # only reductions are left, on the end terminal
+                    terminal = self.end
+                else:
+                    curr_token = next(token_iterator)
+                    terminal = terminal_ids.get(curr_token.name, UNKNOWN_TERMINAL)
+
+            elif entry < 0:
+                rule = ~entry
+                rule_node = ASTNode(name=nonterminal_names[rule_lhs[rule]])
+                length = rule_lengths[rule]
+                if length:
+                    rule_node.children = nodes[-length:]
+                    del nodes[-length:]
+                    del states[-length:]
+                if rule_hook is not None:
+                    rule_hook(self.rules[rule])
+                if rule == self.accept_rule:
+                    return rule_node
+                nodes.append(rule_node)
+                states.append(goto[states[-1] * num_nonterminals + rule_lhs[rule]])
+
+            elif curr_token is eof:
+                raise ParsingException("ParsingException: Expected more tokens")
+            else:
+                raise ParsingException(
+                    f"ParsingException: Unexpected token: {curr_token}"
+                )
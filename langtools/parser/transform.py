@@ -0,0 +1,354 @@
+from typing import Dict, Iterable, List, Set, Tuple, Union
+
+from langtools.ast.ast import ASTNode
+from langtools.lexer.token import Token
+
+# where each child of an original node comes from: an int is a child of the
+# transformed node, (name, shape) is an original node the transformation
+# folded away, rebuilt from its own shape
+Shape = List[Union[int, Tuple[str, list]]]
+# a right hand side, Epsilon left out, and the shape of the original node
+Alternative = Tuple[List[object], Shape]
+# substituting rules into each other to remove indirect left recursion can
+# grow the rules exponentially, past this many rules in one group of mutually
+# left recursive nonterminals it's given up on
+MAX_ALTERNATIVES = 10000
+
+
+def _symbol_key(symbol) -> Tuple[bool, object]:
+    from langtools.parser.cfg import Terminal
+
+    # terminals are matched by name, like tokens are
+    if isinstance(symbol, Terminal):
+        return (True, symbol.name)
+    return (False, symbol)
+
+
+def _substitute(alternative: Alternative, inner: Alternative, name: str) -> Alternative:
+    """
+    Replaces the first symbol of alternative, a nonterminal called name, with
+    the right hand side of inner
+    """
+    rhs, shape = alternative
+    inner_rhs, inner_shape = inner
+    shift = len(inner_rhs) - 1
+
+    def moved(item):
+        if isinstance(item, int):
+            return (name, inner_shape) if item == 0 else item + shift
+        return (item[0], [moved(child) for child in item[1]])
+
+    return inner_rhs + rhs[1:], [moved(item) for item in shape]
+
+
+class LL1Transform:
+    """
+    An equivalent grammar with left recursion removed and common prefixes
+    factored out, as CFG.to_ll1 builds it, and what's needed to give its
+    trees the original grammar's shape.
+
+    A left recursive A -> A a | b becomes A -> b A-Tail and
+    A-Tail -> a A-Tail | Epsilon, after indirect left recursion is turned
+    into direct left recursion by substituting rules into each other.
+    Alternatives sharing a prefix, A -> p x | p y, become A -> p A-Factor
+    and A-Factor -> x | y. Left recursion hidden behind nullable symbols,
+    like A -> B A c with B nullable, is left alone
+    """
+
+    def __init__(self, cfg):
+        from langtools.parser.cfg import CFG, Epsilon, NonTerminal, ProductionRule
+
+        names = {rule.lhs.name for rule in cfg.production_rules}
+        copies: Dict[object, object] = dict()
+        order: List[object] = []
+        alternatives: Dict[object, List[Alternative]] = dict()
+
+        def copy(symbol):
+            if symbol not in copies:
+                copies[symbol] = NonTerminal(symbol.name)
+                order.append(copies[symbol])
+                alternatives[copies[symbol]] = []
+            return copies[symbol]
+
+        def helper(name: str):
+            unique, count = name, 1
+            while unique in names:
+                count += 1
+                unique = f"{name}{count}"
+            names.add(unique)
+            nonterminal = NonTerminal(unique)
+            alternatives[nonterminal] = []
+            return nonterminal
+
+        copy(cfg.start_symbol)
+        for rule in cfg.production_rules:
+            if rule.lhs is cfg.start_prime:
+                continue
+            rhs = [
+                copy(symbol) if isinstance(symbol, NonTerminal) else symbol
+                for symbol in rule.rhs
+                if not isinstance(symbol, Epsilon)
+            ]
+            alternatives[copy(rule.lhs)].append((rhs, list(range(len(rhs)))))
+
+        # name of each left recursive nonterminal's tail
+        self.tails: Dict[str, str] = dict()
+        components = self._left_recursive_components(
+            order, alternatives, copies[cfg.start_symbol]
+        )
+        for component in components:
+            size = sum(len(alternatives[nonterminal]) for nonterminal in component)
+            for index, nonterminal in enumerate(component):
+                for earlier in component[:index]:
+                    # an earlier nonterminal that can't lead back here is
+                    # already settled, substituting it would only grow the
+                    # grammar
+                    if nonterminal not in self._left_reach(earlier, alternatives):
+                        continue
+                    substituted: List[Alternative] = []
+                    for alternative in alternatives[nonterminal]:
+                        if alternative[0] and alternative[0][0] is earlier:
+                            substituted.extend(
+                                _substitute(alternative, inner, earlier.name)
+                                for inner in alternatives[earlier]
+                            )
+                        else:
+                            substituted.append(alternative)
+                    size += len(substituted) - len(alternatives[nonterminal])
+                    alternatives[nonterminal] = substituted
+                    if size > MAX_ALTERNATIVES:
+                        raise Exception(
+                            f"Removing left recursion from {nonterminal.name} needs"
+                            f" more than {MAX_ALTERNATIVES} rules"
+                        )
+
+                recursive = [
+                    alternative
+                    for alternative in alternatives[nonterminal]
+                    if alternative[0] and alternative[0][0] is nonterminal
+                ]
+                if not recursive:
+                    continue
+                tail = helper(f"{nonterminal.name}-Tail")
+                order.insert(order.index(nonterminal) + 1, tail)
+                self.tails[nonterminal.name] = tail.name
+                alternatives[nonterminal] = [
+                    (rhs + [tail], shape + [len(rhs)])
+                    for rhs, shape in alternatives[nonterminal]
+                    if not rhs or rhs[0] is not nonterminal
+                ]
+                # a tail's shape numbers the tree built so far 0, then the
+                # children before the next tail. A -> A alone only adds cycles
+                alternatives[tail] = [
+                    (rhs[1:] + [tail], shape)
+                    for rhs, shape in recursive
+                    if len(rhs) > 1
+                ] + [([], [])]
+
+        # substitution can leave nonterminals unused, their rules would only
+        # add to FOLLOW sets
+        reachable = {copies[cfg.start_symbol]}
+        frontier = list(reachable)
+        while frontier:
+            for rhs, _ in alternatives[frontier.pop()]:
+                for symbol in rhs:
+                    if symbol in alternatives and symbol not in reachable:
+                        reachable.add(symbol)
+                        frontier.append(symbol)
+        order = [nonterminal for nonterminal in order if nonterminal in reachable]
+
+        # how to rebuild each node, by its name and its children's names
+        self.shapes: Dict[Tuple[str, Tuple[str, ...]], Shape] = dict()
+        for nonterminal in order:
+            unique: List[Alternative] = []
+            seen = set()
+            for rhs, shape in alternatives[nonterminal]:
+                key = (nonterminal.name, tuple(symbol.name for symbol in rhs))
+                if key in seen:
+                    continue
+                seen.add(key)
+                unique.append((rhs, shape))
+                if (
+                    shape != list(range(len(rhs)))
+                    or nonterminal.name in self.tails.values()
+                ):
+                    self.shapes.setdefault(key, shape)
+            alternatives[nonterminal] = unique
+
+        self.factors: Set[str] = set()
+        # factors are named after the nonterminal they were first split from
+        factored_from = {nonterminal: nonterminal.name for nonterminal in order}
+        worklist = list(order)
+        while worklist:
+            nonterminal = worklist.pop()
+            groups: Dict[Tuple[bool, object], List[Alternative]] = dict()
+            for alternative in alternatives[nonterminal]:
+                if alternative[0]:
+                    groups.setdefault(_symbol_key(alternative[0][0]), []).append(
+                        alternative
+                    )
+            for group in groups.values():
+                if len(group) < 2:
+                    continue
+                prefix = 1
+                while all(
+                    len(rhs) > prefix
+                    and _symbol_key(rhs[prefix]) == _symbol_key(group[0][0][prefix])
+                    for rhs, _ in group
+                ):
+                    prefix += 1
+                factor = helper(f"{factored_from[nonterminal]}-Factor")
+                factored_from[factor] = factored_from[nonterminal]
+                order.insert(order.index(nonterminal) + 1, factor)
+                self.factors.add(factor.name)
+                alternatives[factor] = [(rhs[prefix:], shape) for rhs, shape in group]
+                alternatives[nonterminal] = [
+                    alternative
+                    for alternative in alternatives[nonterminal]
+                    if not any(alternative is grouped for grouped in group)
+                ] + [(group[0][0][:prefix] + [factor], [])]
+                worklist.append(factor)
+
+        self.cfg = CFG(
+            production_rules=[
+                ProductionRule(nonterminal, rhs or [Epsilon()])
+                for nonterminal in order
+                for rhs, _ in alternatives[nonterminal]
+            ],
+            alphabet=cfg.alphabet,
+            start_symbol=copies[cfg.start_symbol],
+        )
+
+    @staticmethod
+    def _left_reach(
+        nonterminal, alternatives: Dict[object, List[Alternative]]
+    ) -> Set[object]:
+        """
+        Nonterminals that nonterminal derives in leftmost position
+        """
+        reached: Set[object] = set()
+        frontier = [nonterminal]
+        while frontier:
+            for rhs, _ in alternatives[frontier.pop()]:
+                if rhs and rhs[0] in alternatives and rhs[0] not in reached:
+                    reached.add(rhs[0])
+                    frontier.append(rhs[0])
+        return reached
+
+    @classmethod
+    def _left_recursive_components(
+        cls, order: List[object], alternatives: Dict[object, List[Alternative]], start
+    ) -> List[List[object]]:
+        """
+        Groups of nonterminals that can derive each other in leftmost
+        position, the ones that don't left derive themselves left out. In
+        each group the nonterminals used from outside it come last, so they
+        take the substitutions and the ones only used inside keep their rules
+        """
+        reaches = {
+            nonterminal: cls._left_reach(nonterminal, alternatives)
+            for nonterminal in order
+        }
+        components: List[List[object]] = []
+        placed = set()
+        for nonterminal in order:
+            if nonterminal in placed or nonterminal not in reaches[nonterminal]:
+                continue
+            component = [
+                other
+                for other in order
+                if other in reaches[nonterminal] and nonterminal in reaches[other]
+            ]
+            placed.update(component)
+            used_outside = {start}
+            for other in order:
+                if other not in component:
+                    for rhs, _ in alternatives[other]:
+                        used_outside.update(rhs)
+            component.sort(key=used_outside.__contains__)
+            components.append(component)
+        return components
+
+    def _build(self, shape: Shape, children: List[ASTNode]) -> List[ASTNode]:
+        built = []
+        for item in shape:
+            if isinstance(item, int):
+                built.append(children[item])
+            else:
+                node = ASTNode(name=item[0])
+                node.children = self._build(item[1], children)
+                self._unwind(node)
+                built.append(node)
+        return built
+
+    def _unwind(self, node: ASTNode) -> None:
+        """
+        Turns a node ending in its tail back into the left leaning nodes of
+        the left recursive rules the tail stands for
+        """
+        tail_name = self.tails.get(node.name)
+        if (
+            tail_name is None
+            or not node.children
+            or node.children[-1].name != tail_name
+        ):
+            return
+        tail = node.children.pop()
+        built = ASTNode(name=node.name)
+        built.children = node.children
+        while tail.children:
+            shape = self.shapes[
+                (tail.name, tuple(child.name for child in tail.children))
+            ]
+            left = built
+            built = ASTNode(name=node.name)
+            built.children = self._build(shape, [left, *tail.children[:-1]])
+            tail = tail.children[-1]
+        node.children = built.children
+
+    def restore(self, ast: ASTNode) -> ASTNode:
+        """
+        Reshapes a tree of the transformed grammar, in place, into the tree
+        the original grammar gives. Works without recursion, so long lists
+        are fine
+        """
+        # factors are spliced into their parents, top down
+        stack = [ast]
+        while stack:
+            node = stack.pop()
+            children: List[ASTNode] = []
+            pending = list(reversed(node.children))
+            while pending:
+                child = pending.pop()
+                if child.name in self.factors:
+                    pending.extend(reversed(child.children))
+                else:
+                    children.append(child)
+            node.children = children
+            stack.extend(children)
+
+        # then every node is rebuilt after its children
+        tails = set(self.tails.values())
+        post_order: List[ASTNode] = []
+        stack = [ast]
+        while stack:
+            node = stack.pop()
+            post_order.append(node)
+            stack.extend(node.children)
+        for node in reversed(post_order):
+            if node.name in tails:
+                continue
+            shape = self.shapes.get(
+                (node.name, tuple(child.name for child in node.children))
+            )
+            if shape is not None:
+                node.children = self._build(shape, node.children)
+            self._unwind(node)
+        return ast
+
+    def LL1_parse(self, tokens: Iterable[Token]) -> ASTNode:
+        """
+        Parses tokens with the transformed grammar and returns the tree in
+        the original grammar's shape
+        """
+        return self.restore(self.cfg.LL1_parse(tokens))
@@ -19,6 +19,7 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     python_requires=">=3.8",
+    extras_require={"numpy": ["numpy"]},
     packaged_data={"langtools": ["py.typed"]},
     zip_safe=False,
 )